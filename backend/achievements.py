@@ -0,0 +1,86 @@
+import bisect
+import threading
+
+from db_pool import get_connection
+
+class AchievementEngine:
+    # Achievement definitions are read once and indexed by requirement type as
+    # sorted threshold lists. Callers report how a counter moved (old -> new)
+    # and only thresholds crossed by that move are awarded, so the cost does
+    # not depend on how much history the user has
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.definitions = {}
+        self.thresholds = {}
+        self.loaded = False
+
+    def load(self):
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, description, icon, requirement_type, requirement_value FROM achievements")
+        rows = cursor.fetchall()
+        conn.close()
+        
+        definitions = {}
+        thresholds = {}
+        for ach_id, name, description, icon, req_type, req_value in rows:
+            definitions[ach_id] = {'id': ach_id, 'name': name, 'description': description, 'icon': icon}
+            thresholds.setdefault(req_type, []).append((req_value, ach_id))
+        for entries in thresholds.values():
+            entries.sort()
+        
+        with self.lock:
+            self.definitions = definitions
+            self.thresholds = thresholds
+            self.loaded = True
+
+    def invalidate(self):
+        self.loaded = False
+
+    def crossed(self, req_type, old, new):
+        if not self.loaded:
+            self.load()
+        entries = self.thresholds.get(req_type)
+        if not entries or new <= old:
+            return []
+        start = bisect.bisect_right(entries, (old, float('inf')))
+        stop = bisect.bisect_right(entries, (new, float('inf')))
+        return [ach_id for _, ach_id in entries[start:stop]]
+
+    def award(self, cursor, user_id, changes):
+        # changes: [(requirement_type, old_value, new_value), ...]
+        earned = []
+        for req_type, old, new in changes:
+            for ach_id in self.crossed(req_type, old, new):
+                cursor.execute(
+                    "INSERT OR IGNORE INTO user_achievements (user_id, achievement_id) VALUES (?, ?)",
+                    (user_id, ach_id)
+                )
+                if cursor.rowcount == 1:
+                    earned.append({**self.definitions[ach_id], 'user_id': user_id})
+        return earned
+
+    def award_existing(self, cursor):
+        # Grants every achievement a user already qualifies for by their current
+        # counters, for users who passed a threshold without crossing it in an
+        # update (definitions added later, history from before the engine)
+        cursor.execute("""
+            INSERT OR IGNORE INTO user_achievements (user_id, achievement_id)
+            SELECT u.id, a.id
+            FROM users u
+            LEFT JOIN user_stats us ON us.user_id = u.id
+            JOIN achievements a ON CASE a.requirement_type
+                WHEN 'rating' THEN u.rating
+                WHEN 'problems_solved' THEN COALESCE(us.correct_answers, 0)
+                WHEN 'pvp_wins' THEN COALESCE(us.pvp_wins, 0)
+                WHEN 'accuracy' THEN CASE WHEN us.total_problems > 0
+                                          THEN us.correct_answers * 100.0 / us.total_problems
+                                          ELSE 0 END
+            END >= a.requirement_value
+        """)
+        return cursor.rowcount
+
+def accuracy(correct, total):
+    return correct / total * 100 if total > 0 else 0
+
+achievement_engine = AchievementEngine()
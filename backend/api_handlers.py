@@ -1,28 +1,103 @@
+import html
 import http.server
 import json
-import sqlite3
-import mimetypes
-import os
+import re
 from urllib.parse import urlparse, parse_qs
 import csv
 import io
 from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 
-from config import DB_FILE, FRONTEND_DIR, INDEX_PATH
-from database import verify_password, hash_password
+from config import KEEPALIVE_TIMEOUT, PROBLEMS_MAX_PAGE_SIZE, STATIC_MAX_AGE, SESSION_COOKIE, SESSION_TTL
+from achievements import achievement_engine
+from database import set_problem_tags, split_tags, finish_match, record_solution, title_hash
+from db_pool import get_connection
+from leaderboard import leaderboard
+from cache import response_cache
+from http_cache import make_etag, etag_matches, choose_encoding, compress
+from static_assets import asset_store, PAGE_ASSETS
+from matchmaking import matchmaker, NO_PROBLEM_ERROR
+from problem_sampler import problem_sampler
+from match_timeouts import match_timeouts
+from solution_writer import answer_cache, solution_writer
+from problem_import import ProblemImporter, RequestBody, jsonl_records, csv_records, list_records
+from passwords import password_pool, PasswordPoolBusy
+from sessions import session_store, token_from_headers
+from data_export import EXPORTS, CONTENT_TYPES, parse_filters, fetch_batches, encode, ChunkedWriter
 
-mimetypes.init()
+# FTS5 wraps matches in these control characters; the text is HTML-escaped
+# first and only then are they turned into <mark> tags
+MARK_START, MARK_END = '\x02', '\x03'
+
+def marked_html(text):
+    if text is None:
+        return None
+    return html.escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+def load_platform_stats():
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT COUNT(*) FROM users")
+    users_count = cursor.fetchone()[0]
+    
+    cursor.execute("SELECT COUNT(*) FROM problems")
+    problems_count = cursor.fetchone()[0]
+    
+    cursor.execute("SELECT COUNT(*) FROM solutions WHERE is_correct = 1")
+    correct_solutions = cursor.fetchone()[0]
+    
+    cursor.execute("SELECT COUNT(*) FROM matches WHERE status = 'finished'")
+    matches_played = cursor.fetchone()[0]
+    
+    conn.close()
+    
+    return {
+        'success': True,
+        'stats': {
+            'users_count': users_count,
+            'problems_count': problems_count,
+            'correct_solutions': correct_solutions,
+            'matches_played': matches_played
+        }
+    }
+
+def stats_snapshot():
+    # Payload for the 'stats' WebSocket topic; shares the /api/stats cache entry
+    return {'stats': response_cache.get_or_load('/api/stats', ('stats',), load_platform_stats)['stats']}
 
 class OlympiadHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers and body go out as separate writes; with Nagle on, the body of
+    # a reused connection waits for the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+    # Extra headers (e.g. Set-Cookie) for the next send_api_response
+    pending_headers = ()
+
     def __init__(self, *args, ws_server_instance=None, **kwargs):
         self.ws_server = ws_server_instance
         super().__init__(*args, **kwargs)
+
+    def handle(self):
+        # Between keep-alive requests the server decides how long the worker
+        # may wait for the next one (see KeepAliveMixin.wait_for_request)
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.server.wait_for_request(self):
+            self.handle_one_request()
+
+    def end_headers(self):
+        if getattr(self.server, 'draining', False):
+            self.send_header('Connection', 'close')
+        super().end_headers()
     
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def do_GET(self):
@@ -30,9 +105,27 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         path = parsed_path.path
         
         if path == '/api/problems':
-            self.send_api_response(self.get_problems())
+            self.send_api_response(self.cached(('problems',), self.get_problems))
+        elif path == '/api/problems/search':
+            self.send_api_response(self.cached(('problems',), self.search_problems))
         elif path == '/api/stats':
-            self.send_api_response(self.get_platform_stats())
+            self.send_api_response(self.cached(('stats',), load_platform_stats))
+        elif path == '/api/cache/stats':
+            self.send_api_response({'success': True, 'cache': response_cache.stats()})
+        elif path == '/api/auth/stats':
+            self.send_api_response({
+                'success': True,
+                'passwords': password_pool.stats(),
+                'sessions': session_store.stats()
+            })
+        elif path == '/api/ws/stats':
+            ws_stats = self.ws_server.stats() if self.ws_server else None
+            self.send_api_response({
+                'success': True,
+                'websocket': ws_stats,
+                'matches': match_timeouts.stats(),
+                'solution_writer': solution_writer.stats()
+            })
         elif path == '/api/users':
             self.send_api_response(self.get_users())
         elif path.startswith('/api/user/'):
@@ -41,28 +134,40 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         elif path.startswith('/api/problem/'):
             try:
                 problem_id = int(path.split('/')[-1])
-                self.send_api_response(self.get_problem(problem_id))
+                self.send_api_response(self.cached(('problems',), lambda: self.get_problem(problem_id)))
             except:
                 self.send_error(404)
         elif path == '/api/leaderboard':
-            self.send_api_response(self.get_leaderboard())
+            self.send_api_response(self.cached(('leaderboard',), self.get_leaderboard))
+        elif path.startswith('/api/leaderboard/rank/'):
+            user_id = path.split('/')[-1]
+            self.send_api_response(self.get_leaderboard_rank(user_id))
         elif path == '/api/matches':
             self.send_api_response(self.get_active_matches())
+        elif path == '/api/match/queue':
+            self.send_api_response(self.get_queue_status())
         elif path.startswith('/api/match/'):
             match_id = path.split('/')[-1]
             self.send_api_response(self.get_match_details(match_id))
         elif path == '/api/achievements':
-            self.send_api_response(self.get_achievements())
+            self.send_api_response(self.cached(('achievements',), self.get_achievements))
         elif path.startswith('/api/user_achievements/'):
             user_id = path.split('/')[-1]
             self.send_api_response(self.get_user_achievements(user_id))
-        elif path == '/api/export/problems':
-            self.export_problems()
+        elif path.startswith('/api/export/'):
+            self.export_data(path.split('/')[-1])
+        elif path == '/bundle':
+            self.send_api_response(self.get_bundle())
         else:
             self.serve_static_file(path)
     
     def do_POST(self):
-        content_length = int(self.headers['Content-Length'])
+        # Streaming uploads read rfile themselves instead of buffering the body
+        if urlparse(self.path).path == '/api/admin/import_problems/stream':
+            self.send_api_response(self.stream_import_problems())
+            return
+        
+        content_length = int(self.headers.get('Content-Length', 0))
         post_data = self.rfile.read(content_length).decode('utf-8')
         
         try:
@@ -81,6 +186,8 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             response = self.register_user(data)
         elif path == '/api/login':
             response = self.login_user(data)
+        elif path == '/api/logout':
+            response = self.logout_user()
         elif path == '/api/solve':
             response = self.submit_solution(data)
         elif path == '/api/match/create':
@@ -89,6 +196,10 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             response = self.join_match(data)
         elif path == '/api/match/submit':
             response = self.submit_match_answer(data)
+        elif path == '/api/match/queue':
+            response = self.join_queue(data)
+        elif path == '/api/match/queue/leave':
+            response = self.leave_queue(data)
         elif path == '/api/admin/add_problem':
             response = self.add_problem(data)
         elif path == '/api/admin/edit_problem':
@@ -108,44 +219,181 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         
         self.send_api_response(response)
     
+    def cached(self, tags, loader):
+        return response_cache.get_or_load(self.path, tags, loader)
+    
+    def publish(self, topic, message):
+        if self.ws_server:
+            self.ws_server.publish(topic, message)
+    
+    def publish_stats(self):
+        if self.ws_server:
+            self.ws_server.mark_dirty('stats')
+    
+    def publish_ratings(self, *user_ids):
+        users = []
+        for user_id in user_ids:
+            position = leaderboard.rank_of(int(user_id), 0)
+            if position:
+                users.append(position['user'])
+        if users:
+            self.publish('leaderboard', {'event': 'rating_changed', 'users': users})
+    
     def get_problems(self):
         query_params = parse_qs(urlparse(self.path).query)
         category = query_params.get('category', [None])[0]
         difficulty = query_params.get('difficulty', [None])[0]
+        tags = split_tags(query_params.get('tag', []))
+        after_id = query_params.get('after_id', [None])[0]
+        limit = query_params.get('limit', [None])[0]
+        summary = query_params.get('view', [''])[0] == 'summary'
         
-        conn = sqlite3.connect(DB_FILE)
+        try:
+            difficulty = int(difficulty) if difficulty else None
+            after_id = int(after_id) if after_id else None
+            limit = min(max(int(limit), 1), PROBLEMS_MAX_PAGE_SIZE) if limit else None
+        except ValueError:
+            return {'success': False, 'error': 'Invalid query parameters'}
+        
+        conn = get_connection()
         cursor = conn.cursor()
         
-        query = "SELECT id, title, description, difficulty, category, tags FROM problems WHERE 1=1"
+        where = ""
         params = []
         
         if category:
-            query += " AND category = ?"
+            where += " AND category = ?"
             params.append(category)
         if difficulty:
-            query += " AND difficulty = ?"
-            params.append(int(difficulty))
+            where += " AND difficulty = ?"
+            params.append(difficulty)
+        for tag in tags:
+            where += """ AND id IN (
+                SELECT pt.problem_id FROM problem_tags pt
+                JOIN tags t ON t.id = pt.tag_id
+                WHERE t.name = ?)"""
+            params.append(tag)
+        
+        # Totals per filter combination share the response cache's LRU, and
+        # every problem write drops them with the 'problems' tag
+        def count_problems():
+            cursor.execute("SELECT COUNT(*) FROM problems WHERE 1=1" + where, params)
+            return cursor.fetchone()[0]
+        
+        count_key = ('problem_count', category, difficulty, tuple(sorted(tags)))
+        total = response_cache.get_or_load(count_key, ('problems',), count_problems)
+        
+        columns = "id, title, difficulty, category, tags" if summary else "id, title, difficulty, category, tags, description"
+        query = f"SELECT {columns} FROM problems WHERE 1=1" + where
+        page_params = list(params)
+        
+        # Keyset pagination over the (difficulty, id) listing order
+        if after_id is not None:
+            cursor.execute("SELECT difficulty FROM problems WHERE id = ?", (after_id,))
+            row = cursor.fetchone()
+            after_difficulty = query_params.get('after_difficulty', [None])[0]
+            if row:
+                after_difficulty = row[0]
+            try:
+                after_difficulty = int(after_difficulty) if after_difficulty is not None else 0
+            except ValueError:
+                after_difficulty = 0
+            query += " AND (difficulty, id) > (?, ?)"
+            page_params.extend([after_difficulty, after_id])
         
         query += " ORDER BY difficulty, id"
-        cursor.execute(query, params)
+        if limit:
+            query += " LIMIT ?"
+            page_params.append(limit + 1)
+        cursor.execute(query, page_params)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        has_more = limit is not None and len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
         
         problems = []
-        for row in cursor.fetchall():
+        for row in rows:
+            problem = {
+                'id': row[0],
+                'title': row[1],
+                'difficulty': row[2],
+                'difficulty_text': ['Легкая', 'Средняя', 'Сложная'][row[2]-1] if row[2] in [1,2,3] else 'Неизвестно',
+                'category': row[3],
+                'tags': row[4].split(',') if row[4] else []
+            }
+            if not summary:
+                problem['description'] = row[5]
+            problems.append(problem)
+        
+        return {
+            'success': True,
+            'problems': problems,
+            'total': total,
+            'next_after_id': rows[-1][0] if has_more else None,
+            'next_after_difficulty': rows[-1][2] if has_more else None
+        }
+    
+    def search_problems(self):
+        query_params = parse_qs(urlparse(self.path).query)
+        q = query_params.get('q', [''])[0].strip()
+        
+        try:
+            limit = min(max(int(query_params.get('limit', [20])[0]), 1), PROBLEMS_MAX_PAGE_SIZE)
+            offset = max(int(query_params.get('offset', [0])[0]), 0)
+        except ValueError:
+            return {'success': False, 'error': 'Invalid query parameters'}
+        
+        # Quote every word so user input never reaches the FTS5 query syntax;
+        # the last word is matched as a prefix for search-as-you-type
+        words = re.findall(r'\w+', q)
+        if not words:
+            return {'success': True, 'problems': [], 'next_offset': None}
+        match = ' '.join(f'"{w}"' for w in words)
+        if len(words[-1]) >= 2:
+            match += '*'
+        
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT p.id, p.title, p.difficulty, p.category, p.tags,
+                   highlight(problems_fts, 0, ?, ?),
+                   snippet(problems_fts, 1, ?, ?, '…', 12),
+                   rank
+            FROM problems_fts
+            JOIN problems p ON p.id = problems_fts.rowid
+            WHERE problems_fts MATCH ?
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        """, (MARK_START, MARK_END, MARK_START, MARK_END, match, limit + 1, offset))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        has_more = len(rows) > limit
+        problems = []
+        for row in rows[:limit]:
             problems.append({
                 'id': row[0],
                 'title': row[1],
-                'description': row[2],
-                'difficulty': row[3],
-                'difficulty_text': ['Легкая', 'Средняя', 'Сложная'][row[3]-1] if row[3] in [1,2,3] else 'Неизвестно',
-                'category': row[4],
-                'tags': row[5].split(',') if row[5] else []
+                'difficulty': row[2],
+                'difficulty_text': ['Легкая', 'Средняя', 'Сложная'][row[2]-1] if row[2] in [1,2,3] else 'Неизвестно',
+                'category': row[3],
+                'tags': row[4].split(',') if row[4] else [],
+                'title_highlight': marked_html(row[5]),
+                'snippet': marked_html(row[6]),
+                'score': round(row[7], 4)
             })
         
-        conn.close()
-        return {'success': True, 'problems': problems}
+        return {
+            'success': True,
+            'problems': problems,
+            'next_offset': offset + limit if has_more else None
+        }
     
     def get_problem(self, problem_id):
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -173,41 +421,13 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             }
         }
     
-    def get_platform_stats(self):
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM users")
-        users_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM problems")
-        problems_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM solutions WHERE is_correct = 1")
-        correct_solutions = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM matches WHERE status = 'finished'")
-        matches_played = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        return {
-            'success': True,
-            'stats': {
-                'users_count': users_count,
-                'problems_count': problems_count,
-                'correct_solutions': correct_solutions,
-                'matches_played': matches_played
-            }
-        }
-    
     def get_user_stats(self, user_id):
         try:
             user_id = int(user_id)
         except:
             return {'success': False, 'error': 'Invalid user ID'}
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT username, rating, role, total_xp, level FROM users WHERE id = ?", (user_id,))
@@ -252,12 +472,13 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
                 'accuracy': round((row[2]/row[1]*100), 2) if row[1] > 0 else 0
             })
         
+        # Unary + keeps the planner on the player1/player2 indexes instead of the low-selectivity status index
         cursor.execute("""
             SELECT 
                 COUNT(*) as total_matches,
                 SUM(CASE WHEN winner_id = ? THEN 1 ELSE 0 END) as wins
             FROM matches
-            WHERE (player1_id = ? OR player2_id = ?) AND status = 'finished'
+            WHERE (player1_id = ? OR player2_id = ?) AND +status = 'finished'
         """, (user_id, user_id, user_id))
         
         pvp_stats = cursor.fetchone()
@@ -289,42 +510,25 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         }
     
     def get_leaderboard(self):
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        return {'success': True, 'leaderboard': leaderboard.top(50)}
+    
+    def get_leaderboard_rank(self, user_id):
+        try:
+            user_id = int(user_id)
+        except:
+            return {'success': False, 'error': 'Invalid user ID'}
         
-        cursor.execute("""
-            SELECT u.id, u.username, u.rating, u.level,
-                   COUNT(s.id) as solved,
-                   SUM(CASE WHEN s.is_correct THEN 1 ELSE 0 END) as correct
-            FROM users u
-            LEFT JOIN solutions s ON u.id = s.user_id
-            GROUP BY u.id
-            ORDER BY u.rating DESC
-            LIMIT 50
-        """
-        )
+        query_params = parse_qs(urlparse(self.path).query)
+        try:
+            around = min(max(int(query_params.get('around', [2])[0]), 0), 25)
+        except ValueError:
+            around = 2
         
-        leaderboard = []
-        rank = 1
-        for row in cursor.fetchall():
-            total = row[4] or 0
-            correct = row[5] or 0
-            accuracy = round((correct/total*100), 2) if total > 0 else 0
-            
-            leaderboard.append({
-                'rank': rank,
-                'id': row[0],
-                'username': row[1],
-                'rating': row[2],
-                'level': row[3],
-                'solved': total,
-                'correct': correct,
-                'accuracy': accuracy
-            })
-            rank += 1
+        position = leaderboard.rank_of(user_id, around)
+        if not position:
+            return {'success': False, 'error': 'User not found'}
         
-        conn.close()
-        return {'success': True, 'leaderboard': leaderboard}
+        return {'success': True, **position}
     
     def register_user(self, data):
         username = data.get('username', '').strip()
@@ -337,7 +541,13 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         if len(password) < 6:
             return {'success': False, 'error': 'Пароль должен содержать минимум 6 символов'}
         
-        conn = sqlite3.connect(DB_FILE)
+        # Hash before taking a pooled connection so slow hashing never holds one
+        try:
+            hashed_password = password_pool.hash(password)
+        except PasswordPoolBusy:
+            return {'success': False, 'error': 'Сервер перегружен, попробуйте позже'}
+        
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
@@ -351,7 +561,6 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
                 conn.close()
                 return {'success': False, 'error': 'Пользователь с таким email уже существует'}
         
-        hashed_password = hash_password(password)
         cursor.execute(
             "INSERT INTO users (username, email, password, role) VALUES (?, ?, ?, 'user')",
             (username, email if email else None, hashed_password)
@@ -369,7 +578,11 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         cursor.execute("SELECT id, username, rating, role FROM users WHERE id = ?", (user_id,))
         user = cursor.fetchone()
         
+        leaderboard.refresh_user(cursor, user_id)
         conn.close()
+        response_cache.invalidate('stats', 'leaderboard')
+        self.publish_ratings(user_id)
+        self.publish_stats()
         
         return {
             'success': True,
@@ -386,7 +599,7 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         username = data.get('username', '').strip()
         password = data.get('password', '').strip()
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -394,25 +607,41 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             (username,)
         )
         user = cursor.fetchone()
+        conn.close()
         
         if not user:
-            conn.close()
             return {'success': False, 'error': 'Пользователь не найден'}
         
-        if not verify_password(password, user[2]):
-            conn.close()
-            return {'success': False, 'error': 'Неверный пароль'}
+        try:
+            if not password_pool.verify(password, user[2]):
+                return {'success': False, 'error': 'Неверный пароль'}
+            new_hash = password_pool.upgrade(password, user[2])
+        except PasswordPoolBusy:
+            return {'success': False, 'error': 'Сервер перегружен, попробуйте позже'}
+        
+        conn = get_connection()
+        cursor = conn.cursor()
         
         cursor.execute(
             "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?",
             (user[0],)
         )
+        token = session_store.create(cursor, user[0], user[1], user[4])
+        if new_hash:
+            # Skipped if the password was changed while we were hashing
+            cursor.execute(
+                "UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                (new_hash, user[0], user[2])
+            )
         conn.commit()
         
         conn.close()
         
+        self.pending_headers = [('Set-Cookie', f'{SESSION_COOKIE}={token}; Path=/; Max-Age={SESSION_TTL}; '
+                                               'HttpOnly; SameSite=Strict')]
         return {
             'success': True,
+            'token': token,
             'user': {
                 'id': user[0],
                 'username': user[1],
@@ -421,6 +650,17 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             }
         }
     
+    def logout_user(self):
+        session = self.session()
+        if session:
+            session_store.revoke(session.session_id)
+        self.pending_headers = [('Set-Cookie', f'{SESSION_COOKIE}=; Path=/; Max-Age=0; HttpOnly; SameSite=Strict')]
+        return {'success': True}
+    
+    def session(self):
+        # Identity and role for this request, from the session token
+        return session_store.resolve(token_from_headers(self.headers))
+    
     def submit_solution(self, data):
         user_id = data.get('user_id')
         problem_id = data.get('problem_id')
@@ -433,69 +673,32 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         except:
             return {'success': False, 'error': 'Invalid IDs'}
         
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT answer, difficulty FROM problems WHERE id = ?", (problem_id,))
-        problem = cursor.fetchone()
+        problem = answer_cache.get(problem_id)
         
         if not problem:
-            conn.close()
             return {'success': False, 'error': 'Задача не найдена'}
         
-        correct_answer = str(problem[0]).strip().lower()
+        correct_answer, difficulty = problem
         user_answer = answer.strip().lower()
-        difficulty = problem[1]
         
         is_correct = user_answer == correct_answer
+        xp_gained = difficulty * 50 if is_correct else 0
         
-        cursor.execute(
-            """INSERT INTO solutions (user_id, problem_id, answer, is_correct, time_spent) 
-               VALUES (?, ?, ?, ?, ?)""",
-            (user_id, problem_id, answer, is_correct, time_spent)
-        )
-        
-        xp_gained = 0
-        if is_correct:
-            rating_change = difficulty * 10
-            xp_gained = difficulty * 50
-            
-            cursor.execute(
-                "UPDATE users SET rating = rating + ?, total_xp = total_xp + ? WHERE id = ?",
-                (rating_change, xp_gained, user_id)
-            )
-            
-            cursor.execute("SELECT total_xp, level FROM users WHERE id = ?", (user_id,))
-            user_data = cursor.fetchone()
-            current_xp = user_data[0]
-            current_level = user_data[1]
-            new_level = 1 + (current_xp // 1000)
-            
-            if new_level > current_level:
-                cursor.execute("UPDATE users SET level = ? WHERE id = ?", (new_level, user_id))
-            
-            cursor.execute("""
-                UPDATE user_stats 
-                SET total_problems = total_problems + 1,
-                    solved_problems = solved_problems + 1,
-                    correct_answers = correct_answers + 1,
-                    total_time_spent = total_time_spent + ?,
-                    avg_time_per_problem = (total_time_spent + ?) / (total_problems + 1)
-                WHERE user_id = ?
-            """, (time_spent, time_spent, user_id))
-            
-            self.check_achievements(cursor, user_id)
+        if solution_writer.enabled:
+            if not solution_writer.submit(user_id, problem_id, answer, is_correct, time_spent, difficulty):
+                return {'success': False, 'error': 'Не удалось сохранить решение'}
         else:
-            cursor.execute("""
-                UPDATE user_stats 
-                SET total_problems = total_problems + 1,
-                    total_time_spent = total_time_spent + ?,
-                    avg_time_per_problem = (total_time_spent + ?) / (total_problems + 1)
-                WHERE user_id = ?
-            """, (time_spent, time_spent, user_id))
-        
-        conn.commit()
-        conn.close()
+            conn = get_connection()
+            cursor = conn.cursor()
+            earned = record_solution(cursor, user_id, problem_id, answer, is_correct, time_spent, difficulty)
+            conn.commit()
+            leaderboard.refresh_user(cursor, user_id)
+            conn.close()
+            response_cache.invalidate('stats', 'leaderboard')
+            self.publish_ratings(user_id)
+            self.publish_stats()
+            if earned and self.ws_server:
+                self.ws_server.send_achievements(earned)
         
         return {
             'success': True,
@@ -505,53 +708,8 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             'xp_gained': xp_gained
         }
     
-    def check_achievements(self, cursor, user_id):
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as correct
-            FROM solutions WHERE user_id = ?
-        """, (user_id,))
-        stats = cursor.fetchone()
-        total = stats[0] or 0
-        correct = stats[1] or 0
-        accuracy = (correct / total * 100) if total > 0 else 0
-        
-        cursor.execute("SELECT rating FROM users WHERE id = ?", (user_id,))
-        rating = cursor.fetchone()[0]
-        
-        cursor.execute("""
-            SELECT COUNT(*) FROM matches 
-            WHERE winner_id = ? AND status = 'finished'
-        """, (user_id,))
-        pvp_wins = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT id, requirement_type, requirement_value FROM achievements")
-        achievements = cursor.fetchall()
-        
-        for ach_id, req_type, req_value in achievements:
-            should_unlock = False
-            
-            if req_type == 'problems_solved' and correct >= req_value:
-                should_unlock = True
-            elif req_type == 'accuracy' and accuracy >= req_value:
-                should_unlock = True
-            elif req_type == 'rating' and rating >= req_value:
-                should_unlock = True
-            elif req_type == 'pvp_wins' and pvp_wins >= req_value:
-                should_unlock = True
-            
-            if should_unlock:
-                try:
-                    cursor.execute("""
-                        INSERT INTO user_achievements (user_id, achievement_id) 
-                        VALUES (?, ?)
-                    """, (user_id, ach_id))
-                except sqlite3.IntegrityError:
-                    pass
-    
     def get_achievements(self):
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -580,7 +738,7 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         except:
             return {'success': False, 'error': 'Invalid user ID'}
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -605,7 +763,7 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         return {'success': True, 'achievements': achievements}
     
     def get_users(self):
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -640,18 +798,14 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         return {'success': True, 'users': users}
     
     def add_problem(self, data):
-        user_id = data.get('user_id')
+        session = self.session()
         
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT role FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or user[0] != 'admin':
-            conn.close()
+        if not session or not session.is_admin:
             return {'success': False, 'error': 'Доступ запрещен'}
         
+        conn = get_connection()
+        cursor = conn.cursor()
+        
         title = data.get('title', '').strip()
         description = data.get('description', '').strip()
         answer = data.get('answer', '').strip()
@@ -671,76 +825,86 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             difficulty = 1
         
         cursor.execute(
-            """INSERT INTO problems (title, description, answer, difficulty, category, tags, created_by) 
-               VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (title, description, answer, difficulty, category, tags, user_id)
+            """INSERT INTO problems (title, description, answer, difficulty, category, tags, title_hash, created_by) 
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (title, description, answer, difficulty, category, tags, title_hash(title), session.user_id)
         )
+        problem_id = cursor.lastrowid
+        set_problem_tags(cursor, problem_id, tags)
         
         conn.commit()
         conn.close()
+        problem_sampler.put(problem_id, category, difficulty)
+        response_cache.invalidate('problems', 'stats')
+        self.publish_stats()
         
         return {'success': True, 'message': 'Задача успешно добавлена'}
     
     def edit_problem(self, data):
-        user_id = data.get('user_id')
-        problem_id = data.get('problem_id')
+        session = self.session()
         
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        if not session or not session.is_admin:
+            return {'success': False, 'error': 'Доступ запрещен'}
         
-        cursor.execute("SELECT role FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
+        try:
+            problem_id = int(data.get('problem_id'))
+        except:
+            return {'success': False, 'error': 'Invalid problem ID'}
         
-        if not user or user[0] != 'admin':
-            conn.close()
-            return {'success': False, 'error': 'Доступ запрещен'}
+        conn = get_connection()
+        cursor = conn.cursor()
         
         cursor.execute(
             """UPDATE problems 
-               SET title = ?, description = ?, answer = ?, difficulty = ?, category = ?, tags = ?
+               SET title = ?, description = ?, answer = ?, difficulty = ?, category = ?, tags = ?, title_hash = ?
                WHERE id = ?""",
             (data.get('title'), data.get('description'), data.get('answer'),
-             data.get('difficulty'), data.get('category'), data.get('tags'), problem_id)
+             data.get('difficulty'), data.get('category'), data.get('tags'), title_hash(data.get('title')), problem_id)
         )
+        updated = cursor.rowcount
+        set_problem_tags(cursor, problem_id, data.get('tags'))
         
         conn.commit()
         conn.close()
+        answer_cache.invalidate(problem_id)
+        if updated:
+            problem_sampler.put(problem_id, data.get('category'), data.get('difficulty'))
+        response_cache.invalidate('problems', 'stats')
+        self.publish_stats()
         
         return {'success': True, 'message': 'Задача обновлена'}
     
     def delete_problem(self, data):
-        user_id = data.get('user_id')
-        problem_id = data.get('problem_id')
+        session = self.session()
         
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        if not session or not session.is_admin:
+            return {'success': False, 'error': 'Доступ запрещен'}
         
-        cursor.execute("SELECT role FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
+        try:
+            problem_id = int(data.get('problem_id'))
+        except:
+            return {'success': False, 'error': 'Invalid problem ID'}
         
-        if not user or user[0] != 'admin':
-            conn.close()
-            return {'success': False, 'error': 'Доступ запрещен'}
+        conn = get_connection()
+        cursor = conn.cursor()
         
         cursor.execute("DELETE FROM solutions WHERE problem_id = ?", (problem_id,))
+        cursor.execute("DELETE FROM problem_tags WHERE problem_id = ?", (problem_id,))
         cursor.execute("DELETE FROM problems WHERE id = ?", (problem_id,))
         
         conn.commit()
         conn.close()
+        problem_sampler.discard(problem_id)
+        answer_cache.invalidate(problem_id)
+        response_cache.invalidate('problems', 'stats')
+        self.publish_stats()
         
         return {'success': True, 'message': 'Задача удалена'}
     
     def admin_add_user(self, data):
-        user_id = data.get('admin_id')
-        
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT role FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
+        session = self.session()
         
-        if not user or user[0] != 'admin':
-            conn.close()
+        if not session or not session.is_admin:
             return {'success': False, 'error': 'Доступ запрещен'}
         
         username = data.get('username', '').strip()
@@ -749,15 +913,22 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         role = data.get('role', 'user').strip()
         
         if not username or not password:
-            conn.close()
             return {'success': False, 'error': 'Заполните имя пользователя и пароль'}
         
+        # Hash before taking a pooled connection so slow hashing never holds one
+        try:
+            hashed_password = password_pool.hash(password)
+        except PasswordPoolBusy:
+            return {'success': False, 'error': 'Сервер перегружен, попробуйте позже'}
+        
+        conn = get_connection()
+        cursor = conn.cursor()
+        
         cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
         if cursor.fetchone():
             conn.close()
             return {'success': False, 'error': 'Пользователь уже существует'}
         
-        hashed_password = hash_password(password)
         cursor.execute(
             "INSERT INTO users (username, email, password, role) VALUES (?, ?, ?, ?)",
             (username, email if email else None, hashed_password, role)
@@ -771,23 +942,23 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         )
         
         conn.commit()
+        leaderboard.refresh_user(cursor, new_user_id)
         conn.close()
+        response_cache.invalidate('stats', 'leaderboard')
+        self.publish_ratings(new_user_id)
+        self.publish_stats()
         
         return {'success': True, 'message': f'Пользователь {username} создан'}
     
     def admin_update_user(self, data):
-        user_id = data.get('admin_id')
-        
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT role FROM users WHERE id = ?", (user_id,))
-        admin = cursor.fetchone()
+        session = self.session()
         
-        if not admin or admin[0] != 'admin':
-            conn.close()
+        if not session or not session.is_admin:
             return {'success': False, 'error': 'Доступ запрещен'}
         
+        conn = get_connection()
+        cursor = conn.cursor()
+        
         target_id = data.get('user_id')
         new_role = data.get('role', '').strip()
         new_rating = data.get('rating')
@@ -796,7 +967,7 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             conn.close()
             return {'success': False, 'error': 'Укажите ID пользователя'}
         
-        cursor.execute("SELECT username FROM users WHERE id = ?", (target_id,))
+        cursor.execute("SELECT username, role, rating FROM users WHERE id = ?", (target_id,))
         target_user = cursor.fetchone()
         
         if not target_user:
@@ -805,6 +976,7 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         
         updates = []
         params = []
+        earned = []
         
         if new_role and new_role in ['admin', 'user']:
             updates.append("role = ?")
@@ -822,30 +994,37 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             params.append(target_id)
             query = f"UPDATE users SET {', '.join(updates)} WHERE id = ?"
             cursor.execute(query, params)
+            if 'rating = ?' in updates:
+                earned = achievement_engine.award(cursor, int(target_id), [('rating', target_user[2], rating)])
             conn.commit()
+            leaderboard.refresh_user(cursor, target_id)
+            response_cache.invalidate('leaderboard')
+            self.publish_ratings(target_id)
+            if earned and self.ws_server:
+                self.ws_server.send_achievements(earned)
         
         conn.close()
+        # Sessions cache the role, so a promoted or demoted user signs in again
+        if new_role in ('admin', 'user') and new_role != target_user[1]:
+            session_store.revoke_user(int(target_id))
         return {'success': True, 'message': 'Данные пользователя обновлены'}
     
     def admin_delete_user(self, data):
-        user_id = data.get('admin_id')
         target_id = data.get('user_id')
         
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT role FROM users WHERE id = ?", (user_id,))
-        admin = cursor.fetchone()
+        session = self.session()
         
-        if not admin or admin[0] != 'admin':
-            conn.close()
+        if not session or not session.is_admin:
             return {'success': False, 'error': 'Доступ запрещен'}
         
+        conn = get_connection()
+        cursor = conn.cursor()
+        
         if not target_id:
             conn.close()
             return {'success': False, 'error': 'Укажите ID пользователя'}
         
-        if user_id == target_id:
+        if str(session.user_id) == str(target_id):
             conn.close()
             return {'success': False, 'error': 'Нельзя удалить самого себя'}
         
@@ -863,12 +1042,17 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         cursor.execute("DELETE FROM users WHERE id = ?", (target_id,))
         
         conn.commit()
+        leaderboard.remove_user(int(target_id))
         conn.close()
+        session_store.revoke_user(int(target_id))
+        response_cache.invalidate('stats', 'leaderboard')
+        self.publish('leaderboard', {'event': 'user_removed', 'user_id': int(target_id)})
+        self.publish_stats()
         
         return {'success': True, 'message': f'Пользователь {target_user[0]} удален'}
     
     def get_active_matches(self):
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -906,7 +1090,7 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         except:
             return {'success': False, 'error': 'Invalid match ID'}
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -954,18 +1138,15 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
     def create_match(self, data):
         user_id = data.get('user_id')
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT id FROM problems ORDER BY RANDOM() LIMIT 1")
-        problem = cursor.fetchone()
+        problem_id = problem_sampler.sample_for_players(cursor, [user_id])
         
-        if not problem:
+        if problem_id is None:
             conn.close()
             return {'success': False, 'error': 'Нет доступных задач'}
         
-        problem_id = problem[0]
-        
         cursor.execute(
             """INSERT INTO matches (player1_id, problem_id, status) 
                VALUES (?, ?, 'waiting')""",
@@ -975,7 +1156,27 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         match_id = cursor.lastrowid
         
         conn.commit()
+        
+        cursor.execute("""
+            SELECT m.started_at, u.username, p.title
+            FROM matches m
+            JOIN users u ON m.player1_id = u.id
+            LEFT JOIN problems p ON m.problem_id = p.id
+            WHERE m.id = ?
+        """, (match_id,))
+        row = cursor.fetchone()
         conn.close()
+        match_timeouts.waiting(match_id)
+        
+        if row:
+            self.publish('lobby', {'event': 'match_created', 'match': {
+                'id': match_id,
+                'status': 'waiting',
+                'started_at': row[0],
+                'player1': row[1],
+                'player2': 'Ожидание...',
+                'problem': row[2] or 'Не выбрана'
+            }})
         
         return {
             'success': True,
@@ -983,11 +1184,49 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             'message': 'Матч создан. Ожидаем второго игрока...'
         }
     
+    def join_queue(self, data):
+        try:
+            user_id = int(data.get('user_id'))
+        except:
+            return {'success': False, 'error': 'Invalid user ID'}
+        
+        rating = leaderboard.rating_of(user_id)
+        if rating is None:
+            return {'success': False, 'error': 'User not found'}
+        
+        pair = matchmaker.enqueue(user_id, rating)
+        if pair:
+            match_id = matchmaker.create_match(*pair)
+            if match_id is None:
+                # The waiting opponent was taken off the queue too
+                matchmaker.pairing_failed(pair[0])
+                return {'success': False, 'error': NO_PROBLEM_ERROR}
+            return {'success': True, 'matched': True, 'match_id': match_id, 'message': 'Соперник найден!'}
+        
+        return {'success': True, 'matched': False, 'message': 'Поиск соперника...'}
+    
+    def leave_queue(self, data):
+        try:
+            user_id = int(data.get('user_id'))
+        except:
+            return {'success': False, 'error': 'Invalid user ID'}
+        
+        return {'success': True, 'removed': matchmaker.cancel(user_id)}
+    
+    def get_queue_status(self):
+        query_params = parse_qs(urlparse(self.path).query)
+        try:
+            user_id = int(query_params.get('user_id', [None])[0])
+        except:
+            return {'success': False, 'error': 'Invalid user ID'}
+        
+        return {'success': True, **matchmaker.status(user_id), 'queue': matchmaker.stats()}
+    
     def join_match(self, data):
         user_id = data.get('user_id')
         match_id = data.get('match_id')
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT player1_id, status FROM matches WHERE id = ?", (match_id,))
@@ -1006,11 +1245,17 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             return {'success': False, 'error': 'Нельзя присоединиться к своему матчу'}
         
         cursor.execute(
-            "UPDATE matches SET player2_id = ?, status = 'active', started_at = CURRENT_TIMESTAMP WHERE id = ?",
+            "UPDATE matches SET player2_id = ?, status = 'active', started_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'waiting'",
             (user_id, match_id)
         )
         
+        # Someone else joined, or the match expired, since the status check
+        if cursor.rowcount != 1:
+            conn.close()
+            return {'success': False, 'error': 'Матч уже начат или завершен'}
+        
         conn.commit()
+        match_timeouts.started(match_id)
 
         cursor.execute("""
             SELECT m.id, m.status, m.problem_id, m.player1_id, m.player2_id,
@@ -1041,6 +1286,7 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
                 }
             }
             self.ws_server.broadcast_to_match(match_id, match_data)
+            self.publish('lobby', {'event': 'match_joined', 'match_id': updated_match[0], 'player2': updated_match[10]})
         
         conn.close()
         
@@ -1052,9 +1298,13 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         answer = data.get('answer', '').strip()
         time_spent = data.get('time_spent', 0)
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         cursor = conn.cursor()
         
+        # The whole read-check-write-finish sequence runs under one write lock,
+        # so two near-simultaneous answers are serialised: exactly one of them
+        # sees both answers present and finishes the match
+        cursor.execute("BEGIN IMMEDIATE")
         cursor.execute("""
             SELECT player1_id, player2_id, problem_id, status, 
                    player1_answer, player2_answer, player1_time, player2_time
@@ -1078,13 +1328,6 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
             return {'success': False, 'error': 'Вы не участник этого матча'}
         
         is_player1 = user_id == player1_id
-
-        if is_player1 and p1_answer is not None:
-            conn.close()
-            return {'success': False, 'error': 'Вы уже ответили на вопрос.'}
-        if not is_player1 and p2_answer is not None:
-            conn.close()
-            return {'success': False, 'error': 'Вы уже ответили на вопрос.'}
         
         answer_field = 'player1_answer' if is_player1 else 'player2_answer'
         time_field = 'player1_time' if is_player1 else 'player2_time'
@@ -1092,192 +1335,293 @@ class OlympiadHandler(http.server.BaseHTTPRequestHandler):
         cursor.execute(f"""
             UPDATE matches 
             SET {answer_field} = ?, {time_field} = ?
-            WHERE id = ?
+            WHERE id = ? AND status = 'active' AND {answer_field} IS NULL
         """, (answer, time_spent, match_id))
         
-        conn.commit()
-
-        cursor.execute("""
-            SELECT player1_answer, player2_answer, player1_time, player2_time
-            FROM matches WHERE id = ?
-        """, (match_id,))
-        updated_match_answers = cursor.fetchone()
-        p1_answer, p2_answer, p1_time, p2_time = updated_match_answers
+        if cursor.rowcount != 1:
+            conn.close()
+            return {'success': False, 'error': 'Вы уже ответили на вопрос.'}
+        
+        if is_player1:
+            p1_answer, p1_time = answer, time_spent
+        else:
+            p2_answer, p2_time = answer, time_spent
         
         response = {'success': True, 'message': 'Ответ отправлен'}
-
-        if p1_answer is not None and p2_answer is not None:
-            cursor.execute("SELECT answer FROM problems WHERE id = ?", (problem_id,))
-            problem = cursor.fetchone()
-            correct_answer = problem[0].strip().lower() if problem else ''
-            
-            p1_correct = p1_answer.strip().lower() == correct_answer
-            p2_correct = p2_answer.strip().lower() == correct_answer
-            
-            winner_id = None
-            if p1_correct and not p2_correct:
-                winner_id = player1_id
-            elif p2_correct and not p1_correct:
-                winner_id = player2_id
-            elif p1_correct and p2_correct:
-                winner_id = player1_id if p1_time < p2_time else player2_id
-            
-            cursor.execute("""
-                UPDATE matches 
-                SET status = 'finished', winner_id = ?, finished_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (winner_id, match_id))
-            
-            cursor.execute("SELECT rating FROM users WHERE id IN (?, ?)", (player1_id, player2_id))
-            ratings = cursor.fetchall()
-            rating1 = ratings[0][0]
-            rating2 = ratings[1][0]
-            
-            K = 32
-            expected1 = 1 / (1 + 10 ** ((rating2 - rating1) / 400))
-            expected2 = 1 - expected1
-            
-            if winner_id == player1_id:
-                score1, score2 = 1, 0
-            elif winner_id == player2_id:
-                score1, score2 = 0, 1
-            else:
-                score1, score2 = 0.5, 0.5
-            
-            new_rating1 = rating1 + K * (score1 - expected1)
-            new_rating2 = rating2 + K * (score2 - expected2)
-            
-            cursor.execute("UPDATE users SET rating = ? WHERE id = ?", (int(new_rating1), player1_id))
-            cursor.execute("UPDATE users SET rating = ? WHERE id = ?", (int(new_rating2), player2_id))
-            
-            if winner_id:
-                self.check_achievements(cursor, winner_id)
-
+        
+        if p1_answer is None or p2_answer is None:
             conn.commit()
-
-            response['match_finished'] = True
-            response['player1_correct'] = p1_correct
-            response['player2_correct'] = p2_correct
-            response['winner_id'] = winner_id
-            response['new_rating1'] = int(new_rating1)
-            response['new_rating2'] = int(new_rating2)
-            response['message'] = 'Матч завершен!'
-            
-            if self.ws_server:
-                self.ws_server.broadcast_to_match(match_id, {
-                    'type': 'match_finished',
-                    'match_id': match_id,
-                    'winner_id': winner_id,
-                    'player1_correct': p1_correct,
-                    'player2_correct': p2_correct
-                })
+            conn.close()
+            return response
         
+        cursor.execute("SELECT answer FROM problems WHERE id = ?", (problem_id,))
+        problem = cursor.fetchone()
+        correct_answer = problem[0].strip().lower() if problem else ''
+        
+        p1_correct = p1_answer.strip().lower() == correct_answer
+        p2_correct = p2_answer.strip().lower() == correct_answer
+        
+        winner_id = None
+        if p1_correct and not p2_correct:
+            winner_id = player1_id
+        elif p2_correct and not p1_correct:
+            winner_id = player2_id
+        elif p1_correct and p2_correct:
+            winner_id = player1_id if p1_time < p2_time else player2_id
+        
+        result = finish_match(cursor, match_id, player1_id, player2_id, winner_id)
+        if result is None:
+            conn.rollback()
+            conn.close()
+            return {'success': False, 'error': 'Матч не активен'}
+        
+        new_rating1, new_rating2, earned = result
+        conn.commit()
+        leaderboard.refresh_user(cursor, player1_id)
+        leaderboard.refresh_user(cursor, player2_id)
         conn.close()
+        match_timeouts.finished(match_id)
+        response_cache.invalidate('stats', 'leaderboard')
+        self.publish_ratings(player1_id, player2_id)
+        self.publish('lobby', {'event': 'match_finished', 'match_id': match_id})
+        self.publish_stats()
+        
+        response['match_finished'] = True
+        response['player1_correct'] = p1_correct
+        response['player2_correct'] = p2_correct
+        response['winner_id'] = winner_id
+        response['new_rating1'] = new_rating1
+        response['new_rating2'] = new_rating2
+        response['message'] = 'Матч завершен!'
+        
+        if self.ws_server:
+            self.ws_server.broadcast_to_match(match_id, {
+                'type': 'match_finished',
+                'match_id': match_id,
+                'winner_id': winner_id,
+                'player1_correct': p1_correct,
+                'player2_correct': p2_correct
+            })
+            if earned:
+                self.ws_server.send_achievements(earned)
+        
         return response
     
     def import_problems(self, data):
-        user_id = data.get('user_id')
         problems_data = data.get('problems', [])
+        if not isinstance(problems_data, list):
+            return {'success': False, 'error': 'problems must be a list'}
+        return self.run_import(list_records(problems_data))
+    
+    def stream_import_problems(self):
+        query_params = parse_qs(urlparse(self.path).query)
+        content_type = self.headers.get('Content-Type', '')
+        import_format = query_params.get('format', ['csv' if 'csv' in content_type else 'jsonl'])[0]
+        
+        if import_format not in ('jsonl', 'csv'):
+            self.close_connection = True
+            return {'success': False, 'error': 'format must be jsonl or csv'}
+        
+        stream = RequestBody(self.rfile, self.headers).text()
+        records = csv_records(stream) if import_format == 'csv' else jsonl_records(stream)
+        response = self.run_import(records)
+        # Whatever the handler did not consume (e.g. on a refused upload) would
+        # be parsed as the next request on this keep-alive connection
+        if not stream.buffer.raw.finished:
+            self.close_connection = True
+        return response
+    
+    def run_import(self, records):
+        session = self.session()
         
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT role FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
-        
-        if not user or user[0] != 'admin':
-            conn.close()
+        if not session or not session.is_admin:
             return {'success': False, 'error': 'Доступ запрещен'}
         
-        imported = 0
-        for problem in problems_data:
-            try:
-                cursor.execute("""
-                    INSERT INTO problems (title, description, answer, difficulty, category, tags)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    problem.get('title', ''),
-                    problem.get('description', ''),
-                    problem.get('answer', ''),
-                    problem.get('difficulty', 1),
-                    problem.get('category', 'Математика'),
-                    problem.get('tags', '')
-                ))
-                imported += 1
-            except:
-                pass
+        conn = get_connection()
+        cursor = conn.cursor()
         
-        conn.commit()
+        importer = ProblemImporter(conn, session.user_id)
+        try:
+            report = importer.run(records)
+        except (UnicodeDecodeError, csv.Error, ValueError) as e:
+            report = importer.report()
+            report['aborted'] = str(e)
         conn.close()
         
-        return {'success': True, 'message': f'Импортировано задач: {imported}'}
+        if report['imported']:
+            problem_sampler.load()
+            response_cache.invalidate('problems', 'stats')
+            self.publish_stats()
+        
+        return {
+            'success': 'aborted' not in report,
+            'message': f"Импортировано задач: {report['imported']}",
+            **report
+        }
     
-    def export_problems(self):
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+    def export_data(self, kind):
+        if kind not in EXPORTS:
+            self.send_api_response({'success': False, 'error': f'Неизвестный экспорт: {kind}'})
+            return
         
-        cursor.execute("""
-            SELECT id, title, description, answer, difficulty, category, tags
-            FROM problems
-        """
-        )
+        query_params = parse_qs(urlparse(self.path).query)
+        # The problems JSON array stays the default so the admin panel export
+        # still round-trips through the array importer
+        export_format = query_params.get('format', ['json' if kind == 'problems' else 'jsonl'])[0]
+        compressed = query_params.get('gzip', ['0'])[0] in ('1', 'true')
         
-        problems = []
-        for row in cursor.fetchall():
-            problems.append({
-                'id': row[0],
-                'title': row[1],
-                'description': row[2],
-                'answer': row[3],
-                'difficulty': row[4],
-                'category': row[5],
-                'tags': row[6]
-            })
+        if export_format not in CONTENT_TYPES:
+            self.send_api_response({'success': False, 'error': 'format must be json, jsonl or csv'})
+            return
         
-        conn.close()
+        try:
+            filters = parse_filters(query_params)
+        except ValueError as e:
+            self.send_api_response({'success': False, 'error': str(e)})
+            return
+        
+        # Solutions and matches carry user data, so only admins may pull them
+        if kind != 'problems':
+            session = self.session()
+            if not session or not session.is_admin:
+                self.send_api_response({'success': False, 'error': 'Доступ запрещен'})
+                return
         
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        filename = f'{kind}.{export_format}' + ('.gz' if compressed else '')
         self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Content-Disposition', 'attachment; filename="problems.json"')
+        self.send_header('Content-Type', 'application/gzip' if compressed else CONTENT_TYPES[export_format])
+        self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+        self.send_header('Transfer-Encoding', 'chunked')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        self.wfile.write(json.dumps(problems, ensure_ascii=False, indent=2).encode('utf-8'))
+        
+        writer = ChunkedWriter(self.wfile, compressed)
+        completed = False
+        try:
+            for data in encode(EXPORTS[kind]['columns'], fetch_batches(cursor, kind, filters), export_format):
+                writer.write(data)
+            writer.close()
+            completed = True
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            conn.close()
+            # Headers are already out, so a failed export can only be signalled
+            # by dropping the connection before the terminating chunk
+            if not completed:
+                self.close_connection = True
     
     def send_api_response(self, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        etag = make_etag(body)
+        
+        if self.command == 'GET' and etag_matches(self.headers.get('If-None-Match'), etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            return
+        
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'), 'application/json', len(body))
+        if encoding:
+            body = compress(body, encoding)
+        
         self.send_response(200)
         self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        if self.command == 'GET':
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        for name, value in self.pending_headers:
+            self.send_header(name, value)
+        self.pending_headers = ()
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self.wfile.write(body)
+    
+    def not_modified_since(self, mtime):
+        header = self.headers.get('If-Modified-Since')
+        if not header or self.headers.get('If-None-Match'):
+            return False
+        try:
+            return int(mtime) <= parsedate_to_datetime(header).timestamp()
+        except (TypeError, ValueError):
+            return False
+    
+    def get_bundle(self):
+        page = asset_store.get('/index.html')
+        if page is None:
+            return {'success': False, 'error': 'index.html not found'}
+        
+        return {
+            'success': True,
+            'version': page.fingerprint,
+            'page': page.content.decode('utf-8'),
+            'styles': [asset_store.url_for(path) for path in PAGE_ASSETS if path.endswith('.css')],
+            'scripts': [asset_store.url_for(path) for path in PAGE_ASSETS if path.endswith('.js')]
+        }
     
     def serve_static_file(self, path):
-        if path == '/':
-            filename = INDEX_PATH
-        else:
-            filename = os.path.join(FRONTEND_DIR, path.lstrip('/'))
+        asset = asset_store.get('/index.html' if path == '/' else path)
         
-        if not os.path.exists(filename):
-            if filename.endswith(('.html', '.css', '.js', '.png', '.jpg', '.jpeg', '.ico', '.svg')):
+        if asset is None:
+            if path.endswith(('.html', '.css', '.js', '.png', '.jpg', '.jpeg', '.ico', '.svg')):
+                self.send_error(404)
+                return
+            asset = asset_store.get('/index.html')
+            if asset is None:
                 self.send_error(404)
                 return
-            else:
-                filename = INDEX_PATH
         
-        content_type, _ = mimetypes.guess_type(filename)
-        if not content_type:
-            content_type = 'text/html'
+        # ?v=<current fingerprint> URLs never change content, so they can be
+        # cached forever; any other version (stale or bogus) must revalidate
+        if parse_qs(urlparse(self.path).query).get('v') == [asset.fingerprint]:
+            cache_control = f'public, max-age={STATIC_MAX_AGE}, immutable'
+        else:
+            cache_control = 'no-cache'
         
-        try:
-            with open(filename, 'rb') as f:
-                content = f.read()
-            
-            self.send_response(200)
-            self.send_header('Content-Type', content_type)
-            self.send_header('Content-Length', str(len(content)))
+        if etag_matches(self.headers.get('If-None-Match'), asset.etag) or self.not_modified_since(asset.mtime):
+            self.send_response(304)
+            self.send_header('ETag', asset.etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
             self.end_headers()
-            self.wfile.write(content)
-        except Exception as e:
-            print(f"Error serving file {filename}: {e}")
-            self.send_error(500)
+            return
+        
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'), asset.content_type, asset.length)
+        if encoding not in asset.variants:
+            encoding = None
+        body = asset.variants[encoding] if encoding else asset.content
+        
+        self.send_response(200)
+        self.send_header('Content-Type', asset.content_type)
+        self.send_header('ETag', asset.etag)
+        self.send_header('Last-Modified', formatdate(asset.mtime, usegmt=True))
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body) if body is not None else asset.length))
+        self.end_headers()
+        
+        if body is not None:
+            self.wfile.write(body)
+            return
+        
+        try:
+            self.wfile.flush()
+            with open(asset.filename, 'rb') as f:
+                self.connection.sendfile(f, 0, asset.length)
+        except OSError as e:
+            print(f"Error serving file {asset.filename}: {e}")
+            self.close_connection = True
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import CACHE_ENABLED, CACHE_TTL, CACHE_MAX_ENTRIES
+
+class ResponseCache:
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, enabled=CACHE_ENABLED):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.entries = OrderedDict()
+        self.by_tag = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key, tags, loader):
+        if not self.enabled:
+            return loader()
+        
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self.invalidations
+        
+        value = loader()
+        # Only cache successful responses, and only if no write invalidated
+        # anything while we were loading (otherwise we could store stale data)
+        if isinstance(value, dict) and not value.get('success', True):
+            return value
+        
+        with self.lock:
+            if generation == self.invalidations:
+                self._store(key, tags, value, now + self.ttl)
+        return value
+
+    def _store(self, key, tags, value, expires):
+        self._discard(key)
+        self.entries[key] = (expires, value, tags)
+        for tag in tags:
+            self.by_tag.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            oldest = next(iter(self.entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            for tag in entry[2]:
+                keys = self.by_tag.get(tag)
+                if keys:
+                    keys.discard(key)
+
+    def invalidate(self, *tags):
+        with self.lock:
+            self.invalidations += 1
+            for tag in tags:
+                for key in list(self.by_tag.pop(tag, ())):
+                    self._discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.invalidations += 1
+            self.entries.clear()
+            self.by_tag.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total * 100, 2) if total else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+response_cache = ResponseCache()
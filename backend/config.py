@@ -6,3 +6,111 @@ DB_FILE = "olympiad_platform.db"
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 FRONTEND_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), "frontend")
 INDEX_PATH = os.path.join(FRONTEND_DIR, "index.html")
+
+# HTTP server: "threaded" (bounded worker pool) or "single" (one request at a time)
+SERVER_MODE = "threaded"
+HTTP_WORKERS = 32
+LISTEN_BACKLOG = 512
+KEEPALIVE_TIMEOUT = 15
+# How long a keep-alive connection may sit idle on a worker between requests
+KEEPALIVE_IDLE_TIMEOUT = 2
+SHUTDOWN_DRAIN_TIMEOUT = 10
+
+# SQLite connection pool. Sized for every HTTP worker plus the background
+# threads (scheduler, matchmaker, snapshots); once all are checked out,
+# callers wait up to DB_POOL_TIMEOUT seconds for one to come back
+DB_POOL_SIZE = HTTP_WORKERS + 8
+DB_POOL_TIMEOUT = 5
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_SIZE_KB = 16384
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_STATEMENT_CACHE = 256
+
+# /api/problems keyset pagination
+PROBLEMS_MAX_PAGE_SIZE = 500
+
+# Read-through cache for hot GET endpoints
+CACHE_ENABLED = True
+CACHE_TTL = 30
+CACHE_MAX_ENTRIES = 1024
+
+# HTTP compression and conditional requests
+COMPRESSION_ENABLED = True
+COMPRESSION_MIN_SIZE = 512
+STATIC_MAX_AGE = 31536000
+
+# Static assets: loaded into memory at startup; dev mode re-reads changed files
+STATIC_DEV_MODE = False
+SENDFILE_MIN_SIZE = 256 * 1024
+
+# WebSocket server (single-threaded selectors event loop)
+WS_BACKLOG = 512
+WS_PING_INTERVAL = 20
+WS_IDLE_TIMEOUT = 60
+WS_HANDSHAKE_TIMEOUT = 10
+WS_MAX_MESSAGE_SIZE = 64 * 1024
+WS_READ_PAUSE_BUFFER = 256 * 1024
+WS_MAX_WRITE_BUFFER = 1024 * 1024
+# Broadcast frames are skipped for a client whose unsent backlog is above this
+WS_BROADCAST_DROP_BUFFER = 512 * 1024
+
+# Matchmaking queue: ratings are bucketed, the acceptable rating gap widens
+# by MATCH_WINDOW_GROWTH points per second of waiting
+MATCH_BUCKET_SIZE = 50
+MATCH_WINDOW_BASE = 100
+MATCH_WINDOW_GROWTH = 25
+MATCH_WINDOW_MAX = 800
+MATCH_SWEEP_INTERVAL = 1
+
+# Match problem sampling: relative draw weight per difficulty (1 = easy .. 3 = hard)
+PROBLEM_DIFFICULTY_WEIGHTS = {1: 1.0, 2: 1.0, 3: 1.0}
+PROBLEM_SAMPLE_ATTEMPTS = 8
+
+# Match timeouts (seconds): unjoined matches expire, active matches are
+# forfeited at the answer deadline or after a disconnected player's grace period
+MATCH_WAITING_TIMEOUT = 300
+MATCH_ANSWER_DEADLINE = 600
+MATCH_DISCONNECT_GRACE = 60
+
+# Solution write-behind: grade and respond immediately, persist in group
+# commits from a single writer thread. SOLUTION_ACK "queued" answers as soon
+# as the solution is graded, "committed" waits for its batch to commit.
+# SOLUTION_SYNCHRONOUS is the writer's PRAGMA synchronous (NORMAL or FULL)
+SOLUTION_WRITE_BEHIND = False
+SOLUTION_ACK = "queued"
+SOLUTION_SYNCHRONOUS = "NORMAL"
+SOLUTION_BATCH_SIZE = 500
+SOLUTION_FLUSH_INTERVAL = 0.05
+SOLUTION_QUEUE_MAX = 10000
+
+# Bulk problem import: rows per executemany batch / transaction, and how many
+# per-row errors are echoed back in the report
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 1000
+
+# Streaming exports: rows per fetchmany / response chunk, gzip level for gzip=1
+EXPORT_FETCH_SIZE = 1000
+EXPORT_GZIP_LEVEL = 6
+
+# Password hashing: "bcrypt" (falls back to scrypt without the bcrypt module)
+# or "scrypt". Hashes with another scheme or cost, and legacy SHA256 ones, are
+# upgraded on the next successful login. Hashing runs on PASSWORD_WORKERS
+# threads; at most PASSWORD_QUEUE_MAX requests wait or run at once and the
+# rest are refused after PASSWORD_QUEUE_TIMEOUT seconds
+PASSWORD_SCHEME = "bcrypt"
+PASSWORD_BCRYPT_ROUNDS = 12
+PASSWORD_SCRYPT_LOG_N = 14
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+PASSWORD_WORKERS = 4
+PASSWORD_QUEUE_MAX = 64
+PASSWORD_QUEUE_TIMEOUT = 5
+PASSWORD_LATENCY_SAMPLES = 1024
+
+# Sessions: signed tokens issued at login, resolved through an in-memory LRU
+# (SESSION_CACHE_SIZE sessions) in front of the sessions table. The signing
+# key is generated on first start next to the database
+SESSION_TTL = 7 * 24 * 3600
+SESSION_CACHE_SIZE = 10000
+SESSION_SECRET_FILE = "session_secret.key"
+SESSION_COOKIE = "session"
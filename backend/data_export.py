@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from config import EXPORT_FETCH_SIZE, EXPORT_GZIP_LEVEL
+
+# What each export selects, which column the date range applies to and which
+# columns the category / user filters match against
+EXPORTS = {
+    'problems': {
+        'columns': ('id', 'title', 'description', 'answer', 'difficulty', 'category', 'tags',
+                    'created_at', 'created_by'),
+        'select': """SELECT p.id, p.title, p.description, p.answer, p.difficulty, p.category, p.tags,
+                            p.created_at, p.created_by
+                     FROM problems p""",
+        'where': [],
+        'time': 'p.created_at',
+        'users': ('p.created_by',),
+        'order': 'p.id',
+    },
+    'solutions': {
+        'columns': ('id', 'user_id', 'problem_id', 'category', 'difficulty', 'answer', 'is_correct',
+                    'time_spent', 'solved_at'),
+        'select': """SELECT s.id, s.user_id, s.problem_id, p.category, p.difficulty, s.answer, s.is_correct,
+                            s.time_spent, s.solved_at
+                     FROM solutions s
+                     LEFT JOIN problems p ON p.id = s.problem_id""",
+        'where': [],
+        'time': 's.solved_at',
+        'users': ('s.user_id',),
+        'order': 's.id',
+    },
+    'matches': {
+        'columns': ('id', 'player1_id', 'player2_id', 'problem_id', 'category', 'player1_answer',
+                    'player2_answer', 'player1_time', 'player2_time', 'winner_id', 'started_at', 'finished_at'),
+        'select': """SELECT m.id, m.player1_id, m.player2_id, m.problem_id, p.category, m.player1_answer,
+                            m.player2_answer, m.player1_time, m.player2_time, m.winner_id, m.started_at, m.finished_at
+                     FROM matches m
+                     LEFT JOIN problems p ON p.id = m.problem_id""",
+        'where': ["m.status = 'finished'"],
+        'time': 'm.finished_at',
+        'users': ('m.player1_id', 'm.player2_id'),
+        'order': 'm.id',
+    },
+}
+
+CONTENT_TYPES = {
+    'json': 'application/json; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+def parse_timestamp(value, name):
+    # Stored timestamps are CURRENT_TIMESTAMP text, so filters are normalized
+    # to the same 'YYYY-MM-DD HH:MM:SS' form and compared as strings
+    try:
+        return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        raise ValueError(f'Неверная дата в параметре {name}: {value}')
+
+def parse_filters(query_params):
+    filters = {}
+    # since is inclusive and until exclusive, so consecutive nightly
+    # ranges (since=D&until=D+1) never overlap
+    for name in ('since', 'until'):
+        value = query_params.get(name, [''])[0]
+        if value:
+            filters[name] = parse_timestamp(value, name)
+    category = query_params.get('category', [''])[0]
+    if category:
+        filters['category'] = category
+    user = query_params.get('user', [''])[0]
+    if user:
+        try:
+            filters['user'] = int(user)
+        except ValueError:
+            raise ValueError(f'Неверный user: {user}')
+    return filters
+
+def build_query(kind, filters):
+    export = EXPORTS[kind]
+    where = list(export['where'])
+    params = []
+
+    if 'since' in filters:
+        where.append(f"{export['time']} >= ?")
+        params.append(filters['since'])
+    if 'until' in filters:
+        where.append(f"{export['time']} < ?")
+        params.append(filters['until'])
+    if 'category' in filters:
+        where.append("p.category = ?")
+        params.append(filters['category'])
+    if 'user' in filters:
+        where.append('(' + ' OR '.join(f'{column} = ?' for column in export['users']) + ')')
+        params.extend([filters['user']] * len(export['users']))
+
+    query = export['select']
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    return query + f" ORDER BY {export['order']}", params
+
+def fetch_batches(cursor, kind, filters):
+    query, params = build_query(kind, filters)
+    cursor.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+        if not rows:
+            return
+        yield rows
+
+def encode(columns, batches, export_format):
+    # One encoded string per fetchmany batch, so the response is written in
+    # a few large chunks rather than one small write per row
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+        return
+
+    if export_format == 'jsonl':
+        for rows in batches:
+            yield ''.join(
+                json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows
+            ).encode('utf-8')
+        return
+
+    # Plain JSON array, kept for the admin panel export and the array importer
+    separator = '[\n'
+    for rows in batches:
+        parts = []
+        for row in rows:
+            parts.append(separator + json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+            separator = ',\n'
+        yield ''.join(parts).encode('utf-8')
+    yield b'[]\n' if separator == '[\n' else b'\n]\n'
+
+class ChunkedWriter:
+    # Frames the body with Transfer-Encoding: chunked, gzip-compressing it on
+    # the fly when asked (wbits=31 produces a gzip stream rather than zlib)
+    def __init__(self, wfile, compress=False):
+        self.wfile = wfile
+        self.compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None
+        self.bytes_written = 0
+
+    def send(self, data):
+        if data:
+            self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+            self.bytes_written += len(data)
+
+    def write(self, data):
+        self.send(self.compressor.compress(data) if self.compressor else data)
+
+    def close(self):
+        if self.compressor:
+            self.send(self.compressor.flush())
+        self.wfile.write(b'0\r\n\r\n')
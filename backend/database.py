@@ -1,29 +1,135 @@
-import sqlite3
 import hashlib
-from config import DB_FILE
-
-try:
-    import bcrypt
-    BCRYPT_AVAILABLE = True
-except ImportError:
-    BCRYPT_AVAILABLE = False
-    print("⚠️ bcrypt not installed. Using SHA256 (less secure).")
-
-def hash_password(password):
-    if BCRYPT_AVAILABLE:
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    else:
-        return hashlib.sha256(password.encode()).hexdigest()
+from db_pool import get_connection
+from achievements import achievement_engine, accuracy
+from passwords import hash_password
+
+def split_tags(tags):
+    if not tags:
+        return []
+    items = tags if isinstance(tags, (list, tuple)) else str(tags).split(',')
+    result = []
+    for tag in items:
+        tag = str(tag).strip()
+        if tag and tag not in result:
+            result.append(tag)
+    return result
+
+def title_hash(title):
+    # 64-bit key for duplicate-title checks; case and surrounding space are ignored
+    digest = hashlib.blake2b(str(title or '').strip().lower().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+def backfill_title_hashes(cursor):
+    cursor.execute("SELECT id, title FROM problems WHERE title_hash IS NULL")
+    cursor.executemany(
+        "UPDATE problems SET title_hash = ? WHERE id = ?",
+        [(title_hash(title), problem_id) for problem_id, title in cursor.fetchall()]
+    )
 
-def verify_password(password, hashed):
-    if BCRYPT_AVAILABLE and hashed.startswith('$2b$'):
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+def set_problem_tags(cursor, problem_id, tags):
+    cursor.execute("DELETE FROM problem_tags WHERE problem_id = ?", (problem_id,))
+    for name in split_tags(tags):
+        cursor.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (name,))
+        cursor.execute(
+            "INSERT OR IGNORE INTO problem_tags (problem_id, tag_id) SELECT ?, id FROM tags WHERE name = ?",
+            (problem_id, name)
+        )
+
+def finish_match(cursor, match_id, player1_id, player2_id, winner_id):
+    # Moves an active match to 'finished' and applies Elo. The status check in
+    # the UPDATE makes this a no-op (returns None) if the match was already
+    # finished, so ratings change exactly once per match. Otherwise returns
+    # both new ratings and the achievements earned
+    cursor.execute("""
+        UPDATE matches 
+        SET status = 'finished', winner_id = ?, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = 'active'
+    """, (winner_id, match_id))
+    if cursor.rowcount != 1:
+        return None
+    
+    cursor.execute("SELECT id, rating FROM users WHERE id IN (?, ?)", (player1_id, player2_id))
+    ratings = dict(cursor.fetchall())
+    rating1 = ratings.get(player1_id) or 0
+    rating2 = ratings.get(player2_id) or 0
+    
+    K = 32
+    expected1 = 1 / (1 + 10 ** ((rating2 - rating1) / 400))
+    expected2 = 1 - expected1
+    
+    if winner_id == player1_id:
+        score1, score2 = 1, 0
+    elif winner_id == player2_id:
+        score1, score2 = 0, 1
     else:
-        return hashlib.sha256(password.encode()).hexdigest() == hashed
+        score1, score2 = 0.5, 0.5
+    
+    new_rating1 = int(rating1 + K * (score1 - expected1))
+    new_rating2 = int(rating2 + K * (score2 - expected2))
+    
+    cursor.execute("UPDATE users SET rating = ? WHERE id = ?", (new_rating1, player1_id))
+    cursor.execute("UPDATE users SET rating = ? WHERE id = ?", (new_rating2, player2_id))
+    
+    earned = achievement_engine.award(cursor, player1_id, [('rating', rating1, new_rating1)])
+    earned += achievement_engine.award(cursor, player2_id, [('rating', rating2, new_rating2)])
+    if winner_id:
+        cursor.execute("INSERT OR IGNORE INTO user_stats (user_id) VALUES (?)", (winner_id,))
+        cursor.execute("UPDATE user_stats SET pvp_wins = pvp_wins + 1 WHERE user_id = ? RETURNING pvp_wins", (winner_id,))
+        wins = cursor.fetchone()[0]
+        earned += achievement_engine.award(cursor, winner_id, [('pvp_wins', wins - 1, wins)])
+    return new_rating1, new_rating2, earned
 
-def migrate_database(conn):
-    cursor = conn.cursor()
+def record_solution(cursor, user_id, problem_id, answer, is_correct, time_spent, difficulty):
+    # Returns the achievements this solution earned
+    cursor.execute(
+        """INSERT INTO solutions (user_id, problem_id, answer, is_correct, time_spent) 
+           VALUES (?, ?, ?, ?, ?)""",
+        (user_id, problem_id, answer, is_correct, time_spent)
+    )
+    cursor.execute("INSERT OR IGNORE INTO user_stats (user_id) VALUES (?)", (user_id,))
+    
+    correct_delta = 1 if is_correct else 0
+    cursor.execute("""
+        UPDATE user_stats 
+        SET total_problems = total_problems + 1,
+            solved_problems = solved_problems + ?,
+            correct_answers = correct_answers + ?,
+            total_time_spent = total_time_spent + ?,
+            avg_time_per_problem = (total_time_spent + ?) / (total_problems + 1)
+        WHERE user_id = ?
+        RETURNING total_problems, correct_answers
+    """, (correct_delta, correct_delta, time_spent, time_spent, user_id))
+    total, correct = cursor.fetchone()
     
+    changes = [('accuracy', accuracy(correct - correct_delta, total - 1), accuracy(correct, total))]
+    
+    if is_correct:
+        rating_change = difficulty * 10
+        xp_gained = difficulty * 50
+        
+        cursor.execute(
+            "UPDATE users SET rating = rating + ?, total_xp = total_xp + ? WHERE id = ? RETURNING rating, total_xp, level",
+            (rating_change, xp_gained, user_id)
+        )
+        user_data = cursor.fetchone()
+        if user_data:
+            rating, current_xp, current_level = user_data
+            new_level = 1 + (current_xp // 1000)
+            
+            if new_level > current_level:
+                cursor.execute("UPDATE users SET level = ? WHERE id = ?", (new_level, user_id))
+            changes.append(('rating', rating - rating_change, rating))
+        
+        changes.append(('problems_solved', correct - 1, correct))
+    
+    return achievement_engine.award(cursor, user_id, changes)
+
+def rebuild_problem_tags(cursor):
+    cursor.execute("SELECT id, tags FROM problems")
+    for problem_id, tags in cursor.fetchall():
+        set_problem_tags(cursor, problem_id, tags)
+
+def migration_add_xp_and_level(cursor):
     cursor.execute("PRAGMA table_info(users)")
     columns = [col[1] for col in cursor.fetchall()]
     
@@ -32,11 +138,183 @@ def migrate_database(conn):
     
     if 'level' not in columns:
         cursor.execute("ALTER TABLE users ADD COLUMN level INTEGER DEFAULT 1")
+
+def migration_add_hot_query_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_solutions_user ON solutions(user_id, is_correct, time_spent)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_solutions_problem ON solutions(problem_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_status ON matches(status, started_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_player1 ON matches(player1_id, status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_player2 ON matches(player2_id, status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_winner ON matches(winner_id, status)")
+
+def migration_backfill_user_stats(cursor):
+    cursor.execute("INSERT OR IGNORE INTO user_stats (user_id) SELECT id FROM users")
+    cursor.execute("""
+        UPDATE user_stats SET
+            total_problems = (SELECT COUNT(*) FROM solutions s WHERE s.user_id = user_stats.user_id),
+            correct_answers = (SELECT COUNT(*) FROM solutions s WHERE s.user_id = user_stats.user_id AND s.is_correct),
+            solved_problems = (SELECT COUNT(*) FROM solutions s WHERE s.user_id = user_stats.user_id AND s.is_correct),
+            total_time_spent = (SELECT COALESCE(SUM(time_spent), 0) FROM solutions s WHERE s.user_id = user_stats.user_id)
+    """)
+    cursor.execute("""
+        UPDATE user_stats
+        SET avg_time_per_problem = CASE WHEN total_problems > 0
+                                        THEN CAST(total_time_spent AS REAL) / total_problems
+                                        ELSE 0 END
+    """)
+
+def migration_normalize_problem_tags(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS tags (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS problem_tags (
+        problem_id INTEGER NOT NULL,
+        tag_id INTEGER NOT NULL,
+        PRIMARY KEY (problem_id, tag_id),
+        FOREIGN KEY (problem_id) REFERENCES problems(id),
+        FOREIGN KEY (tag_id) REFERENCES tags(id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problem_tags_tag ON problem_tags(tag_id, problem_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problems_difficulty ON problems(difficulty)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problems_category ON problems(category, difficulty)")
+    rebuild_problem_tags(cursor)
+
+def migration_add_problem_search(cursor):
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS problems_fts USING fts5(
+        title, description, tags,
+        content='problems', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    ''')
+    # Title hits weigh most, then tags, then description text
+    cursor.execute("INSERT INTO problems_fts (problems_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0)')")
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS problems_fts_insert AFTER INSERT ON problems BEGIN
+        INSERT INTO problems_fts (rowid, title, description, tags)
+        VALUES (new.id, new.title, new.description, new.tags);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS problems_fts_delete AFTER DELETE ON problems BEGIN
+        INSERT INTO problems_fts (problems_fts, rowid, title, description, tags)
+        VALUES ('delete', old.id, old.title, old.description, old.tags);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS problems_fts_update AFTER UPDATE OF title, description, tags ON problems BEGIN
+        INSERT INTO problems_fts (problems_fts, rowid, title, description, tags)
+        VALUES ('delete', old.id, old.title, old.description, old.tags);
+        INSERT INTO problems_fts (rowid, title, description, tags)
+        VALUES (new.id, new.title, new.description, new.tags);
+    END
+    ''')
+    cursor.execute("INSERT INTO problems_fts (problems_fts) VALUES ('rebuild')")
+
+def migration_add_pvp_wins(cursor):
+    cursor.execute("PRAGMA table_info(user_stats)")
+    columns = [col[1] for col in cursor.fetchall()]
+    
+    if 'pvp_wins' not in columns:
+        cursor.execute("ALTER TABLE user_stats ADD COLUMN pvp_wins INTEGER DEFAULT 0")
+    
+    cursor.execute("""
+        UPDATE user_stats SET pvp_wins = (
+            SELECT COUNT(*) FROM matches m
+            WHERE m.winner_id = user_stats.user_id AND m.status = 'finished'
+        )
+    """)
+
+def migration_add_title_hash(cursor):
+    cursor.execute("PRAGMA table_info(problems)")
+    columns = [col[1] for col in cursor.fetchall()]
     
+    if 'title_hash' not in columns:
+        cursor.execute("ALTER TABLE problems ADD COLUMN title_hash INTEGER")
+    
+    backfill_title_hashes(cursor)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problems_title_hash ON problems(title_hash)")
+
+def migration_add_export_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_solutions_solved_at ON solutions(solved_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_finished ON matches(status, finished_at)")
+
+def migration_add_sessions(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+
+def migration_backfill_achievements(cursor):
+    achievement_engine.award_existing(cursor)
+
+# Ordered schema migrations. Append new steps to the end, never reorder or
+# renumber; every step must be safe to re-run on a partially migrated database.
+MIGRATIONS = [
+    (1, "add users.total_xp and users.level", migration_add_xp_and_level),
+    (2, "add indexes for stats, leaderboard and pvp queries", migration_add_hot_query_indexes),
+    (3, "backfill user_stats counters for every user", migration_backfill_user_stats),
+    (4, "normalize problem tags and index problem listing", migration_normalize_problem_tags),
+    (5, "full-text search index over problems", migration_add_problem_search),
+    (6, "keep pvp win counts in user_stats", migration_add_pvp_wins),
+    (7, "index problem titles by hash for import deduplication", migration_add_title_hash),
+    (8, "index solution and match timestamps for date-range exports", migration_add_export_indexes),
+    (9, "store login sessions", migration_add_sessions),
+    (10, "grant achievements users already qualify for", migration_backfill_achievements),
+]
+
+def get_schema_version(cursor):
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+def migrate_database(conn):
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
     conn.commit()
+    
+    current = get_schema_version(cursor)
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Another process may have applied it while we waited for the lock
+            if get_schema_version(cursor) >= version:
+                conn.rollback()
+                continue
+            step(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                (version, name)
+            )
+            conn.commit()
+            print(f"🛠️ Migration {version} applied: {name}")
+        except Exception:
+            conn.rollback()
+            raise
 
 def init_database():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -54,8 +332,6 @@ def init_database():
     )
     ''')
     
-    migrate_database(conn)
-    
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS problems (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -141,6 +417,9 @@ def init_database():
         UNIQUE(user_id, achievement_id)
     )
     ''')
+    conn.commit()
+    
+    migrate_database(conn)
     
     cursor.execute("SELECT COUNT(*) FROM users WHERE username='admin'")
     if cursor.fetchone()[0] == 0:
@@ -170,6 +449,8 @@ def init_database():
             "INSERT INTO problems (title, description, answer, difficulty, category, tags) VALUES (?, ?, ?, ?, ?, ?)",
             test_problems
         )
+        rebuild_problem_tags(cursor)
+        backfill_title_hashes(cursor)
     
     cursor.execute("SELECT COUNT(*) FROM users WHERE username='test'")
     if cursor.fetchone()[0] == 0:
@@ -179,6 +460,8 @@ def init_database():
             ("test", test_pass)
         )
     
+    cursor.execute("INSERT OR IGNORE INTO user_stats (user_id) SELECT id FROM users")
+    
     cursor.execute("SELECT COUNT(*) FROM achievements")
     if cursor.fetchone()[0] == 0:
         achievements = [
@@ -0,0 +1,166 @@
+import sqlite3
+import threading
+import queue
+
+from config import (
+    DB_FILE, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_BUSY_TIMEOUT_MS,
+    DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_STATEMENT_CACHE
+)
+
+class PooledConnection:
+    # Looks like sqlite3.Connection to the handlers; close() hands the
+    # underlying connection back to the pool instead of closing the file.
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._conn.commit()
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __del__(self):
+        # A handler that bailed out through an exception never called close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+class ConnectionPool:
+    # At most `size` pooled connections exist. When all of them are checked
+    # out, acquire() waits for one to be released; only after `timeout` does
+    # it open an overflow connection, so a caller that nests acquires cannot
+    # deadlock the pool
+    def __init__(self, db_file=DB_FILE, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.db_file = db_file
+        self.size = size
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize=size)
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.created = 0
+        self.reused = 0
+        self.waited = 0
+        self.overflow = 0
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+        conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self.lock:
+            self.created += 1
+        return conn
+
+    def dedicated(self):
+        # A connection outside the pool for a long-lived owner (e.g. a writer thread)
+        return self._open()
+
+    def _healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        while True:
+            conn = self._take()
+            if conn is None:
+                return PooledConnection(self, self._open_counted())
+            if self._healthy(conn):
+                with self.lock:
+                    self.reused += 1
+                return PooledConnection(self, conn)
+            self._discard(conn)
+
+    def _take(self):
+        # An idle connection, or None when a new one may be opened
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                return None
+            self.waited += 1
+        try:
+            return self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self.lock:
+                self.opened += 1
+                self.overflow += 1
+            return None
+
+    def _open_counted(self):
+        try:
+            return self._open()
+        except Exception:
+            with self.lock:
+                self.opened -= 1
+            raise
+
+    def _discard(self, conn):
+        with self.lock:
+            self.opened -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            self._discard(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self._discard(self.idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def stats(self):
+        return {
+            'idle': self.idle.qsize(),
+            'size': self.size,
+            'open': self.opened,
+            'created': self.created,
+            'reused': self.reused,
+            'waited': self.waited,
+            'overflow': self.overflow
+        }
+
+pool = ConnectionPool()
+
+def get_connection():
+    return pool.acquire()
@@ -0,0 +1,71 @@
+import gzip
+import hashlib
+
+from config import COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript',
+    'application/x-javascript', 'image/svg+xml'
+)
+
+def make_etag(body):
+    # Weak validator: the same etag is used for identity, gzip and br
+    # representations of one body, which weak comparison allows
+    return 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    wanted = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+def accepted_encodings(accept_encoding):
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        pieces = part.strip().split(';')
+        name = pieces[0].strip().lower()
+        quality = 1.0
+        for param in pieces[1:]:
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0
+        if name and quality > 0:
+            accepted.add(name)
+    return accepted
+
+def choose_encoding(accept_encoding, content_type, size):
+    if not COMPRESSION_ENABLED or size < COMPRESSION_MIN_SIZE or not is_compressible(content_type):
+        return None
+    accepted = accepted_encodings(accept_encoding)
+    if BROTLI_AVAILABLE and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+def compress(body, encoding, best=False):
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if best else 5)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9 if best else 6, mtime=0)
+    return body
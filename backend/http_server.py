@@ -0,0 +1,140 @@
+import select
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SERVER_MODE, HTTP_WORKERS, LISTEN_BACKLOG, SHUTDOWN_DRAIN_TIMEOUT, KEEPALIVE_IDLE_TIMEOUT
+
+IDLE_POLL_INTERVAL = 0.1
+
+class KeepAliveMixin:
+    # A keep-alive connection between requests still owns its worker, so it
+    # only waits KEEPALIVE_IDLE_TIMEOUT for the next request and gives the
+    # worker up at once when another connection needs it or the server drains
+    def wait_for_request(self, handler):
+        sock = handler.connection
+        # A pipelined request may already sit in the handler's read buffer
+        sock.setblocking(False)
+        try:
+            if handler.rfile.peek(1):
+                return True
+        finally:
+            sock.settimeout(handler.timeout)
+
+        self.connection_idle()
+        try:
+            deadline = time.monotonic() + KEEPALIVE_IDLE_TIMEOUT
+            while not self.draining and not self.worker_wanted():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                readable, _, _ = select.select([sock], [], [], min(remaining, IDLE_POLL_INTERVAL))
+                if readable:
+                    return True
+            return False
+        finally:
+            self.connection_busy()
+
+    def connection_idle(self):
+        pass
+
+    def connection_busy(self):
+        pass
+
+class SingleHTTPServer(KeepAliveMixin, socketserver.TCPServer):
+    allow_reuse_address = True
+    request_queue_size = LISTEN_BACKLOG
+    draining = False
+
+    def worker_wanted(self):
+        # The only worker is needed as soon as another client connects
+        readable, _, _ = select.select([self.socket], [], [], 0)
+        return bool(readable)
+
+class PooledHTTPServer(KeepAliveMixin, socketserver.TCPServer):
+    allow_reuse_address = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(self, server_address, handler_class, max_workers=HTTP_WORKERS):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http-worker')
+        # While every worker is busy the accept loop blocks here, so new
+        # connections wait in the kernel listen backlog instead of piling up in memory.
+        self.slots = threading.BoundedSemaphore(max_workers)
+        self.in_flight = 0
+        self.in_flight_lock = threading.Condition()
+        # Connections accepted but blocked waiting for a free worker
+        self.waiting = 0
+        self.draining = False
+        self.closed = False
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            with self.in_flight_lock:
+                self.waiting += 1
+            self.slots.acquire()
+            with self.in_flight_lock:
+                self.waiting -= 1
+        with self.in_flight_lock:
+            self.in_flight += 1
+        try:
+            self.executor.submit(self.process_request_thread, request, client_address)
+        except RuntimeError:
+            self.request_done()
+            self.shutdown_request(request)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.request_done()
+
+    def request_done(self):
+        with self.in_flight_lock:
+            self.in_flight -= 1
+            self.in_flight_lock.notify_all()
+        self.slots.release()
+
+    def worker_wanted(self):
+        return self.waiting > 0
+
+    def connection_idle(self):
+        # Idle keep-alive connections do not count as in flight for drain()
+        with self.in_flight_lock:
+            self.in_flight -= 1
+            self.in_flight_lock.notify_all()
+
+    def connection_busy(self):
+        with self.in_flight_lock:
+            self.in_flight += 1
+
+    def drain(self, timeout=SHUTDOWN_DRAIN_TIMEOUT):
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        with self.in_flight_lock:
+            while self.in_flight > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.in_flight_lock.wait(remaining)
+            return self.in_flight
+
+    def server_close(self):
+        if self.closed:
+            return
+        self.closed = True
+        super().server_close()
+        left = self.drain()
+        if left:
+            print(f"⚠️ {left} requests still running after drain timeout")
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def create_http_server(server_address, handler_factory):
+    if SERVER_MODE == "threaded":
+        return PooledHTTPServer(server_address, handler_factory)
+    return SingleHTTPServer(server_address, handler_factory)
@@ -0,0 +1,248 @@
+import bisect
+import threading
+
+from db_pool import get_connection
+
+class RankIndex:
+    # Sorted list split into small buckets (the sortedcontainers layout):
+    # bisect over bucket maxima finds the bucket in O(log n), and inserts
+    # only shift one short bucket instead of the whole list. A Fenwick tree
+    # over the bucket sizes turns "how many keys come before this bucket"
+    # and "which bucket holds position i" into O(log n) lookups; it is only
+    # rebuilt when a bucket is split or dropped.
+    LOAD = 256
+
+    def __init__(self):
+        self.buckets = []
+        self.maxes = []
+        self.tree = [0]
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _rebuild(self):
+        tree = [0] + [len(bucket) for bucket in self.buckets]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def _update(self, pos, delta):
+        i = pos + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, pos):
+        # Number of keys in buckets[:pos]
+        total = 0
+        while pos > 0:
+            total += self.tree[pos]
+            pos -= pos & -pos
+        return total
+
+    def _locate(self, index):
+        # (bucket, offset inside it) of the key at position index < size
+        pos = 0
+        step = 1 << (len(self.buckets).bit_length() - 1) if self.buckets else 0
+        while step:
+            if pos + step < len(self.tree) and self.tree[pos + step] <= index:
+                pos += step
+                index -= self.tree[pos]
+            step >>= 1
+        return pos, index
+
+    def add(self, key):
+        if not self.buckets:
+            self.buckets.append([key])
+            self.maxes.append(key)
+            self.size = 1
+            self._rebuild()
+            return
+        pos = bisect.bisect_left(self.maxes, key)
+        if pos == len(self.buckets):
+            pos -= 1
+        bucket = self.buckets[pos]
+        bisect.insort(bucket, key)
+        self.maxes[pos] = bucket[-1]
+        self.size += 1
+        if len(bucket) > self.LOAD * 2:
+            half = bucket[self.LOAD:]
+            del bucket[self.LOAD:]
+            self.buckets.insert(pos + 1, half)
+            self.maxes[pos] = bucket[-1]
+            self.maxes.insert(pos + 1, half[-1])
+            self._rebuild()
+        else:
+            self._update(pos, 1)
+
+    def remove(self, key):
+        pos = bisect.bisect_left(self.maxes, key)
+        if pos == len(self.buckets):
+            return False
+        bucket = self.buckets[pos]
+        i = bisect.bisect_left(bucket, key)
+        if i == len(bucket) or bucket[i] != key:
+            return False
+        del bucket[i]
+        self.size -= 1
+        if bucket:
+            self.maxes[pos] = bucket[-1]
+            self._update(pos, -1)
+        else:
+            del self.buckets[pos]
+            del self.maxes[pos]
+            self._rebuild()
+        return True
+
+    def index(self, key):
+        pos = bisect.bisect_left(self.maxes, key)
+        if pos == len(self.buckets):
+            return -1
+        bucket = self.buckets[pos]
+        i = bisect.bisect_left(bucket, key)
+        if i == len(bucket) or bucket[i] != key:
+            return -1
+        return self._prefix(pos) + i
+
+    def slice(self, start, stop):
+        stop = min(stop, self.size)
+        if start >= stop:
+            return []
+        pos, offset = self._locate(start)
+        result = []
+        remaining = stop - start
+        while remaining > 0:
+            chunk = self.buckets[pos][offset:offset + remaining]
+            result.extend(chunk)
+            remaining -= len(chunk)
+            pos += 1
+            offset = 0
+        return result
+
+class Leaderboard:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.index = RankIndex()
+        self.users = {}
+        self.loaded = False
+
+    def _key(self, entry):
+        return (-entry['rating'], entry['id'])
+
+    def _put(self, entry):
+        old = self.users.get(entry['id'])
+        if old is not None:
+            self.index.remove(self._key(old))
+        self.users[entry['id']] = entry
+        self.index.add(self._key(entry))
+
+    def _row_to_entry(self, row):
+        return {
+            'id': row[0],
+            'username': row[1],
+            'rating': row[2] or 0,
+            'level': row[3],
+            'solved': row[4] or 0,
+            'correct': row[5] or 0
+        }
+
+    def load(self):
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT u.id, u.username, u.rating, u.level,
+                   COALESCE(us.total_problems, 0), COALESCE(us.correct_answers, 0)
+            FROM users u
+            LEFT JOIN user_stats us ON u.id = us.user_id
+        """)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        with self.lock:
+            self.index = RankIndex()
+            self.users = {}
+            for row in rows:
+                self._put(self._row_to_entry(row))
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def refresh_user(self, cursor, user_id):
+        with self.lock:
+            if not self.loaded:
+                return
+            cursor.execute("""
+                SELECT u.id, u.username, u.rating, u.level,
+                       COALESCE(us.total_problems, 0), COALESCE(us.correct_answers, 0)
+                FROM users u
+                LEFT JOIN user_stats us ON u.id = us.user_id
+                WHERE u.id = ?
+            """, (user_id,))
+            row = cursor.fetchone()
+            if row:
+                self._put(self._row_to_entry(row))
+            else:
+                self._drop(user_id)
+
+    def remove_user(self, user_id):
+        with self.lock:
+            self._drop(user_id)
+
+    def _drop(self, user_id):
+        old = self.users.pop(user_id, None)
+        if old is not None:
+            self.index.remove(self._key(old))
+
+    def _public(self, entry, rank):
+        total = entry['solved']
+        correct = entry['correct']
+        return {
+            'rank': rank,
+            'id': entry['id'],
+            'username': entry['username'],
+            'rating': entry['rating'],
+            'level': entry['level'],
+            'solved': total,
+            'correct': correct,
+            'accuracy': round((correct/total*100), 2) if total > 0 else 0
+        }
+
+    def _entries(self, start, stop):
+        return [
+            self._public(self.users[key[1]], start + i + 1)
+            for i, key in enumerate(self.index.slice(start, stop))
+        ]
+
+    def rating_of(self, user_id):
+        self.ensure_loaded()
+        with self.lock:
+            entry = self.users.get(user_id)
+            return entry['rating'] if entry else None
+
+    def top(self, k=50):
+        self.ensure_loaded()
+        with self.lock:
+            return self._entries(0, k)
+
+    def rank_of(self, user_id, around=2):
+        self.ensure_loaded()
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is None:
+                return None
+            position = self.index.index(self._key(entry))
+            start = max(position - around, 0)
+            stop = position + around + 1
+            return {
+                'rank': position + 1,
+                'total': len(self.index),
+                'user': self._public(entry, position + 1),
+                'neighbours': [e for e in self._entries(start, stop) if e['id'] != user_id]
+            }
+
+leaderboard = Leaderboard()
@@ -1,24 +1,41 @@
-import socketserver
 import threading
 import os
 import sys
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from config import PORT, DB_FILE, FRONTEND_DIR, INDEX_PATH
+from config import PORT, DB_FILE, FRONTEND_DIR, INDEX_PATH, SERVER_MODE, HTTP_WORKERS
 from database import init_database
-from api_handlers import OlympiadHandler
+from api_handlers import OlympiadHandler, stats_snapshot
 from websocket_server import WebSocketServer
+from http_server import create_http_server
+from db_pool import pool
+from leaderboard import leaderboard
+from static_assets import asset_store
+from matchmaking import matchmaker
+from problem_sampler import problem_sampler
+from match_timeouts import match_timeouts
+from solution_writer import solution_writer
+from sessions import session_store
 
 def start_servers():
     init_database()
+    leaderboard.load()
+    assets_count = asset_store.load()
+    problem_sampler.load()
+    expired_sessions = session_store.load()
     
     ws_server = WebSocketServer()
+    ws_server.topic_providers['stats'] = stats_snapshot
     ws_thread = threading.Thread(target=ws_server.start, daemon=True)
     ws_thread.start()
+    matchmaker.start(ws_server)
+    ws_server.on_player_left = match_timeouts.player_left
+    open_matches = match_timeouts.start(ws_server)
+    solution_writer.start(ws_server)
     
-    httpd_server = socketserver.TCPServer(
-        ("", PORT), 
+    httpd_server = create_http_server(
+        ("", PORT),
         lambda *args, **kwargs: OlympiadHandler(*args, ws_server_instance=ws_server, **kwargs)
     )
     
@@ -28,7 +45,11 @@ def start_servers():
         print(f"👑 Admin: admin / admin123")
         print(f"👤 Test user: test / test123")
         print(f"📊 Database: {DB_FILE}")
-        print(f"📁 Frontend directory: {FRONTEND_DIR}")
+        print(f"⏱️ Open matches with timers: {open_matches}")
+        print(f"🔑 Expired sessions removed: {expired_sessions}")
+        print(f"📁 Frontend directory: {FRONTEND_DIR} ({assets_count} files)")
+        if SERVER_MODE == "threaded":
+            print(f"🧵 Worker threads: {HTTP_WORKERS}")
         if not os.path.exists(INDEX_PATH):
             print(f"⚠️ File {INDEX_PATH} not found!")
         print("⚡ Press Ctrl+C to stop server\n")
@@ -38,6 +59,8 @@ def start_servers():
         except KeyboardInterrupt:
             print("\n🛑 Server stopped")
             httpd.server_close()
+            solution_writer.stop()
+            pool.close_all()
 
 if __name__ == "__main__":
     start_servers()
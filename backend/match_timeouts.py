@@ -0,0 +1,208 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from config import MATCH_WAITING_TIMEOUT, MATCH_ANSWER_DEADLINE, MATCH_DISCONNECT_GRACE
+from database import finish_match
+from db_pool import get_connection
+from leaderboard import leaderboard
+from cache import response_cache
+from scheduler import scheduler
+from ws_rooms import room_key
+
+class MatchTimeouts:
+    # Every waiting or active match has exactly one pending timer, so nothing
+    # scans the matches table periodically. Timers that fire after the match
+    # already moved on are no-ops thanks to the status checks in the UPDATEs
+    def __init__(self):
+        self.ws_server = None
+        # match_id -> user ids with a pending disconnect grace timer
+        self.grace = {}
+        self.grace_lock = threading.Lock()
+        self.expired = 0
+        self.forfeited = 0
+
+    def start(self, ws_server=None):
+        self.ws_server = ws_server
+        scheduler.start()
+        return self.recover()
+
+    def recover(self):
+        # Re-arm timers for matches left open by a previous run
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, status, started_at FROM matches WHERE status IN ('waiting', 'active')")
+        rows = cursor.fetchall()
+        conn.close()
+        
+        now = time.time()
+        for match_id, status, started_at in rows:
+            try:
+                started = datetime.strptime(started_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+            except (TypeError, ValueError):
+                started = now
+            timeout = MATCH_WAITING_TIMEOUT if status == 'waiting' else MATCH_ANSWER_DEADLINE
+            self.schedule(match_id, status, started + timeout - now)
+        return len(rows)
+
+    def schedule(self, match_id, status, delay=None):
+        match_id = room_key(match_id)
+        if status == 'waiting':
+            scheduler.call_later(MATCH_WAITING_TIMEOUT if delay is None else delay,
+                                 ('match', match_id), self.expire_waiting, match_id)
+        else:
+            scheduler.call_later(MATCH_ANSWER_DEADLINE if delay is None else delay,
+                                 ('match', match_id), self.forfeit, match_id)
+
+    def waiting(self, match_id):
+        self.schedule(match_id, 'waiting')
+
+    def started(self, match_id):
+        self.schedule(match_id, 'active')
+
+    def finished(self, match_id):
+        self.cancel(match_id)
+
+    def cancel(self, match_id):
+        match_id = room_key(match_id)
+        scheduler.cancel(('match', match_id))
+        with self.grace_lock:
+            user_ids = self.grace.pop(match_id, ())
+        for user_id in user_ids:
+            scheduler.cancel(('grace', match_id, user_id))
+
+    def player_left(self, match_id, user_id):
+        # Called on the WebSocket loop, so the match lookup is left to the
+        # scheduler thread
+        match_id, user_id = room_key(match_id), room_key(user_id)
+        scheduler.call_later(0, ('left', match_id, user_id), self.arm_grace, match_id, user_id)
+
+    def arm_grace(self, match_id, user_id):
+        # Only a player who still owes an answer can lose by leaving; spectators
+        # and players whose answer is recorded are ignored
+        if not self.owes_answer(match_id, user_id):
+            return False
+        with self.grace_lock:
+            self.grace.setdefault(match_id, set()).add(user_id)
+        scheduler.call_later(MATCH_DISCONNECT_GRACE, ('grace', match_id, user_id),
+                             self.forfeit_if_absent, match_id, user_id)
+        return True
+
+    def owes_answer(self, match_id, user_id):
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT player1_id, player2_id, player1_answer, player2_answer
+            FROM matches WHERE id = ? AND status = 'active'
+        """, (match_id,))
+        match = cursor.fetchone()
+        conn.close()
+        if not match:
+            return False
+        player1_id, player2_id, p1_answer, p2_answer = match
+        return (user_id == player1_id and p1_answer is None) or (user_id == player2_id and p2_answer is None)
+
+    def forfeit_if_absent(self, match_id, user_id):
+        if self.ws_server and self.ws_server.rooms.user_in_room(user_id, match_id):
+            return
+        self.forfeit(match_id, absent_id=user_id)
+
+    def expire_waiting(self, match_id):
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE matches SET status = 'expired', finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'waiting'
+        """, (match_id,))
+        expired = cursor.rowcount == 1
+        conn.commit()
+        conn.close()
+        
+        if expired:
+            self.expired += 1
+            self.announce(match_id, None, 'expired')
+
+    def forfeit(self, match_id, absent_id=None):
+        # Deadline (or grace period) passed: a player who answered beats one
+        # who did not; if nobody answered the match is voided without rating
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("""
+            SELECT player1_id, player2_id, player1_answer, player2_answer, status
+            FROM matches WHERE id = ?
+        """, (match_id,))
+        match = cursor.fetchone()
+        if not match or match[4] != 'active':
+            conn.close()
+            return
+        
+        player1_id, player2_id, p1_answer, p2_answer, _ = match
+        if absent_id is not None:
+            answers = {player1_id: p1_answer, player2_id: p2_answer}
+            # A spectator leaving, or a player leaving after answering, forfeits
+            # nothing; the answer deadline still settles the match
+            if absent_id not in answers or answers[absent_id] is not None:
+                conn.close()
+                return
+        opponent_id = player2_id if absent_id == player1_id else player1_id
+        if absent_id is not None and self.ws_server and self.ws_server.rooms.user_in_room(opponent_id, match_id):
+            winner_id = opponent_id
+        elif p1_answer is not None and p2_answer is None:
+            winner_id = player1_id
+        elif p2_answer is not None and p1_answer is None:
+            winner_id = player2_id
+        else:
+            winner_id = None
+        
+        if winner_id is None:
+            cursor.execute("""
+                UPDATE matches SET status = 'expired', finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'active'
+            """, (match_id,))
+            conn.commit()
+            conn.close()
+            self.expired += 1
+            self.announce(match_id, None, 'expired')
+            return
+        
+        result = finish_match(cursor, match_id, player1_id, player2_id, winner_id)
+        conn.commit()
+        leaderboard.refresh_user(cursor, player1_id)
+        leaderboard.refresh_user(cursor, player2_id)
+        conn.close()
+        response_cache.invalidate('stats', 'leaderboard')
+        self.forfeited += 1
+        self.announce(match_id, winner_id, 'forfeit', (player1_id, player2_id))
+        if result and result[2] and self.ws_server:
+            self.ws_server.send_achievements(result[2])
+
+    def announce(self, match_id, winner_id, reason, rated=()):
+        self.cancel(match_id)
+        if not self.ws_server:
+            return
+        # Also tears down the match's WebSocket room
+        self.ws_server.broadcast_to_match(match_id, {
+            'type': 'match_finished',
+            'match_id': match_id,
+            'winner_id': winner_id,
+            'reason': reason
+        })
+        self.ws_server.publish('lobby', {'event': 'match_finished', 'match_id': match_id})
+        users = []
+        for user_id in rated:
+            position = leaderboard.rank_of(user_id, 0)
+            if position:
+                users.append(position['user'])
+        if users:
+            self.ws_server.publish('leaderboard', {'event': 'rating_changed', 'users': users})
+        self.ws_server.mark_dirty('stats')
+
+    def stats(self):
+        return {
+            'expired': self.expired,
+            'forfeited': self.forfeited,
+            'timers': scheduler.stats()
+        }
+
+match_timeouts = MatchTimeouts()
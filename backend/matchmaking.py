@@ -0,0 +1,227 @@
+import threading
+import time
+
+from config import (MATCH_BUCKET_SIZE, MATCH_WINDOW_BASE, MATCH_WINDOW_GROWTH,
+                    MATCH_WINDOW_MAX, MATCH_SWEEP_INTERVAL)
+from db_pool import get_connection
+from problem_sampler import problem_sampler
+from match_timeouts import match_timeouts
+
+NO_PROBLEM_ERROR = 'Нет доступных задач'
+
+class Ticket:
+    __slots__ = ('user_id', 'rating', 'bucket', 'joined_at')
+
+    def __init__(self, user_id, rating, now):
+        self.user_id = user_id
+        self.rating = rating
+        self.bucket = rating // MATCH_BUCKET_SIZE
+        self.joined_at = now
+
+    def window(self, now):
+        return min(MATCH_WINDOW_BASE + MATCH_WINDOW_GROWTH * (now - self.joined_at), MATCH_WINDOW_MAX)
+
+class Matchmaker:
+    # Queued players live in rating buckets (dicts keep FIFO order inside a
+    # bucket), so pairing only looks at the buckets inside the rating window
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.tickets = {}
+        self.matched = {}
+        # Players whose pairing failed (no eligible problem), until they poll or requeue
+        self.failed = {}
+        self.ws_server = None
+        self.running = False
+        self.pairs_made = 0
+        self.pair_time = 0.0
+        self.max_pair_time = 0.0
+
+    def start(self, ws_server=None):
+        self.ws_server = ws_server
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        while self.running:
+            time.sleep(MATCH_SWEEP_INTERVAL)
+            try:
+                for player1, player2 in self.sweep():
+                    if self.create_match(player1, player2) is None:
+                        self.pairing_failed(player1, player2)
+            except Exception as e:
+                print(f"Matchmaking error: {e}")
+
+    def enqueue(self, user_id, rating):
+        now = time.monotonic()
+        with self.lock:
+            self.matched.pop(user_id, None)
+            self.failed.pop(user_id, None)
+            if user_id in self.tickets:
+                return None
+            ticket = Ticket(user_id, rating, now)
+            opponent = self._find_opponent(ticket, now)
+            if opponent is None:
+                self._add(ticket)
+                return None
+            self._remove(opponent)
+            self._record(now)
+        return opponent.user_id, user_id
+
+    def cancel(self, user_id):
+        with self.lock:
+            ticket = self.tickets.get(user_id)
+            if ticket is None:
+                return False
+            self._remove(ticket)
+            return True
+
+    def status(self, user_id):
+        now = time.monotonic()
+        with self.lock:
+            match_id = self.matched.pop(user_id, None)
+            if match_id is not None:
+                return {'status': 'matched', 'match_id': match_id}
+            error = self.failed.pop(user_id, None)
+            if error is not None:
+                return {'status': 'error', 'error': error}
+            ticket = self.tickets.get(user_id)
+            if ticket is None:
+                return {'status': 'idle'}
+            return {
+                'status': 'queued',
+                'waited': round(now - ticket.joined_at, 1),
+                'window': int(ticket.window(now))
+            }
+
+    def sweep(self):
+        # Windows widen while players wait; retry everyone, longest-waiting first
+        now = time.monotonic()
+        pairs = []
+        with self.lock:
+            for ticket in list(self.tickets.values()):
+                if ticket.user_id not in self.tickets:
+                    continue
+                self._remove(ticket)
+                opponent = self._find_opponent(ticket, now)
+                if opponent is None:
+                    self._add(ticket)
+                    continue
+                self._remove(opponent)
+                self._record(now)
+                pairs.append((ticket.user_id, opponent.user_id))
+        return pairs
+
+    def _record(self, start):
+        elapsed = time.monotonic() - start
+        self.pairs_made += 1
+        self.pair_time += elapsed
+        self.max_pair_time = max(self.max_pair_time, elapsed)
+
+    def _add(self, ticket):
+        self.tickets[ticket.user_id] = ticket
+        self.buckets.setdefault(ticket.bucket, {})[ticket.user_id] = ticket
+
+    def _remove(self, ticket):
+        del self.tickets[ticket.user_id]
+        bucket = self.buckets[ticket.bucket]
+        del bucket[ticket.user_id]
+        if not bucket:
+            del self.buckets[ticket.bucket]
+
+    def _find_opponent(self, ticket, now):
+        window = ticket.window(now)
+        lowest = int(ticket.rating - window) // MATCH_BUCKET_SIZE
+        highest = int(ticket.rating + window) // MATCH_BUCKET_SIZE
+        # Walk outwards from the player's own bucket so the closest ratings win
+        for distance in range(max(ticket.bucket - lowest, highest - ticket.bucket) + 1):
+            best = None
+            for index in {ticket.bucket - distance, ticket.bucket + distance}:
+                bucket = self.buckets.get(index)
+                if not bucket:
+                    continue
+                for other in bucket.values():
+                    gap = abs(other.rating - ticket.rating)
+                    if gap > max(window, other.window(now)):
+                        continue
+                    if best is None or gap < abs(best.rating - ticket.rating):
+                        best = other
+                    break
+            if best is not None:
+                return best
+        return None
+
+    def create_match(self, player1_id, player2_id):
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        problem_id = problem_sampler.sample_for_players(cursor, [player1_id, player2_id])
+        if problem_id is None:
+            conn.close()
+            return None
+        
+        cursor.execute(
+            """INSERT INTO matches (player1_id, player2_id, problem_id, status, started_at)
+               VALUES (?, ?, ?, 'active', CURRENT_TIMESTAMP)""",
+            (player1_id, player2_id, problem_id)
+        )
+        match_id = cursor.lastrowid
+        conn.commit()
+        match_timeouts.started(match_id)
+        
+        cursor.execute("""
+            SELECT m.started_at, u1.username, u2.username, p.title
+            FROM matches m
+            JOIN users u1 ON m.player1_id = u1.id
+            JOIN users u2 ON m.player2_id = u2.id
+            LEFT JOIN problems p ON m.problem_id = p.id
+            WHERE m.id = ?
+        """, (match_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        with self.lock:
+            self.matched[player1_id] = match_id
+            self.matched[player2_id] = match_id
+        
+        if self.ws_server and row:
+            self.ws_server.send_to_users((player1_id, player2_id), {
+                'type': 'match_found',
+                'match_id': match_id,
+                'player1_id': player1_id,
+                'player2_id': player2_id,
+                'player1_username': row[1],
+                'player2_username': row[2]
+            })
+            self.ws_server.publish('lobby', {'event': 'match_created', 'match': {
+                'id': match_id,
+                'status': 'active',
+                'started_at': row[0],
+                'player1': row[1],
+                'player2': row[2],
+                'problem': row[3] or 'Не выбрана'
+            }})
+        return match_id
+
+    def pairing_failed(self, *user_ids):
+        # The players already left the queue; tell them instead of leaving them waiting
+        with self.lock:
+            for user_id in user_ids:
+                self.failed[user_id] = NO_PROBLEM_ERROR
+        if self.ws_server:
+            self.ws_server.send_to_users(user_ids, {'type': 'queue_error', 'error': NO_PROBLEM_ERROR})
+
+    def stats(self):
+        with self.lock:
+            return {
+                'queued': len(self.tickets),
+                'buckets': len(self.buckets),
+                'pairs_made': self.pairs_made,
+                'avg_pair_ms': round(self.pair_time / self.pairs_made * 1000, 3) if self.pairs_made else 0,
+                'max_pair_ms': round(self.max_pair_time * 1000, 3)
+            }
+
+matchmaker = Matchmaker()
@@ -0,0 +1,138 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (PASSWORD_SCHEME, PASSWORD_BCRYPT_ROUNDS, PASSWORD_SCRYPT_LOG_N, PASSWORD_SCRYPT_R,
+                    PASSWORD_SCRYPT_P, PASSWORD_WORKERS, PASSWORD_QUEUE_MAX, PASSWORD_QUEUE_TIMEOUT,
+                    PASSWORD_LATENCY_SAMPLES)
+
+try:
+    import bcrypt
+    BCRYPT_AVAILABLE = True
+except ImportError:
+    BCRYPT_AVAILABLE = False
+    print("⚠️ bcrypt not installed. Using scrypt.")
+
+SCHEME = 'bcrypt' if PASSWORD_SCHEME == 'bcrypt' and BCRYPT_AVAILABLE else 'scrypt'
+
+def scrypt_digest(password, salt, log_n, r, p):
+    n = 1 << log_n
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=32)
+
+def b64(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+def unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def hash_password(password):
+    if SCHEME == 'bcrypt':
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(PASSWORD_BCRYPT_ROUNDS)).decode('utf-8')
+    salt = os.urandom(16)
+    digest = scrypt_digest(password, salt, PASSWORD_SCRYPT_LOG_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    return (f'$scrypt$ln={PASSWORD_SCRYPT_LOG_N},r={PASSWORD_SCRYPT_R},p={PASSWORD_SCRYPT_P}'
+            f'${b64(salt)}${b64(digest)}')
+
+def scrypt_params(hashed):
+    # '$scrypt$ln=14,r=8,p=1$<salt>$<digest>' -> ({'ln': 14, 'r': 8, 'p': 1}, salt, digest)
+    _, _, params, salt, digest = hashed.split('$')
+    params = dict(item.split('=') for item in params.split(','))
+    return {name: int(value) for name, value in params.items()}, unb64(salt), unb64(digest)
+
+def verify_password(password, hashed):
+    if hashed.startswith(('$2a$', '$2b$', '$2y$')):
+        return BCRYPT_AVAILABLE and bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    if hashed.startswith('$scrypt$'):
+        params, salt, digest = scrypt_params(hashed)
+        return hmac.compare_digest(scrypt_digest(password, salt, params['ln'], params['r'], params['p']), digest)
+    # Legacy unsalted SHA256 from installs without bcrypt
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), hashed)
+
+def needs_rehash(hashed):
+    if hashed.startswith(('$2a$', '$2b$', '$2y$')):
+        return SCHEME != 'bcrypt' or int(hashed.split('$')[2]) != PASSWORD_BCRYPT_ROUNDS
+    if hashed.startswith('$scrypt$'):
+        params = scrypt_params(hashed)[0]
+        return SCHEME != 'scrypt' or params != {'ln': PASSWORD_SCRYPT_LOG_N, 'r': PASSWORD_SCRYPT_R,
+                                                'p': PASSWORD_SCRYPT_P}
+    return True
+
+class PasswordPoolBusy(Exception):
+    pass
+
+class PasswordPool:
+    # Runs hashing on a few dedicated threads so a burst of logins cannot tie
+    # up every HTTP worker in bcrypt/scrypt (both release the GIL, so the
+    # workers really run in parallel). At most PASSWORD_QUEUE_MAX callers are
+    # queued or running; the rest give up after PASSWORD_QUEUE_TIMEOUT
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix='password')
+        self.slots = threading.BoundedSemaphore(PASSWORD_QUEUE_MAX)
+        self.lock = threading.Lock()
+        self.latencies = {'hash': deque(maxlen=PASSWORD_LATENCY_SAMPLES),
+                          'verify': deque(maxlen=PASSWORD_LATENCY_SAMPLES)}
+        self.counts = {'hash': 0, 'verify': 0}
+        self.in_flight = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def run(self, kind, func, *args):
+        start = time.perf_counter()
+        if not self.slots.acquire(timeout=PASSWORD_QUEUE_TIMEOUT):
+            with self.lock:
+                self.rejected += 1
+            raise PasswordPoolBusy()
+        with self.lock:
+            self.in_flight += 1
+        try:
+            return self.executor.submit(func, *args).result()
+        finally:
+            self.slots.release()
+            with self.lock:
+                self.in_flight -= 1
+                self.counts[kind] += 1
+                self.latencies[kind].append(time.perf_counter() - start)
+
+    def hash(self, password):
+        return self.run('hash', hash_password, password)
+
+    def verify(self, password, hashed):
+        return self.run('verify', verify_password, password, hashed)
+
+    def upgrade(self, password, hashed):
+        # New hash for a password that just verified against an outdated one, else None
+        if not needs_rehash(hashed):
+            return None
+        with self.lock:
+            self.rehashed += 1
+        return self.hash(password)
+
+    def stats(self):
+        with self.lock:
+            latencies = {kind: sorted(samples) for kind, samples in self.latencies.items()}
+            counts = dict(self.counts)
+            stats = {
+                'scheme': SCHEME,
+                'bcrypt_rounds': PASSWORD_BCRYPT_ROUNDS,
+                'scrypt_log_n': PASSWORD_SCRYPT_LOG_N,
+                'workers': PASSWORD_WORKERS,
+                'queue_max': PASSWORD_QUEUE_MAX,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+            }
+        for kind, samples in latencies.items():
+            # Latency includes the time spent waiting for a worker
+            stats[kind] = {'count': counts[kind]}
+            for name, quantile in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+                stats[kind][name] = round(samples[int(quantile * (len(samples) - 1))] * 1000, 2) if samples else 0
+            stats[kind]['max_ms'] = round(samples[-1] * 1000, 2) if samples else 0
+        return stats
+
+password_pool = PasswordPool()
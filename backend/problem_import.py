@@ -0,0 +1,194 @@
+import csv
+import io
+import json
+
+from config import IMPORT_BATCH_SIZE, IMPORT_MAX_ERRORS
+from database import title_hash, split_tags
+
+FIELDS = ('title', 'description', 'answer', 'difficulty', 'category', 'tags')
+
+class RequestBody(io.RawIOBase):
+    # Reads exactly the request body from rfile, either Content-Length bytes
+    # or a chunked stream, without ever holding more than one read in memory
+    def __init__(self, rfile, headers):
+        self.rfile = rfile
+        self.chunked = 'chunked' in headers.get('Transfer-Encoding', '').lower()
+        self.remaining = 0 if self.chunked else int(headers.get('Content-Length', 0) or 0)
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.finished:
+            return 0
+        if self.chunked and self.remaining == 0:
+            size_line = self.rfile.readline(1024)
+            self.remaining = int(size_line.split(b';')[0].strip() or b'0', 16)
+            if self.remaining == 0:
+                # Trailer section ends with an empty line
+                while self.rfile.readline(1024) not in (b'\r\n', b'\n', b''):
+                    pass
+                self.finished = True
+                return 0
+        if self.remaining == 0:
+            self.finished = True
+            return 0
+        data = self.rfile.read(min(len(buffer), self.remaining))
+        if not data:
+            self.finished = True
+            return 0
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        if self.chunked and self.remaining == 0:
+            self.rfile.readline(1024)
+        return len(data)
+
+    def text(self):
+        return io.TextIOWrapper(io.BufferedReader(self, 64 * 1024), encoding='utf-8', newline='')
+
+def jsonl_records(stream):
+    for row, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield row, None, 'Expected a JSON object'
+            continue
+        yield row, record, None
+
+def csv_records(stream):
+    reader = csv.DictReader(stream)
+    missing = [field for field in ('title', 'description', 'answer') if field not in (reader.fieldnames or [])]
+    if missing:
+        yield 1, None, f"Missing CSV columns: {', '.join(missing)}"
+        return
+    # Row numbers count the header line, so they match what an editor shows
+    for record in reader:
+        yield reader.line_num, record, None
+
+def list_records(problems):
+    for row, record in enumerate(problems, 1):
+        if not isinstance(record, dict):
+            yield row, None, 'Expected an object'
+            continue
+        yield row, record, None
+
+def validate(record):
+    title = str(record.get('title') or '').strip()
+    description = str(record.get('description') or '').strip()
+    answer = str(record.get('answer') if record.get('answer') is not None else '').strip()
+    if not title or not description or not answer:
+        return None, 'title, description and answer are required'
+    
+    difficulty = record.get('difficulty') or 1
+    try:
+        difficulty = int(difficulty)
+    except (TypeError, ValueError):
+        return None, f'Invalid difficulty: {difficulty!r}'
+    if difficulty not in (1, 2, 3):
+        return None, f'Difficulty must be 1, 2 or 3, got {difficulty}'
+    
+    category = str(record.get('category') or 'Математика').strip()
+    tags = ','.join(split_tags(record.get('tags')))
+    return (title, description, answer, difficulty, category, tags, title_hash(title)), None
+
+class ProblemImporter:
+    # Validates records as they stream in and writes them in executemany
+    # batches, each batch in its own transaction. Titles are deduplicated
+    # against the database (through the title_hash index) and within the upload
+    def __init__(self, conn, user_id):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.user_id = user_id
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row, message):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({'row': row, 'error': message})
+
+    def run(self, records):
+        batch = []
+        for row, record, problem in self.validated(records):
+            batch.append((row, problem))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+        return self.report()
+
+    def validated(self, records):
+        for row, record, parse_error in records:
+            self.rows += 1
+            if parse_error:
+                self.error(row, parse_error)
+                continue
+            problem, validation_error = validate(record)
+            if validation_error:
+                self.error(row, validation_error)
+                continue
+            yield row, record, problem
+
+    def write(self, batch):
+        cursor = self.cursor
+        cursor.execute("BEGIN IMMEDIATE")
+        
+        hashes = list({problem[6] for _, problem in batch})
+        cursor.execute(
+            f"SELECT title_hash FROM problems WHERE title_hash IN ({','.join('?' * len(hashes))})",
+            hashes
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        
+        # Earlier batches are already committed, so the lookup above covers
+        # them and only this batch needs an in-memory set
+        rows = []
+        for row, problem in batch:
+            if problem[6] in existing:
+                self.duplicates += 1
+                if len(self.errors) < IMPORT_MAX_ERRORS:
+                    self.errors.append({'row': row, 'error': 'Duplicate title', 'duplicate': True})
+                continue
+            existing.add(problem[6])
+            rows.append(problem + (self.user_id,))
+        
+        if rows:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM problems")
+            last_id = cursor.fetchone()[0]
+            cursor.executemany(
+                """INSERT INTO problems (title, description, answer, difficulty, category, tags, title_hash, created_by)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+            # The write lock is held, so this batch got the ids right after last_id
+            cursor.execute("SELECT id, tags FROM problems WHERE id > ? ORDER BY id", (last_id,))
+            links = [(problem_id, name) for problem_id, tags in cursor.fetchall() for name in split_tags(tags)]
+            if links:
+                cursor.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", {(name,) for _, name in links})
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO problem_tags (problem_id, tag_id) SELECT ?, id FROM tags WHERE name = ?",
+                    links
+                )
+        
+        self.conn.commit()
+        self.imported += len(rows)
+
+    def report(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+            'errors_truncated': self.failed + self.duplicates > len(self.errors)
+        }
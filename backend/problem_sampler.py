@@ -0,0 +1,162 @@
+import random
+import threading
+
+from config import PROBLEM_DIFFICULTY_WEIGHTS, PROBLEM_SAMPLE_ATTEMPTS
+from db_pool import get_connection
+
+class ProblemSampler:
+    # Problem ids grouped by (category, difficulty). Each group is a plain
+    # list plus an id -> slot map, so adds and removals are O(1) swap-removes
+    # and a draw is one weighted group choice plus one random index
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+        self.slots = {}
+        self.loaded = False
+
+    def load(self):
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, category, difficulty FROM problems")
+        rows = cursor.fetchall()
+        conn.close()
+        
+        with self.lock:
+            self.pools = {}
+            self.slots = {}
+            for row in rows:
+                self._put(*row)
+            self.loaded = True
+        return len(rows)
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def put(self, problem_id, category, difficulty):
+        with self.lock:
+            if self.loaded:
+                self._put(int(problem_id), category, difficulty)
+
+    def discard(self, problem_id):
+        with self.lock:
+            self._discard(int(problem_id))
+
+    def _put(self, problem_id, category, difficulty):
+        try:
+            difficulty = int(difficulty)
+        except (TypeError, ValueError):
+            difficulty = 1
+        key = (category, difficulty)
+        if self.slots.get(problem_id, (None,))[0] == key:
+            return
+        self._discard(problem_id)
+        pool = self.pools.setdefault(key, [])
+        self.slots[problem_id] = (key, len(pool))
+        pool.append(problem_id)
+
+    def _discard(self, problem_id):
+        slot = self.slots.pop(problem_id, None)
+        if slot is None:
+            return
+        key, index = slot
+        pool = self.pools[key]
+        last = pool.pop()
+        if last != problem_id:
+            pool[index] = last
+            self.slots[last] = (key, index)
+        if not pool:
+            del self.pools[key]
+
+    def _groups(self, category, difficulty, weights):
+        keys = []
+        totals = []
+        for key, pool in self.pools.items():
+            if category is not None and key[0] != category:
+                continue
+            if difficulty is not None and key[1] != difficulty:
+                continue
+            weight = len(pool) * weights.get(key[1], 1.0)
+            if weight > 0:
+                keys.append(key)
+                totals.append(weight)
+        return keys, totals
+
+    def sample(self, seen=(), category=None, difficulty=None, weights=None):
+        self.ensure_loaded()
+        weights = weights or PROBLEM_DIFFICULTY_WEIGHTS
+        with self.lock:
+            keys, totals = self._groups(category, difficulty, weights)
+            if not keys:
+                return None
+            
+            # Players usually have seen a small share of the bank, so a few
+            # rejected draws are much cheaper than building the unseen set
+            for _ in range(PROBLEM_SAMPLE_ATTEMPTS):
+                pool = self.pools[random.choices(keys, totals)[0]]
+                problem_id = pool[random.randrange(len(pool))]
+                if problem_id not in seen:
+                    return problem_id
+            
+            unseen = {}
+            for key in keys:
+                ids = [problem_id for problem_id in self.pools[key] if problem_id not in seen]
+                if ids:
+                    unseen[key] = ids
+            if not unseen:
+                # Both players have seen everything that matches; allow repeats
+                pool = self.pools[random.choices(keys, totals)[0]]
+                return pool[random.randrange(len(pool))]
+            
+            keys = list(unseen)
+            totals = [len(unseen[key]) * weights.get(key[1], 1.0) for key in keys]
+            return random.choice(unseen[random.choices(keys, totals)[0]])
+
+    def sample_for_players(self, cursor, user_ids, category=None, difficulty=None):
+        user_ids = [user_id for user_id in user_ids if user_id is not None]
+        seen = set()
+        if user_ids:
+            cursor.execute(
+                f"SELECT DISTINCT problem_id FROM solutions WHERE user_id IN ({','.join('?' * len(user_ids))})",
+                user_ids
+            )
+            seen = {row[0] for row in cursor.fetchall()}
+        return self.sample(seen, category, difficulty)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'problems': len(self.slots),
+                'groups': len(self.pools)
+            }
+
+problem_sampler = ProblemSampler()
+
+if __name__ == '__main__':
+    import time
+    
+    sampler = ProblemSampler()
+    sampler.loaded = True
+    categories = ['Математика', 'Информатика', 'Физика', 'Логика']
+    for problem_id in range(1, 100001):
+        sampler._put(problem_id, random.choice(categories), random.randint(1, 3))
+    seen = set(random.sample(range(1, 100001), 500))
+    
+    draws = 100000
+    start = time.perf_counter()
+    for _ in range(draws):
+        sampler.sample(seen)
+    elapsed = time.perf_counter() - start
+    print(f"100k problems, 500 seen: {elapsed / draws * 1e6:.2f} us per draw")
+    
+    start = time.perf_counter()
+    for _ in range(draws):
+        sampler.sample(seen, category='Физика', difficulty=3)
+    elapsed = time.perf_counter() - start
+    print(f"filtered by category and difficulty: {elapsed / draws * 1e6:.2f} us per draw")
+    
+    start = time.perf_counter()
+    for problem_id in range(1, 1001):
+        sampler._discard(problem_id)
+        sampler._put(problem_id, 'Логика', 2)
+    print(f"re-categorise: {(time.perf_counter() - start) / 1000 * 1e6:.2f} us per problem")
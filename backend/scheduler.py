@@ -0,0 +1,78 @@
+import heapq
+import itertools
+import threading
+import time
+
+class TimerScheduler:
+    # One thread sleeping until the earliest deadline in a heap. Timers are
+    # keyed, so re-scheduling a key replaces its previous timer; cancelled
+    # entries stay in the heap and are skipped when they come up
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap = []
+        self.timers = {}
+        self.counter = itertools.count()
+        self.running = False
+        self.fired = 0
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def call_later(self, delay, key, callback, *args):
+        when = time.monotonic() + max(delay, 0)
+        with self.cond:
+            self._cancel(key)
+            entry = [when, next(self.counter), key, callback, args]
+            self.timers[key] = entry
+            heapq.heappush(self.heap, entry)
+            if self.heap[0] is entry:
+                self.cond.notify()
+
+    def cancel(self, key):
+        with self.cond:
+            self._cancel(key)
+
+    def _cancel(self, key):
+        entry = self.timers.pop(key, None)
+        if entry is not None:
+            entry[3] = None
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running:
+                    if not self.heap:
+                        self.cond.wait()
+                        continue
+                    delay = self.heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self.cond.wait(delay)
+                if not self.running:
+                    return
+                when, _, key, callback, args = heapq.heappop(self.heap)
+                if callback is None:
+                    continue
+                del self.timers[key]
+                self.fired += 1
+            
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Timer error: {e}")
+
+    def stats(self):
+        with self.cond:
+            return {
+                'pending': len(self.timers),
+                'heap_size': len(self.heap),
+                'fired': self.fired
+            }
+
+scheduler = TimerScheduler()
@@ -0,0 +1,204 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from config import SESSION_TTL, SESSION_CACHE_SIZE, SESSION_SECRET_FILE, SESSION_COOKIE
+from db_pool import get_connection
+
+def load_secret(path):
+    # Created once with owner-only permissions; deleting the file signs everyone out
+    try:
+        with open(path, 'rb') as f:
+            secret = f.read()
+        if len(secret) >= 32:
+            return secret
+    except FileNotFoundError:
+        pass
+    secret = secrets.token_bytes(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(secret)
+    return secret
+
+class Session:
+    __slots__ = ('session_id', 'user_id', 'username', 'role', 'expires_at')
+
+    def __init__(self, session_id, user_id, username, role, expires_at):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.username = username
+        self.role = role
+        self.expires_at = expires_at
+
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
+class SessionStore:
+    # Tokens are '<session id>.<expiry>.<hmac>'. The signature and expiry are
+    # checked first, so forged or stale tokens never reach the database; valid
+    # ones are resolved through an LRU of sessions and only a cache miss reads
+    # the sessions table. Revoking drops both the rows and the cached entries
+    def __init__(self):
+        self.secret = None
+        self.cache = OrderedDict()
+        self.by_user = {}
+        # Bumped on every revocation so a lookup that read the database before
+        # the revocation committed does not put the session back in the cache
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.revoked = 0
+
+    def load(self):
+        self.secret = load_secret(SESSION_SECRET_FILE)
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM sessions WHERE expires_at < ?", (int(time.time()),))
+        removed = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return removed
+
+    def sign(self, payload):
+        digest = hmac.new(self.secret, payload.encode('ascii'), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:24]).decode('ascii')
+
+    def create(self, cursor, user_id, username, role):
+        # The caller commits, together with its own last_login update
+        session_id = secrets.token_urlsafe(16)
+        expires_at = int(time.time()) + SESSION_TTL
+        cursor.execute(
+            "INSERT INTO sessions (id, user_id, expires_at) VALUES (?, ?, ?)",
+            (session_id, user_id, expires_at)
+        )
+        self.remember(Session(session_id, user_id, username, role, expires_at))
+        payload = f'{session_id}.{expires_at}'
+        return f'{payload}.{self.sign(payload)}'
+
+    def remember(self, session, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.cache[session.session_id] = session
+            self.cache.move_to_end(session.session_id)
+            self.by_user.setdefault(session.user_id, set()).add(session.session_id)
+            while len(self.cache) > SESSION_CACHE_SIZE:
+                _, evicted = self.cache.popitem(last=False)
+                self.unindex(evicted)
+
+    def unindex(self, session):
+        ids = self.by_user.get(session.user_id)
+        if ids:
+            ids.discard(session.session_id)
+            if not ids:
+                del self.by_user[session.user_id]
+
+    def resolve(self, token):
+        session_id = self.check(token)
+        if session_id is None:
+            return None
+        return self.cached(session_id) or self.fetch(session_id)
+
+    def check(self, token):
+        # The session id of a well-formed, correctly signed, unexpired token
+        if not isinstance(token, str) or not token or not token.isascii():
+            return None
+        parts = token.split('.')
+        if len(parts) != 3 or not parts[1].isdigit():
+            return None
+        session_id, expires_at, signature = parts
+        if (not hmac.compare_digest(self.sign(f'{session_id}.{expires_at}'), signature)
+                or int(expires_at) <= time.time()):
+            with self.lock:
+                self.rejected += 1
+            return None
+        return session_id
+
+    def cached(self, session_id):
+        with self.lock:
+            session = self.cache.get(session_id)
+            if session:
+                self.cache.move_to_end(session_id)
+                self.hits += 1
+            return session
+
+    def fetch(self, session_id):
+        # Reads the database, so the WebSocket loop calls it from a worker thread
+        with self.lock:
+            self.misses += 1
+            generation = self.generation
+
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT s.user_id, u.username, u.role, s.expires_at
+            FROM sessions s
+            JOIN users u ON u.id = s.user_id
+            WHERE s.id = ?
+        """, (session_id,))
+        row = cursor.fetchone()
+        conn.close()
+
+        if not row or row[3] <= time.time():
+            return None
+        session = Session(session_id, row[0], row[1], row[2], row[3])
+        self.remember(session, generation)
+        return session
+
+    def revoke(self, session_id):
+        self.delete("DELETE FROM sessions WHERE id = ?", session_id)
+        with self.lock:
+            session = self.cache.pop(session_id, None)
+            if session:
+                self.unindex(session)
+            self.generation += 1
+            self.revoked += 1
+
+    def revoke_user(self, user_id):
+        self.delete("DELETE FROM sessions WHERE user_id = ?", user_id)
+        with self.lock:
+            for session_id in self.by_user.pop(user_id, ()):
+                self.cache.pop(session_id, None)
+            self.generation += 1
+            self.revoked += 1
+
+    def delete(self, query, key):
+        # Committed before the cache is touched, so a miss after eviction
+        # can no longer find the row
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, (key,))
+        conn.commit()
+        conn.close()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'cached': len(self.cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups * 100, 2) if lookups else 0,
+                'rejected': self.rejected,
+                'revoked': self.revoked,
+            }
+
+def token_from_headers(headers):
+    auth = headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        return auth[7:].strip()
+    for part in headers.get('Cookie', '').split(';'):
+        name, _, value = part.strip().partition('=')
+        if name == SESSION_COOKIE:
+            return value
+    return None
+
+session_store = SessionStore()
@@ -0,0 +1,203 @@
+import queue
+import threading
+import time
+
+from config import (SOLUTION_WRITE_BEHIND, SOLUTION_ACK, SOLUTION_SYNCHRONOUS, SOLUTION_BATCH_SIZE,
+                    SOLUTION_FLUSH_INTERVAL, SOLUTION_QUEUE_MAX)
+from database import record_solution
+from db_pool import get_connection, pool
+from leaderboard import leaderboard
+from cache import response_cache
+
+class AnswerCache:
+    # problem id -> (normalised answer, difficulty), so grading needs no query
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.answers = {}
+        # Bumped by invalidate() so a read that raced with an edit is not stored
+        self.invalidations = 0
+
+    def get(self, problem_id):
+        with self.lock:
+            cached = self.answers.get(problem_id)
+            generation = self.invalidations
+        if cached is not None:
+            return cached
+        
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT answer, difficulty FROM problems WHERE id = ?", (problem_id,))
+        row = cursor.fetchone()
+        conn.close()
+        if not row:
+            return None
+        
+        cached = (str(row[0]).strip().lower(), row[1])
+        with self.lock:
+            if generation == self.invalidations:
+                self.answers[problem_id] = cached
+        return cached
+
+    def invalidate(self, problem_id=None):
+        with self.lock:
+            self.invalidations += 1
+            if problem_id is None:
+                self.answers.clear()
+            else:
+                self.answers.pop(int(problem_id), None)
+
+class PendingSolution:
+    __slots__ = ('args', 'done', 'error')
+
+    def __init__(self, args, wait):
+        self.args = args
+        self.done = threading.Event() if wait else None
+        self.error = None
+
+class SolutionWriter:
+    # Single writer thread: takes whatever is queued (up to SOLUTION_BATCH_SIZE,
+    # waiting at most SOLUTION_FLUSH_INTERVAL for more) and persists it in one
+    # transaction, so a burst of submissions costs one commit instead of one each
+    def __init__(self):
+        self.enabled = SOLUTION_WRITE_BEHIND
+        self.queue = queue.Queue(maxsize=SOLUTION_QUEUE_MAX)
+        self.thread = None
+        self.ws_server = None
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.max_batch = 0
+        self.commit_time = 0.0
+
+    def start(self, ws_server=None):
+        self.ws_server = ws_server
+        if not self.enabled:
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, user_id, problem_id, answer, is_correct, time_spent, difficulty):
+        pending = PendingSolution(
+            (user_id, problem_id, answer, is_correct, time_spent, difficulty),
+            SOLUTION_ACK == "committed"
+        )
+        # Blocks when the queue is full, which pushes back on submitters
+        self.queue.put(pending)
+        if pending.done is not None:
+            pending.done.wait()
+        return pending.error is None
+
+    def stop(self, timeout=10):
+        # Flush whatever is queued, then let the writer exit
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def run(self):
+        conn = pool.dedicated()
+        conn.execute(f"PRAGMA synchronous={'FULL' if SOLUTION_SYNCHRONOUS == 'FULL' else 'NORMAL'}")
+        stopping = False
+        while not stopping:
+            first = self.queue.get()
+            if first is None:
+                break
+            batch = [first]
+            # Callers waiting for the commit should not also wait for the
+            # window: whatever queues up during this commit forms the next batch
+            linger = SOLUTION_FLUSH_INTERVAL if SOLUTION_ACK != "committed" else 0
+            deadline = time.monotonic() + linger
+            while len(batch) < SOLUTION_BATCH_SIZE:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self.write_batch(conn, batch)
+            except Exception as e:
+                # Keep the writer alive: anyone still waiting on this batch
+                # gets a failure instead of blocking forever
+                print(f"Solution batch failed: {e}")
+                self.fail_batch(conn, batch, e)
+        conn.close()
+
+    def write_batch(self, conn, batch):
+        start = time.monotonic()
+        cursor = conn.cursor()
+        earned = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for pending in batch:
+                earned += record_solution(cursor, *pending.args)
+            conn.commit()
+        except Exception as e:
+            # One bad row must not lose the whole batch: retry them one by one
+            conn.rollback()
+            print(f"Solution batch failed, retrying individually: {e}")
+            earned = []
+            for pending in batch:
+                try:
+                    cursor.execute("BEGIN IMMEDIATE")
+                    achievements = record_solution(cursor, *pending.args)
+                    conn.commit()
+                    earned += achievements
+                except Exception as e:
+                    conn.rollback()
+                    pending.error = e
+                    self.failed += 1
+        
+        user_ids = {pending.args[0] for pending in batch if pending.error is None}
+        for user_id in user_ids:
+            leaderboard.refresh_user(cursor, user_id)
+        response_cache.invalidate('stats', 'leaderboard')
+        
+        self.batches += 1
+        self.written += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        self.commit_time += time.monotonic() - start
+        for pending in batch:
+            if pending.done is not None:
+                pending.done.set()
+        
+        if self.ws_server:
+            users = []
+            for user_id in user_ids:
+                position = leaderboard.rank_of(user_id, 0)
+                if position:
+                    users.append(position['user'])
+            if users:
+                self.ws_server.publish('leaderboard', {'event': 'rating_changed', 'users': users})
+            self.ws_server.mark_dirty('stats')
+            if earned:
+                self.ws_server.send_achievements(earned)
+
+    def fail_batch(self, conn, batch, error):
+        if conn.in_transaction:
+            conn.rollback()
+        for pending in batch:
+            if pending.done is not None and pending.done.is_set():
+                continue
+            if pending.error is None:
+                pending.error = error
+                self.failed += 1
+            if pending.done is not None:
+                pending.done.set()
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'pending': self.queue.qsize(),
+            'batches': self.batches,
+            'written': self.written,
+            'failed': self.failed,
+            'max_batch': self.max_batch,
+            'avg_batch_ms': round(self.commit_time / self.batches * 1000, 3) if self.batches else 0
+        }
+
+answer_cache = AnswerCache()
+solution_writer = SolutionWriter()
@@ -0,0 +1,185 @@
+import os
+import mimetypes
+import threading
+import hashlib
+
+from config import FRONTEND_DIR, STATIC_DEV_MODE, SENDFILE_MIN_SIZE
+from http_cache import make_etag, is_compressible, compress, BROTLI_AVAILABLE
+
+# Placeholders in index.html and the component inlined into each of them
+PAGE_COMPONENTS = {
+    'header-component': 'components/header.html',
+    'nav-tabs-component': 'components/nav_tabs.html',
+    'auth-panel-component': 'components/auth.html',
+    'problems-panel-component': 'components/problems.html',
+    'pvp-panel-component': 'components/pvp.html',
+    'stats-panel-component': 'components/stats.html',
+    'leaderboard-panel-component': 'components/leaderboard.html',
+    'profile-panel-component': 'components/profile.html',
+    'admin-panel-component': 'components/admin.html',
+    'modal-overlay-component': 'components/modals.html',
+}
+PAGE_ASSETS = ('/style.css', '/script.js')
+
+class Asset:
+    def __init__(self, url_path, filename):
+        self.url_path = url_path
+        self.filename = filename
+        self.load()
+
+    def load(self):
+        stat = os.stat(self.filename)
+        self.mtime = stat.st_mtime
+        self.mtime_ns = stat.st_mtime_ns
+        self.length = stat.st_size
+        self.content_type = mimetypes.guess_type(self.filename)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type == 'application/javascript':
+            self.content_type += '; charset=utf-8'
+        
+        self.variants = {}
+        if self.length >= SENDFILE_MIN_SIZE and not is_compressible(self.content_type):
+            # Large binary files stay on disk and go out through socket.sendfile
+            self.content = None
+            digest = hashlib.blake2b(digest_size=12)
+            with open(self.filename, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            self.etag = 'W/"' + digest.hexdigest() + '"'
+        else:
+            with open(self.filename, 'rb') as f:
+                self.set_content(f.read())
+        self.fingerprint = self.etag[3:13]
+
+    def set_content(self, content):
+        self.content = content
+        self.length = len(content)
+        self.etag = make_etag(content)
+        if is_compressible(self.content_type):
+            self.variants['gzip'] = compress(content, 'gzip', best=True)
+            if BROTLI_AVAILABLE:
+                self.variants['br'] = compress(content, 'br', best=True)
+
+    def reloaded(self):
+        return Asset(self.url_path, self.filename)
+
+    def is_stale(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return True
+        return stat.st_mtime_ns != self.mtime_ns or stat.st_size != self.length
+
+class PageAsset(Asset):
+    # index.html with every component inlined and fingerprinted script/style
+    # URLs, so the first paint needs a single request
+    def __init__(self, url_path, filename, root, url_for):
+        self.root = root
+        self.url_for = url_for
+        super().__init__(url_path, filename)
+
+    def load(self):
+        sources = [self.filename] + [os.path.join(self.root, path) for path in PAGE_COMPONENTS.values()]
+        sources += [os.path.join(self.root, path.lstrip('/')) for path in PAGE_ASSETS]
+        self.sources = {filename: os.stat(filename).st_mtime_ns for filename in sources if os.path.exists(filename)}
+        self.mtime = max(self.sources.values()) / 1e9
+        self.content_type = 'text/html; charset=utf-8'
+        self.variants = {}
+        
+        with open(self.filename, encoding='utf-8') as f:
+            html = f.read()
+        for element_id, path in PAGE_COMPONENTS.items():
+            try:
+                with open(os.path.join(self.root, path), encoding='utf-8') as f:
+                    component = f.read()
+            except OSError:
+                continue
+            html = html.replace(f'<div id="{element_id}"></div>', f'<div id="{element_id}">{component}</div>')
+        for path in PAGE_ASSETS:
+            name = path.lstrip('/')
+            html = html.replace(f'"{name}"', f'"{self.url_for(path)}"')
+        
+        self.set_content(html.encode('utf-8'))
+        self.fingerprint = self.etag[3:13]
+
+    def is_stale(self):
+        for filename, mtime_ns in self.sources.items():
+            try:
+                if os.stat(filename).st_mtime_ns != mtime_ns:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def reloaded(self):
+        return PageAsset(self.url_path, self.filename, self.root, self.url_for)
+
+class AssetStore:
+    def __init__(self, root=FRONTEND_DIR, dev_mode=STATIC_DEV_MODE):
+        self.root = os.path.realpath(root)
+        self.dev_mode = dev_mode
+        self.assets = {}
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        assets = {}
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                filename = os.path.join(directory, name)
+                url_path = '/' + os.path.relpath(filename, self.root).replace(os.sep, '/')
+                try:
+                    assets[url_path] = Asset(url_path, filename)
+                except OSError as e:
+                    print(f"⚠️ Cannot load asset {filename}: {e}")
+        with self.lock:
+            self.assets = assets
+            self.loaded = True
+        
+        if '/index.html' in assets:
+            page = PageAsset('/index.html', assets['/index.html'].filename, self.root, self.url_for)
+            with self.lock:
+                self.assets['/index.html'] = page
+        return len(assets)
+
+    def resolve(self, url_path):
+        # Only used in dev mode: map a request path to a file strictly inside root
+        filename = os.path.realpath(os.path.join(self.root, url_path.lstrip('/')))
+        if os.path.commonpath([filename, self.root]) != self.root or not os.path.isfile(filename):
+            return None
+        return filename
+
+    def get(self, url_path):
+        if not self.loaded:
+            self.load()
+        
+        with self.lock:
+            asset = self.assets.get(url_path)
+        
+        if not self.dev_mode:
+            return asset
+        
+        if asset is not None and asset.is_stale():
+            try:
+                asset = asset.reloaded()
+            except OSError:
+                with self.lock:
+                    self.assets.pop(url_path, None)
+                return None
+            with self.lock:
+                self.assets[url_path] = asset
+        elif asset is None:
+            filename = self.resolve(url_path)
+            if filename is None:
+                return None
+            asset = Asset(url_path, filename)
+            with self.lock:
+                self.assets[url_path] = asset
+        return asset
+
+    def url_for(self, url_path):
+        asset = self.get(url_path)
+        if asset is None:
+            return url_path
+        return f"{url_path}?v={asset.fingerprint}"
+
+asset_store = AssetStore()
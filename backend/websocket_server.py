@@ -1,95 +1,293 @@
 import socket
+import selectors
 import threading
 import json
 import base64
 import hashlib
 import time
-import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-from config import DB_FILE
+from config import (
+    WS_BACKLOG, WS_PING_INTERVAL, WS_IDLE_TIMEOUT, WS_HANDSHAKE_TIMEOUT,
+    WS_MAX_MESSAGE_SIZE, WS_READ_PAUSE_BUFFER, WS_MAX_WRITE_BUFFER,
+    WS_BROADCAST_DROP_BUFFER
+)
+from ws_rooms import RoomRegistry
+from sessions import session_store
+from ws_frames import FrameParser, ProtocolError, encode_frame, OP_TEXT, OP_CLOSE, OP_PING, OP_PONG
+
+TOPICS = ('lobby', 'leaderboard', 'stats')
+
+class Connection:
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.inbuf = bytearray()
+        self.parser = FrameParser(WS_MAX_MESSAGE_SIZE)
+        self.outbuf = deque()
+        self.out_offset = 0
+        self.out_size = 0
+        self.handshake_done = False
+        self.closing = False
+        self.closed = False
+        self.reading = True
+        self.events = selectors.EVENT_READ
+        self.last_activity = time.monotonic()
+        self.ping_pending = False
 
 class WebSocketServer:
     def __init__(self, host='localhost', port=8765):
         self.host = host
         self.port = port
-        self.clients = {}
-        self.match_broadcasters = {}
-        
+        self.rooms = RoomRegistry()
+        self.connections = set()
+        self.selector = selectors.DefaultSelector()
+        self.pending = deque()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        self.wakeup_w.setblocking(False)
+        self.loop_thread_id = None
+        self.running = False
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.topic_providers = {}
+        self.on_player_left = None
+        self.dirty_topics = set()
+        # Snapshots run database queries, so they are built off the loop thread
+        self.snapshot_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ws-snapshot')
+        self.building_topics = set()
+        # Session cache misses read the sessions table, also off the loop
+        self.auth_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ws-auth')
+        self.handoffs = 0
+        self.max_pending = 0
+        self.handoff_wait = 0.0
+        self.max_handoff_wait = 0.0
+    
     def start(self):
         server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server.bind((self.host, self.port))
-        server.listen(5)
+        server.listen(WS_BACKLOG)
+        server.setblocking(False)
         print(f"🔥 WebSocket сервер запущен на ws://{self.host}:{self.port}")
         
+        self.selector.register(server, selectors.EVENT_READ, self.accept)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ, self.run_pending)
+        self.loop_thread_id = threading.get_ident()
+        self.running = True
+        
+        next_check = time.monotonic() + 1
+        while self.running:
+            timeout = max(next_check - time.monotonic(), 0)
+            for key, mask in self.selector.select(timeout):
+                if isinstance(key.data, Connection):
+                    conn = key.data
+                    if mask & selectors.EVENT_READ:
+                        self.on_readable(conn)
+                    if mask & selectors.EVENT_WRITE and not conn.closed:
+                        self.flush(conn)
+                else:
+                    key.data(key.fileobj)
+            
+            if time.monotonic() >= next_check:
+                self.check_keepalive()
+                self.publish_dirty_topics()
+                next_check = time.monotonic() + 1
+        
+        for conn in list(self.connections):
+            self.close_connection(conn)
+        self.snapshot_executor.shutdown(wait=False)
+        self.auth_executor.shutdown(wait=False)
+        self.selector.unregister(server)
+        server.close()
+    
+    def stop(self):
+        self.call_soon(setattr, self, 'running', False)
+    
+    def call_soon(self, callback, *args):
+        # Connection state is owned by the event loop thread; HTTP handler
+        # threads hand their work over instead of touching sockets directly
+        if threading.get_ident() == self.loop_thread_id:
+            callback(*args)
+            return
+        self.pending.append((callback, args, time.perf_counter()))
+        try:
+            self.wakeup_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+    
+    def run_pending(self, sock):
+        try:
+            while sock.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        self.max_pending = max(self.max_pending, len(self.pending))
+        while self.pending:
+            callback, args, queued_at = self.pending.popleft()
+            waited = time.perf_counter() - queued_at
+            self.handoffs += 1
+            self.handoff_wait += waited
+            self.max_handoff_wait = max(self.max_handoff_wait, waited)
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"WebSocket error: {e}")
+    
+    def accept(self, server):
         while True:
-            client, addr = server.accept()
-            threading.Thread(target=self.handle_client, args=(client,)).start()
+            try:
+                sock, addr = server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = Connection(sock, addr)
+            self.connections.add(conn)
+            self.selector.register(sock, selectors.EVENT_READ, conn)
     
-    def handle_client(self, client):
+    def on_readable(self, conn):
         try:
-            data = client.recv(1024).decode()
-            if 'Sec-WebSocket-Key' in data:
-                key_line = [line for line in data.split('\r\n') if 'Sec-WebSocket-Key:' in line][0]
-                key = key_line.split(': ')[1]
-                
-                accept_key = base64.b64encode(
-                    hashlib.sha1((key + '258EAFA5-E914-47DA-95CA-C5AB0DC85B11').encode()).digest()
-                ).decode()
-                
-                response = (
-                    "HTTP/1.1 101 Switching Protocols\r\n"
-                    "Upgrade: websocket\r\n"
-                    "Connection: Upgrade\r\n"
-                    f"Sec-WebSocket-Accept: {accept_key}\r\n\r\n"
-                )
-                client.send(response.encode())
-                
-                while True:
-                    try:
-                        msg = self.receive_message(client)
-                        if msg:
-                            self.process_message(client, msg)
-                    except:
-                        break
-        except Exception as e:
-            print(f"WebSocket error: {e}")
-        finally:
-            self.remove_client(client)
+            data = conn.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        
+        if not data:
+            self.close_connection(conn)
+            return
+        
+        conn.last_activity = time.monotonic()
+        conn.ping_pending = False
+        
+        if not conn.handshake_done:
+            conn.inbuf += data
+            if not self.handle_handshake(conn):
+                return
+            data = bytes(conn.inbuf)
+            conn.inbuf.clear()
+        
+        if conn.closing:
+            return
+        
+        try:
+            messages = conn.parser.feed(data)
+        except ProtocolError as e:
+            self.send_close(conn, e.code)
+            return
+        
+        for opcode, payload in messages:
+            if conn.closed or conn.closing:
+                break
+            if opcode == OP_TEXT:
+                # A bad message costs only its own connection, never the loop
+                try:
+                    self.process_message(conn, payload)
+                except Exception as e:
+                    print(f"WebSocket error: {e}")
+                    self.send_close(conn, 1011)
+            elif opcode == OP_PING:
+                self.queue_write(conn, encode_frame(OP_PONG, payload))
+            elif opcode == OP_CLOSE:
+                self.send_close(conn, 1000)
+    
+    def handle_handshake(self, conn):
+        end = conn.inbuf.find(b'\r\n\r\n')
+        if end < 0:
+            if len(conn.inbuf) > 8192:
+                self.close_connection(conn)
+            return False
+        
+        request = conn.inbuf[:end].decode('latin-1')
+        del conn.inbuf[:end + 4]
+        
+        key = None
+        for line in request.split('\r\n')[1:]:
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'sec-websocket-key':
+                key = value.strip()
+        
+        if not key:
+            self.queue_write(conn, b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            conn.closing = True
+            return False
+        
+        accept_key = base64.b64encode(
+            hashlib.sha1((key + '258EAFA5-E914-47DA-95CA-C5AB0DC85B11').encode()).digest()
+        ).decode()
+        
+        response = (
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept_key}\r\n\r\n"
+        )
+        conn.handshake_done = True
+        self.queue_write(conn, response.encode())
+        return True
+    
+    def check_keepalive(self):
+        now = time.monotonic()
+        for conn in list(self.connections):
+            idle = now - conn.last_activity
+            if not conn.handshake_done:
+                if idle > WS_HANDSHAKE_TIMEOUT:
+                    self.close_connection(conn)
+            elif idle > WS_IDLE_TIMEOUT:
+                self.close_connection(conn)
+            elif idle > WS_PING_INTERVAL and not conn.ping_pending:
+                conn.ping_pending = True
+                self.queue_write(conn, encode_frame(OP_PING, b''))
     
     def process_message(self, client, message):
         try:
             data = json.loads(message)
+            if not isinstance(data, dict):
+                return
             msg_type = data.get('type')
             
             if msg_type == 'auth':
-                user_id = data.get('user_id')
-                self.clients[client] = {'user_id': user_id}
-
+                # The user comes from the session token, not from the message
                 match_id = data.get('match_id')
-                if match_id:
-                    self.clients[client]['match_id'] = match_id
-
-                    if match_id not in self.match_broadcasters:
-                        self.match_broadcasters[match_id] = []
-                    if client not in self.match_broadcasters[match_id]:
-                        self.match_broadcasters[match_id].append(client)
+                session_id = session_store.check(data.get('token'))
+                session = session_store.cached(session_id) if session_id else None
+                if session_id and not session:
+                    self.auth_executor.submit(self.fetch_session, client, session_id, match_id)
+                    return
+                self.finish_auth(client, session, match_id)
+                
+            elif msg_type in ('subscribe', 'unsubscribe'):
+                topics = data.get('topics') or [data.get('topic')]
+                for topic in topics:
+                    if topic not in TOPICS:
+                        continue
+                    if msg_type == 'subscribe':
+                        self.rooms.subscribe(client, topic)
+                    else:
+                        self.rooms.unsubscribe(client, topic)
                 
             elif msg_type == 'answer_submitted':
+                client_info = self.rooms.get_info(client)
+                if not client_info:
+                    return
                 match_id = data.get('match_id')
-                user_id = data.get('user_id')
                 self.broadcast_to_match(match_id, {
                     'type': 'answer_submitted',
-                    'user_id': user_id,
+                    'user_id': client_info['user_id'],
                     'timestamp': time.time()
                 }, exclude_client=client)
                 
             elif msg_type == 'chat':
+                client_info = self.rooms.get_info(client)
+                if not client_info:
+                    return
                 match_id = data.get('match_id')
                 message = data.get('message')
                 self.broadcast_to_match(match_id, {
                     'type': 'chat',
-                    'user_id': self.clients[client]['user_id'],
+                    'user_id': client_info['user_id'],
                     'message': message,
                     'timestamp': time.time()
                 })
@@ -97,86 +295,199 @@ class WebSocketServer:
         except json.JSONDecodeError:
             pass
     
+    def fetch_session(self, client, session_id, match_id):
+        try:
+            session = session_store.fetch(session_id)
+        except Exception as e:
+            print(f"WebSocket error: {e}")
+            session = None
+        self.call_soon(self.finish_auth, client, session, match_id)
+    
+    def finish_auth(self, client, session, match_id):
+        if client.closed:
+            return
+        if not session:
+            self.send_message(client, json.dumps({'type': 'auth_error', 'error': 'Сессия недействительна'}))
+            return
+        self.rooms.register(client, session.user_id, match_id, session.username)
+    
     def broadcast_to_match(self, match_id, message, exclude_client=None):
-        if match_id in self.match_broadcasters:
-            msg_json = json.dumps(message)
-            for client_socket in self.match_broadcasters[match_id]:
-                if client_socket != exclude_client:
-                    try:
-                        self.send_message(client_socket, msg_json)
-                    except:
-                        pass
-    
-    def receive_message(self, client):
+        self.call_soon(self._broadcast_to_match, match_id, message, exclude_client)
+    
+    def _broadcast_to_match(self, match_id, message, exclude_client=None):
+        subscribers = self.rooms.members(match_id)
+        if subscribers:
+            self.fan_out(subscribers, message, exclude_client)
+        # Nothing more happens in a finished match, so its room is torn down
+        # right after the final result went out
+        if message.get('type') == 'match_finished':
+            self.rooms.close_room(match_id)
+    
+    def broadcast_to_all_matches(self, message):
+        self.call_soon(self._broadcast_to_all_matches, message)
+    
+    def _broadcast_to_all_matches(self, message):
+        self.fan_out(self.rooms.all_members(), message)
+    
+    def send_to_users(self, user_ids, message):
+        self.call_soon(self._send_to_users, user_ids, message)
+    
+    def _send_to_users(self, user_ids, message):
+        clients = self.rooms.user_clients(user_ids)
+        if clients:
+            self.fan_out(clients, message)
+    
+    def send_achievements(self, earned):
+        by_user = {}
+        for achievement in earned:
+            by_user.setdefault(achievement['user_id'], []).append(achievement)
+        for user_id, achievements in by_user.items():
+            self.send_to_users((user_id,), {'type': 'achievements_earned', 'achievements': achievements})
+    
+    def publish(self, topic, message):
+        self.call_soon(self._publish, topic, message)
+    
+    def _publish(self, topic, message):
+        subscribers = self.rooms.topic_members(topic)
+        if subscribers:
+            self.fan_out(subscribers, {'type': 'update', 'topic': topic, **message})
+    
+    def mark_dirty(self, topic):
+        # For snapshot topics such as platform counters: many writes within
+        # one loop tick are coalesced into a single published snapshot
+        self.dirty_topics.add(topic)
+    
+    def publish_dirty_topics(self):
+        # A topic still being built stays dirty and is rebuilt on a later tick
+        for topic in list(self.dirty_topics):
+            if topic in self.building_topics:
+                continue
+            self.dirty_topics.discard(topic)
+            provider = self.topic_providers.get(topic)
+            if provider is None or not self.rooms.topic_members(topic):
+                continue
+            self.building_topics.add(topic)
+            self.snapshot_executor.submit(self.build_snapshot, topic, provider)
+    
+    def build_snapshot(self, topic, provider):
         try:
-            data = client.recv(2)
-            if len(data) < 2:
-                return None
-            
-            first_byte, second_byte = data[0], data[1]
-            masked = (second_byte & 0x80) != 0
-            payload_length = second_byte & 0x7F
-            
-            if payload_length == 126:
-                data += client.recv(2)
-                payload_length = int.from_bytes(data[2:4], 'big')
-            elif payload_length == 127:
-                data += client.recv(8)
-                payload_length = int.from_bytes(data[2:10], 'big')
-            
-            if masked:
-                mask_key = client.recv(4)
-                encoded = client.recv(payload_length)
-                decoded = bytes(encoded[i] ^ mask_key[i % 4] for i in range(len(encoded)))
-            else:
-                decoded = client.recv(payload_length)
-            
-            return decoded.decode('utf-8')
-        except:
-            return None
+            message = provider()
+        except Exception as e:
+            print(f"WebSocket error: {e}")
+            message = None
+        self.call_soon(self.snapshot_ready, topic, message)
+    
+    def snapshot_ready(self, topic, message):
+        self.building_topics.discard(topic)
+        if message is not None:
+            self._publish(topic, message)
+    
+    def fan_out(self, clients, message, exclude_client=None):
+        # Serialize and frame once; every queue holds a reference to the same bytes
+        frame = encode_frame(OP_TEXT, json.dumps(message).encode('utf-8'))
+        for client in clients:
+            if client is exclude_client or client.closed:
+                continue
+            if client.out_size > WS_BROADCAST_DROP_BUFFER:
+                self.frames_dropped += 1
+                continue
+            self.queue_write(client, frame)
+            self.frames_sent += 1
+    
+    def stats(self):
+        return {
+            'connections': len(self.connections),
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'handoffs': self.handoffs,
+            'max_pending_handoffs': self.max_pending,
+            'avg_handoff_wait_ms': round(self.handoff_wait / self.handoffs * 1000, 3) if self.handoffs else 0,
+            'max_handoff_wait_ms': round(self.max_handoff_wait * 1000, 3),
+            'rooms': self.rooms.stats()
+        }
     
     def send_message(self, client, message):
+        self.queue_write(client, encode_frame(OP_TEXT, message.encode('utf-8')))
+    
+    def send_close(self, conn, code):
+        if conn.closing:
+            return
+        self.queue_write(conn, encode_frame(OP_CLOSE, code.to_bytes(2, 'big')))
+        conn.closing = True
+        if not conn.out_size:
+            self.close_connection(conn)
+    
+    def queue_write(self, conn, data):
+        if conn.closed or conn.closing:
+            return
+        conn.outbuf.append(data)
+        conn.out_size += len(data)
+        if conn.out_size > WS_MAX_WRITE_BUFFER:
+            # The peer stopped reading; dropping it protects everyone else
+            self.close_connection(conn)
+            return
+        self.flush(conn)
+    
+    def flush(self, conn):
+        while conn.outbuf:
+            chunk = conn.outbuf[0]
+            try:
+                sent = conn.sock.send(memoryview(chunk)[conn.out_offset:])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                self.close_connection(conn)
+                return
+            conn.out_offset += sent
+            conn.out_size -= sent
+            if conn.out_offset == len(chunk):
+                conn.outbuf.popleft()
+                conn.out_offset = 0
+        
+        if conn.closing and not conn.outbuf:
+            self.close_connection(conn)
+            return
+        self.update_interest(conn)
+    
+    def update_interest(self, conn):
+        # Backpressure: stop reading from a client that is not draining its
+        # own responses, resume once its buffer is mostly flushed
+        if conn.reading and conn.out_size > WS_READ_PAUSE_BUFFER:
+            conn.reading = False
+        elif not conn.reading and conn.out_size < WS_READ_PAUSE_BUFFER // 2:
+            conn.reading = True
+        
+        events = selectors.EVENT_READ if conn.reading else 0
+        if conn.outbuf:
+            events |= selectors.EVENT_WRITE
+        if events != conn.events and events:
+            self.selector.modify(conn.sock, events, conn)
+            conn.events = events
+    
+    def close_connection(self, conn):
+        if conn.closed:
+            return
+        conn.closed = True
+        self.connections.discard(conn)
         try:
-            header = bytearray()
-            header.append(0x81)
-            
-            msg_bytes = message.encode('utf-8')
-            length = len(msg_bytes)
-            
-            if length <= 125:
-                header.append(length)
-            elif length <= 65535:
-                header.append(126)
-                header.extend(length.to_bytes(2, 'big'))
-            else:
-                header.append(127)
-                header.extend(length.to_bytes(8, 'big'))
-            
-            client.send(header + msg_bytes)
-        except:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
             pass
+        self.remove_client(conn)
     
     def remove_client(self, client):
-        if client in self.clients:
-            client_info = self.clients[client]
-            match_id = client_info.get('match_id')
-            
-            if match_id and match_id in self.match_broadcasters:
-                if client in self.match_broadcasters[match_id]:
-                    self.match_broadcasters[match_id].remove(client)
-                
-                conn = sqlite3.connect(DB_FILE)
-                cursor = conn.cursor()
-                cursor.execute("SELECT username FROM users WHERE id = ?", (client_info['user_id'],))
-                username = cursor.fetchone()[0]
-                conn.close()
-
-                self.broadcast_to_match(match_id, {
-                    'type': 'player_left',
-                    'user_id': client_info['user_id'],
-                    'username': username,
-                    'timestamp': time.time()
-                })
+        client_info = self.rooms.unregister(client)
+        match_id = client_info.get('match_id') if client_info else None
+        
+        if match_id is not None:
+            if self.on_player_left:
+                self.on_player_left(match_id, client_info['user_id'])
             
-            del self.clients[client]
-        client.close()
+            self.broadcast_to_match(match_id, {
+                'type': 'player_left',
+                'user_id': client_info['user_id'],
+                'username': client_info.get('username'),
+                'timestamp': time.time()
+            })
+        
+        client.sock.close()
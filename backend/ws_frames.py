@@ -0,0 +1,179 @@
+import struct
+
+from config import WS_MAX_MESSAGE_SIZE
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+class ProtocolError(Exception):
+    def __init__(self, code, reason=''):
+        super().__init__(reason or f'WebSocket protocol error {code}')
+        self.code = code
+
+def unmask(payload, mask):
+    # XOR the whole payload at once as one big integer instead of
+    # building a new Python int per byte
+    n = len(payload)
+    if not n:
+        return b''
+    key = mask * (n // 4) + mask[:n % 4]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(key, 'little')).to_bytes(n, 'little')
+
+def encode_frame(opcode, payload, fin=True):
+    first = (0x80 if fin else 0) | opcode
+    length = len(payload)
+    if length <= 125:
+        header = struct.pack('!BB', first, length)
+    elif length <= 65535:
+        header = struct.pack('!BBH', first, 126, length)
+    else:
+        header = struct.pack('!BBQ', first, 127, length)
+    return header + payload
+
+class FrameParser:
+    def __init__(self, max_message_size=WS_MAX_MESSAGE_SIZE, require_mask=True):
+        self.max_message_size = max_message_size
+        self.require_mask = require_mask
+        self.buffer = bytearray()
+        self.pos = 0
+        self.fragments = []
+        self.fragment_opcode = None
+        self.fragment_size = 0
+
+    def feed(self, data):
+        # Returns the complete messages found so far as (opcode, payload)
+        # pairs; text payloads are already decoded to str
+        self.buffer += data
+        messages = []
+        try:
+            while True:
+                frame = self.next_frame()
+                if frame is None:
+                    break
+                message = self.assemble(*frame)
+                if message is not None:
+                    messages.append(message)
+        finally:
+            if self.pos:
+                del self.buffer[:self.pos]
+                self.pos = 0
+        return messages
+
+    def next_frame(self):
+        buf = self.buffer
+        pos = self.pos
+        available = len(buf) - pos
+        if available < 2:
+            return None
+        
+        first, second = buf[pos], buf[pos + 1]
+        if first & 0x70:
+            raise ProtocolError(1002, 'RSV bits set without negotiated extension')
+        fin = bool(first & 0x80)
+        opcode = first & 0x0F
+        masked = bool(second & 0x80)
+        length = second & 0x7F
+        offset = 2
+        
+        if length == 126:
+            if available < 4:
+                return None
+            length = struct.unpack_from('!H', buf, pos + 2)[0]
+            offset = 4
+        elif length == 127:
+            if available < 10:
+                return None
+            length = struct.unpack_from('!Q', buf, pos + 2)[0]
+            offset = 10
+        
+        if self.require_mask and not masked:
+            raise ProtocolError(1002, 'Client frames must be masked')
+        if length > self.max_message_size:
+            raise ProtocolError(1009, 'Message too big')
+        
+        if masked:
+            offset += 4
+        if available < offset + length:
+            return None
+        
+        start = pos + offset
+        with memoryview(buf) as view:
+            if masked:
+                payload = unmask(view[start:start + length], bytes(view[start - 4:start]))
+            else:
+                payload = bytes(view[start:start + length])
+        self.pos = start + length
+        return fin, opcode, payload
+
+    def assemble(self, fin, opcode, payload):
+        if opcode >= OP_CLOSE:
+            if opcode not in (OP_CLOSE, OP_PING, OP_PONG):
+                raise ProtocolError(1002, 'Unknown control opcode')
+            if not fin or len(payload) > 125:
+                raise ProtocolError(1002, 'Invalid control frame')
+            return opcode, payload
+        
+        if opcode == OP_CONTINUATION:
+            if self.fragment_opcode is None:
+                raise ProtocolError(1002, 'Unexpected continuation frame')
+        elif opcode in (OP_TEXT, OP_BINARY):
+            if self.fragment_opcode is not None:
+                raise ProtocolError(1002, 'Expected continuation frame')
+            if fin:
+                return self.finish(opcode, payload)
+            self.fragment_opcode = opcode
+        else:
+            raise ProtocolError(1002, 'Unknown data opcode')
+        
+        self.fragment_size += len(payload)
+        if self.fragment_size > self.max_message_size:
+            raise ProtocolError(1009, 'Message too big')
+        self.fragments.append(payload)
+        
+        if not fin:
+            return None
+        
+        opcode = self.fragment_opcode
+        payload = b''.join(self.fragments)
+        self.fragments = []
+        self.fragment_opcode = None
+        self.fragment_size = 0
+        return self.finish(opcode, payload)
+
+    def finish(self, opcode, payload):
+        if opcode == OP_TEXT:
+            try:
+                return opcode, payload.decode('utf-8')
+            except UnicodeDecodeError:
+                raise ProtocolError(1007, 'Invalid UTF-8 in text message')
+        return opcode, payload
+
+def legacy_unmask(encoded, mask_key):
+    return bytes(encoded[i] ^ mask_key[i % 4] for i in range(len(encoded)))
+
+if __name__ == '__main__':
+    # Micro-benchmark: python ws_frames.py
+    import os
+    import timeit
+    
+    mask = os.urandom(4)
+    for size in (64, 1024, 16 * 1024, 64 * 1024):
+        payload = os.urandom(size)
+        assert unmask(payload, mask) == legacy_unmask(payload, mask)
+        runs = max(10, 200000 // size)
+        old = timeit.timeit(lambda: legacy_unmask(payload, mask), number=runs) / runs
+        new = timeit.timeit(lambda: unmask(payload, mask), number=runs) / runs
+        print(f"unmask {size:>6} B: per-byte {old * 1e6:9.1f} µs | int XOR {new * 1e6:7.2f} µs | x{old / new:.0f}")
+    
+    client_frame = bytearray()
+    for _ in range(100):
+        body = b'{"type": "chat", "match_id": 1, "message": "hello"}'
+        client_frame += bytes([0x81, 0x80 | len(body)]) + mask + unmask(body, mask)
+    parser = FrameParser()
+    runs = 200
+    elapsed = timeit.timeit(lambda: parser.feed(bytes(client_frame)), number=runs)
+    print(f"parse: {100 * runs / elapsed:,.0f} small frames/s")
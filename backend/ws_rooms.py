@@ -0,0 +1,169 @@
+import threading
+import time
+
+class MeteredLock:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def __enter__(self):
+        if not self.lock.acquire(blocking=False):
+            start = time.perf_counter()
+            self.lock.acquire()
+            waited = time.perf_counter() - start
+            self.contended += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+        self.acquisitions += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.lock.release()
+
+    def stats(self):
+        return {
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'contention_rate': round(self.contended / self.acquisitions * 100, 2) if self.acquisitions else 0,
+            'total_wait_ms': round(self.wait_time * 1000, 3),
+            'max_wait_ms': round(self.max_wait * 1000, 3)
+        }
+
+def room_key(match_id):
+    # HTTP handlers and browsers may send the same match id as int or str
+    try:
+        return int(match_id)
+    except (TypeError, ValueError):
+        return match_id
+
+class RoomRegistry:
+    # Mutated by the WebSocket event loop; the lock makes reads from HTTP
+    # handler threads (stats, membership checks) safe as well
+    def __init__(self):
+        self.lock = MeteredLock()
+        self.clients = {}
+        self.rooms = {}
+        self.topics = {}
+        self.users = {}
+        self.rooms_closed = 0
+
+    def register(self, client, user_id, match_id=None, username=None):
+        with self.lock:
+            previous = self.clients.get(client)
+            if previous and previous.get('match_id') is not None:
+                self._leave(client, previous['match_id'])
+            if previous:
+                self._forget_user(client, previous['user_id'])
+            user_id = room_key(user_id)
+            if user_id is not None:
+                self.users.setdefault(user_id, set()).add(client)
+            info = {'user_id': user_id, 'username': username, 'topics': previous['topics'] if previous else set()}
+            if match_id:
+                key = room_key(match_id)
+                info['match_id'] = key
+                self.rooms.setdefault(key, set()).add(client)
+            self.clients[client] = info
+            return {**info, 'topics': set(info['topics'])}
+
+    def get_info(self, client):
+        with self.lock:
+            info = self.clients.get(client)
+            return {**info, 'topics': set(info['topics'])} if info else None
+
+    def members(self, match_id):
+        with self.lock:
+            return list(self.rooms.get(room_key(match_id), ()))
+
+    def all_members(self):
+        with self.lock:
+            result = set()
+            for clients in self.rooms.values():
+                result |= clients
+            return list(result)
+
+    def _leave(self, client, key):
+        subscribers = self.rooms.get(key)
+        if subscribers is not None:
+            subscribers.discard(client)
+            if not subscribers:
+                del self.rooms[key]
+
+    def unregister(self, client):
+        with self.lock:
+            info = self.clients.pop(client, None)
+            if info and info.get('match_id') is not None:
+                self._leave(client, info['match_id'])
+            if info:
+                self._forget_user(client, info['user_id'])
+                for topic in info['topics']:
+                    self._unsubscribe(client, topic)
+            return info
+
+    def _forget_user(self, client, user_id):
+        clients = self.users.get(user_id)
+        if clients is not None:
+            clients.discard(client)
+            if not clients:
+                del self.users[user_id]
+
+    def user_clients(self, user_ids):
+        with self.lock:
+            result = set()
+            for user_id in user_ids:
+                result |= self.users.get(room_key(user_id), set())
+            return list(result)
+
+    def user_in_room(self, user_id, match_id):
+        with self.lock:
+            room = self.rooms.get(room_key(match_id), ())
+            return any(client in room for client in self.users.get(room_key(user_id), ()))
+
+    def subscribe(self, client, topic):
+        with self.lock:
+            info = self.clients.setdefault(client, {'user_id': None, 'topics': set()})
+            info['topics'].add(topic)
+            self.topics.setdefault(topic, set()).add(client)
+
+    def unsubscribe(self, client, topic):
+        with self.lock:
+            info = self.clients.get(client)
+            if info:
+                info['topics'].discard(topic)
+            self._unsubscribe(client, topic)
+
+    def _unsubscribe(self, client, topic):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(client)
+            if not subscribers:
+                del self.topics[topic]
+
+    def topic_members(self, topic):
+        with self.lock:
+            return list(self.topics.get(topic, ()))
+
+    def close_room(self, match_id):
+        with self.lock:
+            members = self.rooms.pop(room_key(match_id), set())
+            for client in members:
+                info = self.clients.get(client)
+                if info:
+                    info.pop('match_id', None)
+            if members:
+                self.rooms_closed += 1
+            return len(members)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'clients': len(self.clients),
+                'users': len(self.users),
+                'rooms': len(self.rooms),
+                'topics': {topic: len(c) for topic, c in self.topics.items()},
+                'largest_room': max((len(c) for c in self.rooms.values()), default=0),
+                'rooms_closed': self.rooms_closed,
+                'lock': self.lock.stats()
+            }
@@ -1,10 +1,19 @@
 let ws = null;
 let currentUser = null;
+let sessionToken = null;
 let currentMatch = null;
 let wsConnected = false;
 let statsRefreshInterval = null;
+let currentLeaderboard = [];
+let activeMatches = [];
+let inMatchQueue = false;
+let queuePollInterval = null;
 
 async function loadComponent(id, url) {
+    const container = document.getElementById(id);
+    // The server normally inlines components into index.html already
+    if (container.children.length > 0) return;
+
     const response = await fetch(url);
     const text = await response.text();
     document.getElementById(id).innerHTML = text;
@@ -91,7 +100,10 @@ function showPanel(panelId) {
         case 'stats':
             loadStats();
             
-            statsRefreshInterval = setInterval(loadStats, 5000);
+            // Counters are pushed over the 'stats' topic; poll only without a socket
+            if (!wsConnected) {
+                statsRefreshInterval = setInterval(loadStats, 5000);
+            }
             break;
         case 'leaderboard':
             loadLeaderboard();
@@ -148,6 +160,7 @@ async function login() {
 
         if (data.success) {
             currentUser = data.user;
+            sessionToken = data.token;
             showNotification(`Добро пожаловать, ${currentUser.username}!`, 'success');
             updateUIAfterLogin();
             loadProblems();
@@ -198,7 +211,19 @@ async function register() {
 }
 
 function logout() {
+    if (inMatchQueue) {
+        fetch('/api/match/queue/leave', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({user_id: currentUser.id})
+        });
+        setQueueState(false);
+    }
+
+    fetch('/api/logout', {method: 'POST'});
+
     currentUser = null;
+    sessionToken = null;
     currentMatch = null;
 
     if (ws && wsConnected) {
@@ -386,10 +411,7 @@ async function loadStats() {
         const statsData = await statsResponse.json();
 
         if (statsData.success) {
-            document.getElementById('totalUsers').textContent = statsData.stats.users_count;
-            document.getElementById('totalProblems').textContent = statsData.stats.problems_count;
-            document.getElementById('correctSolutions').textContent = statsData.stats.correct_solutions;
-            document.getElementById('matchesPlayed').textContent = statsData.stats.matches_played;
+            renderPlatformStats(statsData.stats);
         } else {
             showNotification('Ошибка загрузки общей статистики платформы', 'error');
             
@@ -465,6 +487,14 @@ async function loadStats() {
 }
 
 
+function renderPlatformStats(stats) {
+    document.getElementById('totalUsers').textContent = stats.users_count;
+    document.getElementById('totalProblems').textContent = stats.problems_count;
+    document.getElementById('correctSolutions').textContent = stats.correct_solutions;
+    document.getElementById('matchesPlayed').textContent = stats.matches_played;
+}
+
+
 async function loadLeaderboard() {
     const tbody = document.getElementById('leaderboardBody');
     tbody.innerHTML = `
@@ -480,7 +510,8 @@ async function loadLeaderboard() {
         const data = await response.json();
 
         if (data.success) {
-            renderLeaderboard(data.leaderboard);
+            currentLeaderboard = data.leaderboard;
+            renderLeaderboard(currentLeaderboard);
         } else {
             tbody.innerHTML = `
             <tr>
@@ -543,7 +574,8 @@ async function loadActiveMatches() {
         const data = await response.json();
 
         if (data.success) {
-            renderActiveMatches(data.matches);
+            activeMatches = data.matches;
+            renderActiveMatches(activeMatches);
         }
     } catch (error) {
         console.error('Load matches error:', error);
@@ -625,6 +657,88 @@ async function createMatch() {
     }
 }
 
+function setQueueState(queued) {
+    inMatchQueue = queued;
+    const button = document.getElementById('queueButton');
+    if (button) {
+        button.innerHTML = queued
+            ? '<i class="fas fa-times"></i> Отменить поиск'
+            : '<i class="fas fa-search"></i> Найти соперника';
+    }
+
+    if (queuePollInterval) {
+        clearInterval(queuePollInterval);
+        queuePollInterval = null;
+    }
+    // The socket delivers match_found; polling is only a fallback without it
+    if (queued && !wsConnected) {
+        queuePollInterval = setInterval(pollMatchQueue, 3000);
+    }
+}
+
+async function toggleMatchQueue() {
+    if (!currentUser) {
+        showNotification('Войдите в систему', 'error');
+        return;
+    }
+
+    const endpoint = inMatchQueue ? '/api/match/queue/leave' : '/api/match/queue';
+
+    try {
+        const response = await fetch(endpoint, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({user_id: currentUser.id})
+        });
+
+        const data = await response.json();
+
+        if (!data.success) {
+            showNotification(data.error, 'error');
+        } else if (inMatchQueue) {
+            setQueueState(false);
+            showNotification('Поиск отменен', 'info');
+        } else if (data.matched) {
+            await onMatchFound(data.match_id);
+        } else {
+            setQueueState(true);
+            showNotification(data.message, 'info');
+        }
+    } catch (error) {
+        console.error('Match queue error:', error);
+        showNotification('Ошибка поиска соперника', 'error');
+    }
+}
+
+async function pollMatchQueue() {
+    if (!currentUser) return;
+
+    try {
+        const response = await fetch(`/api/match/queue?user_id=${currentUser.id}`);
+        const data = await response.json();
+
+        if (data.success && data.status === 'matched') {
+            await onMatchFound(data.match_id);
+        } else if (data.success && data.status === 'error') {
+            setQueueState(false);
+            showNotification(data.error, 'error');
+        } else if (data.success && data.status === 'idle') {
+            setQueueState(false);
+        }
+    } catch (error) {
+        console.error('Match queue poll error:', error);
+    }
+}
+
+async function onMatchFound(matchId) {
+    if (currentMatch && currentMatch.id === matchId) return;
+
+    setQueueState(false);
+    showNotification('Соперник найден!', 'success');
+    currentMatch = {id: matchId};
+    await setupCurrentMatch(matchId);
+}
+
 async function joinMatch(matchId) {
     if (!currentUser) {
         showNotification('Войдите в систему', 'error');
@@ -945,6 +1059,13 @@ async function setupCurrentMatch(matchId) {
                     </button>
                     </div>
                     `;
+            } else if (match.status === 'expired') {
+                matchContent = `
+                <div style="text-align: center; padding: 50px; color: var(--text-muted);">
+                <i class="fas fa-hourglass-end" style="font-size: 3em; margin-bottom: 20px;"></i>
+                <p>Матч #${match.id} отменен: время ожидания истекло.</p>
+                </div>
+                `;
             } else {
                 matchContent = `
                 <div style="text-align: center; padding: 50px; color: var(--text-muted);">
@@ -958,7 +1079,7 @@ async function setupCurrentMatch(matchId) {
             if (wsConnected) {
                 ws.send(JSON.stringify({
                     type: 'auth',
-                    user_id: currentUser.id,
+                    token: sessionToken,
                     match_id: matchId
                 }));
             }
@@ -1212,10 +1333,20 @@ function connectWebSocket() {
             if (currentUser) {
                 ws.send(JSON.stringify({
                     type: 'auth',
-                    user_id: currentUser.id,
-                    match_id: currentMatch ? currentMatch.id : null 
+                    token: sessionToken,
+                    match_id: currentMatch ? currentMatch.id : null
                 }));
             }
+
+            ws.send(JSON.stringify({
+                type: 'subscribe',
+                topics: ['stats', 'leaderboard', 'lobby']
+            }));
+
+            if (statsRefreshInterval) {
+                clearInterval(statsRefreshInterval);
+                statsRefreshInterval = null;
+            }
         };
 
         ws.onmessage = async (event) => {
@@ -1251,8 +1382,19 @@ async function handleWebSocketMessage(data) {
                 currentMatch = { id: data.match_id };
                 await setupCurrentMatch(data.match_id);
             }
+            break;
 
-            loadActiveMatches();
+        case 'match_found':
+            await onMatchFound(data.match_id);
+            break;
+
+        case 'queue_error':
+            setQueueState(false);
+            showNotification(data.error, 'error');
+            break;
+
+        case 'auth_error':
+            console.warn('WebSocket auth rejected:', data.error);
             break;
 
         case 'answer_submitted':
@@ -1267,15 +1409,19 @@ async function handleWebSocketMessage(data) {
             break;
 
         case 'match_finished':
-            showNotification(`Матч #${data.match_id} завершен!`, 'success');
+            if (data.reason === 'expired') {
+                showNotification(`Матч #${data.match_id} отменен по таймауту`, 'info');
+            } else if (data.reason === 'forfeit') {
+                showNotification(`Матч #${data.match_id} завершен: соперник не ответил вовремя`, 'success');
+            } else {
+                showNotification(`Матч #${data.match_id} завершен!`, 'success');
+            }
 
             
             if (currentMatch && data.match_id === currentMatch.id) {
                 await setupCurrentMatch(currentMatch.id);
                 loadStats(); 
             }
-
-            loadActiveMatches();
             break;
 
         case 'player_left':
@@ -1293,6 +1439,61 @@ async function handleWebSocketMessage(data) {
 
             loadActiveMatches(); 
             break;
+
+        case 'update':
+            applyTopicUpdate(data);
+            break;
+
+        case 'achievements_earned':
+            data.achievements.forEach(achievement => {
+                showNotification(`${achievement.icon} Новое достижение: ${achievement.name}`, 'success');
+            });
+            break;
+    }
+}
+
+function applyTopicUpdate(data) {
+    switch(data.topic) {
+        case 'stats':
+            renderPlatformStats(data.stats);
+            break;
+
+        case 'leaderboard':
+            if (data.event === 'user_removed') {
+                if (currentLeaderboard.some(player => player.id === data.user_id)) {
+                    loadLeaderboard();
+                }
+                return;
+            }
+
+            data.users.forEach(user => {
+                const index = currentLeaderboard.findIndex(player => player.id === user.id);
+                if (index !== -1) {
+                    currentLeaderboard[index] = user;
+                } else {
+                    currentLeaderboard.push(user);
+                }
+            });
+            currentLeaderboard.sort((a, b) => b.rating - a.rating || a.id - b.id);
+            currentLeaderboard = currentLeaderboard.slice(0, 50);
+            currentLeaderboard.forEach((player, index) => { player.rank = index + 1; });
+            renderLeaderboard(currentLeaderboard);
+            break;
+
+        case 'lobby':
+            if (data.event === 'match_created') {
+                activeMatches.unshift(data.match);
+            } else if (data.event === 'match_joined') {
+                const match = activeMatches.find(m => m.id === data.match_id);
+                if (match) {
+                    match.status = 'active';
+                    match.player2 = data.player2;
+                }
+            } else if (data.event === 'match_finished') {
+                activeMatches = activeMatches.filter(m => m.id !== data.match_id);
+            }
+            renderActiveMatches(activeMatches.slice(0, 20));
+            break;
     }
 }
 
@@ -1400,7 +1601,7 @@ async function loadAdminProblems() {
     `;
 
     try {
-        const response = await fetch('/api/problems');
+        const response = await fetch('/api/problems?view=summary');
         const data = await response.json();
 
         if (data.success) {
@@ -1583,49 +1784,89 @@ function showImportProblemsModal() {
     showModal('importProblemsModal');
 }
 
+function importFormat(text, fileName) {
+    if (/\.csv$/i.test(fileName || '')) return 'csv';
+    if (/\.(jsonl|ndjson)$/i.test(fileName || '')) return 'jsonl';
+    if (text.startsWith('[')) return 'json';
+    return text.startsWith('{') ? 'jsonl' : 'csv';
+}
+
+function importSummary(result) {
+    let message = `Импортировано: ${result.imported} из ${result.rows}`;
+    if (result.duplicates) message += `, дубликатов: ${result.duplicates}`;
+    if (result.failed) message += `, ошибок: ${result.failed}`;
+    return message;
+}
+
 async function importProblems() {
     if (!currentUser || currentUser.role !== 'admin') {
         showNotification('Доступ запрещен', 'error');
         return;
     }
 
+    const fileInput = document.getElementById('importProblemsFile');
+    const file = fileInput.files[0];
     const data = document.getElementById('importProblemsData').value.trim();
 
-    if (!data) {
-        showNotification('Введите JSON данные', 'error');
+    if (!file && !data) {
+        showNotification('Введите данные или выберите файл', 'error');
         return;
     }
 
     try {
-        const problems = JSON.parse(data);
+        // Files go to the streaming endpoint as-is, so the browser never parses them
+        const head = file ? (await file.slice(0, 1).text()) : data;
+        const format = importFormat(head, file && file.name);
+        let response;
 
-        if (!Array.isArray(problems)) {
-            showNotification('JSON должен содержать массив задач', 'error');
-            return;
-        }
+        if (format === 'json') {
+            const problems = JSON.parse(file ? await file.text() : data);
 
-        const response = await fetch('/api/admin/import_problems', {
-            method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({
-                user_id: currentUser.id,
-                problems: problems
-            })
-        });
+            if (!Array.isArray(problems)) {
+                showNotification('JSON должен содержать массив задач', 'error');
+                return;
+            }
+
+            response = await fetch('/api/admin/import_problems', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({
+                    user_id: currentUser.id,
+                    problems: problems
+                })
+            });
+        } else {
+            response = await fetch(`/api/admin/import_problems/stream?format=${format}`, {
+                method: 'POST',
+                headers: {'Content-Type': format === 'csv' ? 'text/csv' : 'application/x-ndjson'},
+                body: file || data
+            });
+        }
 
         const result = await response.json();
 
+        if (result.error) {
+            showNotification(result.error, 'error');
+            return;
+        }
+
+        if (result.errors && result.errors.length) {
+            console.table(result.errors);
+        }
+
         if (result.success) {
-            showNotification(result.message, 'success');
+            showNotification(importSummary(result), result.failed ? 'info' : 'success');
             closeModal();
             document.getElementById('importProblemsData').value = '';
+            fileInput.value = '';
             loadAdminProblems();
         } else {
-            showNotification(result.error, 'error');
+            showNotification(`${importSummary(result)}. Импорт прерван: ${result.aborted}`, 'error');
+            loadAdminProblems();
         }
     } catch (error) {
         console.error('Import problems error:', error);
-        showNotification('Ошибка импорта. Проверьте формат JSON', 'error');
+        showNotification('Ошибка импорта. Проверьте формат данных', 'error');
     }
 }
 
@@ -1634,6 +1875,16 @@ function exportProblems() {
     showNotification('Экспорт начат', 'success');
 }
 
+function exportResults(kind) {
+    if (!currentUser || currentUser.role !== 'admin') {
+        showNotification('Доступ запрещен', 'error');
+        return;
+    }
+
+    window.open(`/api/export/${kind}?format=csv`, '_blank');
+    showNotification('Экспорт начат', 'success');
+}
+
 function showAddUserModal() {
     showModal('addUserModal');
 }
@@ -1773,16 +2024,18 @@ async function adminDeleteUser(userId) {
 
 document.addEventListener('DOMContentLoaded', async () => {
     
-    await loadComponent('header-component', './components/header.html');
-    await loadComponent('nav-tabs-component', './components/nav_tabs.html');
-    await loadComponent('auth-panel-component', './components/auth.html');
-    await loadComponent('problems-panel-component', './components/problems.html');
-    await loadComponent('pvp-panel-component', './components/pvp.html');
-    await loadComponent('stats-panel-component', './components/stats.html');
-    await loadComponent('leaderboard-panel-component', './components/leaderboard.html');
-    await loadComponent('profile-panel-component', './components/profile.html');
-    await loadComponent('admin-panel-component', './components/admin.html');
-    await loadComponent('modal-overlay-component', './components/modals.html');
+    await Promise.all([
+        loadComponent('header-component', './components/header.html'),
+        loadComponent('nav-tabs-component', './components/nav_tabs.html'),
+        loadComponent('auth-panel-component', './components/auth.html'),
+        loadComponent('problems-panel-component', './components/problems.html'),
+        loadComponent('pvp-panel-component', './components/pvp.html'),
+        loadComponent('stats-panel-component', './components/stats.html'),
+        loadComponent('leaderboard-panel-component', './components/leaderboard.html'),
+        loadComponent('profile-panel-component', './components/profile.html'),
+        loadComponent('admin-panel-component', './components/admin.html'),
+        loadComponent('modal-overlay-component', './components/modals.html')
+    ]);
 
     
     applyDarkMode();
@@ -1860,6 +2113,7 @@ window.platform = {
     showImportProblemsModal,
     importProblems,
     exportProblems,
+    exportResults,
     showAddUserModal,
     adminAddUser,
     showEditUserModal,
@@ -0,0 +1,61 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+# The backend opens DB_FILE (and the session key) relative to the working
+# directory, so the whole test session runs in a scratch directory
+os.chdir(tempfile.mkdtemp(prefix='olympiad-tests-'))
+
+from database import init_database
+from db_pool import get_connection
+
+names = itertools.count(1)
+
+@pytest.fixture(scope='session', autouse=True)
+def database():
+    init_database()
+
+@pytest.fixture
+def make_user():
+    def make(rating=1000, role='user'):
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO users (username, password, rating, role) VALUES (?, 'x', ?, ?)",
+            (f'user{next(names)}', rating, role)
+        )
+        user_id = cursor.lastrowid
+        cursor.execute("INSERT INTO user_stats (user_id) VALUES (?)", (user_id,))
+        conn.commit()
+        conn.close()
+        return user_id
+    return make
+
+@pytest.fixture
+def make_match():
+    def make(player1_id, player2_id, status='active', problem_id=1):
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO matches (player1_id, player2_id, problem_id, status) VALUES (?, ?, ?, ?)",
+            (player1_id, player2_id, problem_id, status)
+        )
+        match_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return match_id
+    return make
+
+@pytest.fixture
+def fetch_one():
+    def fetch(query, params=()):
+        conn = get_connection()
+        row = conn.execute(query, params).fetchone()
+        conn.close()
+        return row
+    return fetch
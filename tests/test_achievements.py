@@ -0,0 +1,48 @@
+from achievements import achievement_engine
+from db_pool import get_connection
+
+def earned(user_id):
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT a.requirement_type, a.requirement_value
+        FROM user_achievements ua JOIN achievements a ON a.id = ua.achievement_id
+        WHERE ua.user_id = ?
+    """, (user_id,)).fetchall()
+    conn.close()
+    return set(rows)
+
+def test_award_existing_grants_thresholds_already_passed(make_user):
+    veteran = make_user(rating=1600)
+    newcomer = make_user(rating=1000)
+    conn = get_connection()
+    conn.execute("""
+        UPDATE user_stats SET total_problems = 12, correct_answers = 11, pvp_wins = 1
+        WHERE user_id = ?
+    """, (veteran,))
+    achievement_engine.award_existing(conn.cursor())
+    conn.commit()
+    conn.close()
+
+    assert earned(veteran) == {('rating', 1500), ('problems_solved', 1), ('problems_solved', 10),
+                               ('accuracy', 90), ('pvp_wins', 1)}
+    assert earned(newcomer) == set()
+
+def test_award_existing_is_idempotent(make_user):
+    user_id = make_user(rating=1600)
+    conn = get_connection()
+    cursor = conn.cursor()
+    assert achievement_engine.award_existing(cursor) >= 1
+    assert achievement_engine.award_existing(cursor) == 0
+    conn.commit()
+    conn.close()
+    assert earned(user_id) == {('rating', 1500)}
+
+def test_award_only_reports_crossed_thresholds(make_user):
+    user_id = make_user(rating=1400)
+    conn = get_connection()
+    cursor = conn.cursor()
+    assert achievement_engine.award(cursor, user_id, [('rating', 1400, 1450)]) == []
+    awarded = achievement_engine.award(cursor, user_id, [('rating', 1450, 1500)])
+    conn.commit()
+    conn.close()
+    assert [a['user_id'] for a in awarded] == [user_id]
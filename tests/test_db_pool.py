@@ -0,0 +1,56 @@
+import threading
+import time
+
+from db_pool import ConnectionPool
+
+def test_pool_reuses_connections_instead_of_opening_more(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=2, timeout=5)
+    for _ in range(10):
+        first = pool.acquire()
+        second = pool.acquire()
+        first.close()
+        second.close()
+    assert pool.stats()['created'] == 2
+    assert pool.stats()['open'] == 2
+
+def test_acquire_waits_for_a_release_when_exhausted(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=1, timeout=5)
+    held = pool.acquire()
+    threading.Timer(0.2, held.close).start()
+    start = time.monotonic()
+    conn = pool.acquire()
+    assert time.monotonic() - start >= 0.15
+    conn.close()
+    stats = pool.stats()
+    assert (stats['created'], stats['waited'], stats['overflow']) == (1, 1, 0)
+
+def test_acquire_overflows_after_the_timeout(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=1, timeout=0.1)
+    held = pool.acquire()
+    extra = pool.acquire()
+    assert pool.stats()['overflow'] == 1
+    extra.close()
+    held.close()
+    # The overflow connection is closed rather than kept past the pool size
+    assert pool.stats()['open'] == 1
+    pool.close_all()
+    assert pool.stats()['open'] == 0
+
+def test_concurrent_callers_never_exceed_the_pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=4, timeout=5)
+    peak = []
+
+    def worker():
+        for _ in range(20):
+            conn = pool.acquire()
+            peak.append(pool.stats()['open'])
+            conn.execute("SELECT 1").fetchone()
+            conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 4
+    assert pool.stats()['created'] <= 4
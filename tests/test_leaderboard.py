@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+from leaderboard import RankIndex
+
+@pytest.fixture
+def small_buckets(monkeypatch):
+    # Small buckets so a few hundred keys exercise splits and dropped buckets
+    monkeypatch.setattr(RankIndex, 'LOAD', 4)
+
+def test_rank_index_matches_a_sorted_list(small_buckets):
+    rng = random.Random(7)
+    index = RankIndex()
+    expected = []
+    for step in range(3000):
+        if expected and rng.random() < 0.45:
+            key = rng.choice(expected)
+            expected.remove(key)
+            assert index.remove(key)
+        else:
+            key = (-rng.randint(0, 2000), step)
+            expected.append(key)
+            expected.sort()
+            index.add(key)
+
+        assert len(index) == len(expected)
+        if expected:
+            probe = rng.randrange(len(expected))
+            assert index.index(expected[probe]) == probe
+            start = rng.randrange(len(expected))
+            assert index.slice(start, start + 5) == expected[start:start + 5]
+    assert index.slice(0, len(expected) + 10) == expected
+
+def test_missing_keys(small_buckets):
+    index = RankIndex()
+    assert index.index((0, 1)) == -1
+    assert index.slice(0, 3) == []
+    index.add((0, 1))
+    assert not index.remove((0, 2))
+    assert index.index((0, 2)) == -1
+    assert index.slice(1, 3) == []
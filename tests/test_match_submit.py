@@ -0,0 +1,53 @@
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from api_handlers import OlympiadHandler
+
+MATCHES = 60
+SUBMITS_PER_PLAYER = 3
+
+def handler():
+    # Only the request-independent parts of the handler are exercised
+    instance = OlympiadHandler.__new__(OlympiadHandler)
+    instance.ws_server = None
+    return instance
+
+def test_parallel_submits_finish_each_match_exactly_once(make_user, make_match, fetch_one):
+    correct_answer = fetch_one("SELECT answer FROM problems WHERE id = 1")[0]
+    matches = {}
+    for _ in range(MATCHES):
+        player1, player2 = make_user(), make_user()
+        matches[make_match(player1, player2)] = (player1, player2)
+
+    jobs = [(match_id, user_id) for match_id, players in matches.items()
+            for user_id in players for _ in range(SUBMITS_PER_PLAYER)]
+    random.shuffle(jobs)
+
+    def submit(job):
+        match_id, user_id = job
+        # Player 2 always answers correctly, so player 2 always wins
+        answer = correct_answer if user_id == matches[match_id][1] else 'wrong'
+        return match_id, handler().submit_match_answer(
+            {'user_id': user_id, 'match_id': match_id, 'answer': answer, 'time_spent': 3}
+        )
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        results = list(executor.map(submit, jobs))
+
+    accepted = Counter(match_id for match_id, result in results if result['success'])
+    finished = {}
+    for match_id, result in results:
+        if result.get('match_finished'):
+            assert match_id not in finished
+            finished[match_id] = result
+
+    assert set(finished) == set(matches)
+    assert all(accepted[match_id] == 2 for match_id in matches)
+    for match_id, (player1, player2) in matches.items():
+        result = finished[match_id]
+        assert fetch_one("SELECT status, winner_id FROM matches WHERE id = ?", (match_id,)) == ('finished', player2)
+        # Elo applied once: the stored ratings are the ones the single finishing submit computed
+        assert fetch_one("SELECT rating FROM users WHERE id = ?", (player1,))[0] == result['new_rating1'] < 1000
+        assert fetch_one("SELECT rating FROM users WHERE id = ?", (player2,))[0] == result['new_rating2'] > 1000
+        assert fetch_one("SELECT pvp_wins FROM user_stats WHERE user_id = ?", (player2,))[0] == 1
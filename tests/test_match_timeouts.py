@@ -0,0 +1,90 @@
+import pytest
+
+from db_pool import get_connection
+from match_timeouts import match_timeouts
+from scheduler import scheduler
+
+class FakeRooms:
+    def __init__(self, present):
+        self.present = present
+
+    def user_in_room(self, user_id, match_id):
+        return user_id in self.present
+
+class FakeWebSocketServer:
+    def __init__(self, present=()):
+        self.rooms = FakeRooms(set(present))
+
+    def broadcast_to_match(self, match_id, message):
+        pass
+
+    def publish(self, topic, message):
+        pass
+
+    def mark_dirty(self, topic):
+        pass
+
+    def send_achievements(self, earned):
+        pass
+
+@pytest.fixture
+def players(make_user, make_match):
+    player1 = make_user(rating=855)
+    player2 = make_user(rating=1156)
+    return player1, player2, make_match(player1, player2)
+
+@pytest.fixture(autouse=True)
+def ws_server():
+    previous = match_timeouts.ws_server
+    yield
+    match_timeouts.ws_server = previous
+
+def grace_timers(match_id):
+    return {key for key in scheduler.timers if key[:2] == ('grace', match_id)}
+
+def test_spectator_leaving_never_forfeits(players, make_user, fetch_one):
+    player1, player2, match_id = players
+    spectator = make_user()
+    match_timeouts.ws_server = FakeWebSocketServer(present=[player1])
+
+    assert not match_timeouts.arm_grace(match_id, spectator)
+    assert grace_timers(match_id) == set()
+
+    match_timeouts.forfeit(match_id, absent_id=spectator)
+    assert fetch_one("SELECT status, winner_id FROM matches WHERE id = ?", (match_id,)) == ('active', None)
+    assert fetch_one("SELECT rating FROM users WHERE id = ?", (player1,)) == (855,)
+    assert fetch_one("SELECT rating FROM users WHERE id = ?", (player2,)) == (1156,)
+
+def test_player_who_answered_is_not_forfeited(players, fetch_one):
+    player1, player2, match_id = players
+    conn = get_connection()
+    conn.execute("UPDATE matches SET player1_answer = '42', player1_time = 5 WHERE id = ?", (match_id,))
+    conn.commit()
+    conn.close()
+    match_timeouts.ws_server = FakeWebSocketServer(present=[player2])
+
+    assert not match_timeouts.arm_grace(match_id, player1)
+    match_timeouts.forfeit(match_id, absent_id=player1)
+    assert fetch_one("SELECT status, winner_id FROM matches WHERE id = ?", (match_id,)) == ('active', None)
+
+def test_both_players_leaving_keep_separate_timers(players):
+    player1, player2, match_id = players
+
+    assert match_timeouts.arm_grace(match_id, player1)
+    assert match_timeouts.arm_grace(match_id, player2)
+    assert grace_timers(match_id) == {('grace', match_id, player1), ('grace', match_id, player2)}
+
+    match_timeouts.finished(match_id)
+    assert grace_timers(match_id) == set()
+
+def test_absent_player_forfeits_to_present_opponent(players, fetch_one):
+    player1, player2, match_id = players
+    match_timeouts.ws_server = FakeWebSocketServer(present=[player2])
+
+    assert match_timeouts.arm_grace(match_id, player1)
+    scheduler.cancel(('grace', match_id, player1))
+    match_timeouts.forfeit_if_absent(match_id, player1)
+
+    assert fetch_one("SELECT status, winner_id FROM matches WHERE id = ?", (match_id,)) == ('finished', player2)
+    assert grace_timers(match_id) == set()
+    assert match_id not in match_timeouts.grace
@@ -0,0 +1,32 @@
+import matchmaking
+from matchmaking import Matchmaker, NO_PROBLEM_ERROR
+
+class FakeWebSocketServer:
+    def __init__(self):
+        self.sent = []
+
+    def send_to_users(self, user_ids, message):
+        self.sent.append((tuple(user_ids), message))
+
+    def publish(self, topic, message):
+        pass
+
+def test_players_are_told_when_no_problem_is_left(monkeypatch, make_user):
+    monkeypatch.setattr(matchmaking.problem_sampler, 'sample_for_players', lambda cursor, user_ids: None)
+    ws_server = FakeWebSocketServer()
+    matchmaker = Matchmaker()
+    matchmaker.ws_server = ws_server
+    player1, player2 = make_user(), make_user()
+
+    assert matchmaker.enqueue(player1, 1000) is None
+    pair = matchmaker.enqueue(player2, 1000)
+    assert pair == (player1, player2)
+    assert matchmaker.create_match(*pair) is None
+    matchmaker.pairing_failed(*pair)
+
+    assert ws_server.sent == [((player1, player2), {'type': 'queue_error', 'error': NO_PROBLEM_ERROR})]
+    assert matchmaker.status(player1) == {'status': 'error', 'error': NO_PROBLEM_ERROR}
+    assert matchmaker.status(player1) == {'status': 'idle'}
+    # Queueing again clears the stale error
+    matchmaker.enqueue(player2, 1000)
+    assert matchmaker.status(player2)['status'] == 'queued'
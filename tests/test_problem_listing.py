@@ -0,0 +1,36 @@
+from urllib.parse import quote
+
+import pytest
+
+import api_handlers
+from api_handlers import OlympiadHandler
+from cache import ResponseCache
+from db_pool import get_connection
+
+def list_problems(query):
+    handler = OlympiadHandler.__new__(OlympiadHandler)
+    handler.path = '/api/problems?' + query
+    return handler.get_problems()
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ResponseCache(ttl=60, max_entries=8, enabled=True)
+    monkeypatch.setattr(api_handlers, 'response_cache', cache)
+    return cache
+
+def test_filter_totals_are_bounded_by_the_response_cache(cache):
+    for n in range(50):
+        assert list_problems('category=' + quote(f'нет-такой-{n}'))['total'] == 0
+    assert len(cache.entries) <= 8
+
+def test_filter_totals_are_dropped_on_problem_writes(cache):
+    category = quote('Счётная')
+    before = list_problems('category=' + category)['total']
+    conn = get_connection()
+    conn.execute("INSERT INTO problems (title, description, answer, difficulty, category) "
+                 "VALUES ('Новая', 'd', '1', 1, 'Счётная')")
+    conn.commit()
+    conn.close()
+    assert list_problems('category=' + category)['total'] == before
+    cache.invalidate('problems')
+    assert list_problems('category=' + category)['total'] == before + 1
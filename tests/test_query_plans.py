@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+import database
+
+# Hot queries from the handlers and the index each one must be answered from
+PLANS = [
+    ("SELECT COUNT(*), SUM(CASE WHEN is_correct THEN 1 ELSE 0 END), AVG(time_spent) "
+     "FROM solutions WHERE user_id = ?",
+     (1,), 'idx_solutions_user'),
+    ("SELECT p.category, COUNT(*) FROM solutions s JOIN problems p ON s.problem_id = p.id "
+     "WHERE s.user_id = ? GROUP BY p.category",
+     (1,), 'idx_solutions_user'),
+    ("SELECT COUNT(*) FROM solutions WHERE problem_id = ?",
+     (1,), 'idx_solutions_problem'),
+    ("SELECT COUNT(*), SUM(CASE WHEN winner_id = ? THEN 1 ELSE 0 END) FROM matches "
+     "WHERE (player1_id = ? OR player2_id = ?) AND +status = 'finished'",
+     (1, 1, 1), 'idx_matches_player1'),
+    ("SELECT COUNT(*), SUM(CASE WHEN winner_id = ? THEN 1 ELSE 0 END) FROM matches "
+     "WHERE (player1_id = ? OR player2_id = ?) AND +status = 'finished'",
+     (1, 1, 1), 'idx_matches_player2'),
+    ("SELECT COUNT(*) FROM matches WHERE winner_id = ? AND status = 'finished'",
+     (1,), 'idx_matches_winner'),
+    ("SELECT id, status, started_at FROM matches WHERE status IN ('waiting', 'active') "
+     "ORDER BY started_at DESC LIMIT 20",
+     (), 'idx_matches_status'),
+    ("SELECT id FROM matches WHERE status = 'finished' AND finished_at >= ? AND finished_at < ? ORDER BY id",
+     ('2026-01-01', '2026-02-01'), 'idx_matches_finished'),
+    ("SELECT id FROM solutions WHERE solved_at >= ? AND solved_at < ? ORDER BY id",
+     ('2026-01-01', '2026-02-01'), 'idx_solutions_solved_at'),
+    ("SELECT pt.problem_id FROM problem_tags pt JOIN tags t ON t.id = pt.tag_id WHERE t.name = ?",
+     ('логика',), 'idx_problem_tags_tag'),
+    ("SELECT id FROM problems WHERE category = ? AND difficulty = ?",
+     ('Алгебра', 1), 'idx_problems_category'),
+    ("SELECT id FROM problems WHERE difficulty = ?",
+     (1,), 'idx_problems_difficulty'),
+    ("SELECT id, title FROM problems WHERE title_hash = ?",
+     (1,), 'idx_problems_title_hash'),
+    ("DELETE FROM sessions WHERE expires_at < ?",
+     (0,), 'idx_sessions_expires'),
+    ("DELETE FROM sessions WHERE user_id = ?",
+     (1,), 'idx_sessions_user'),
+]
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    # A fresh database built by the real init_database, so every migration runs
+    path = str(tmp_path_factory.mktemp('plans') / 'plans.db')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(database, 'get_connection', lambda: sqlite3.connect(path))
+        database.init_database()
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+def query_plan(conn, query, params):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params)]
+
+def uses_index(step, index):
+    return f'USING INDEX {index} ' in step + ' ' or f'USING COVERING INDEX {index} ' in step + ' '
+
+def test_all_migrations_applied(conn):
+    version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+    assert version == database.MIGRATIONS[-1][0]
+
+@pytest.mark.parametrize('query, params, index', PLANS)
+def test_hot_queries_use_their_index(conn, query, params, index):
+    plan = query_plan(conn, query, params)
+    assert any(uses_index(step, index) for step in plan), plan
+    # A full table scan anywhere in the plan means an index is missing
+    assert not any(step.startswith('SCAN') for step in plan), plan
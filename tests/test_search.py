@@ -0,0 +1,23 @@
+from urllib.parse import quote
+
+from api_handlers import OlympiadHandler
+from db_pool import get_connection
+
+def search(q):
+    handler = OlympiadHandler.__new__(OlympiadHandler)
+    handler.path = '/api/problems/search?q=' + quote(q)
+    return handler.search_problems()
+
+def test_highlights_escape_problem_text():
+    conn = get_connection()
+    conn.execute(
+        "INSERT INTO problems (title, description, answer, difficulty, category) VALUES (?, ?, '1', 1, 'Алгебра')",
+        ('<script>Квазиквадрат</script> & co', 'Если a < b & b < c, найдите квазиквадрат')
+    )
+    conn.commit()
+    conn.close()
+
+    problem = search('квазиквадрат')['problems'][0]
+    assert problem['title_highlight'] == '&lt;script&gt;<mark>Квазиквадрат</mark>&lt;/script&gt; &amp; co'
+    assert problem['snippet'] == 'Если a &lt; b &amp; b &lt; c, найдите <mark>квазиквадрат</mark>'
+    assert problem['title'] == '<script>Квазиквадрат</script> & co'
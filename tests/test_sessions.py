@@ -0,0 +1,22 @@
+import pytest
+
+from db_pool import get_connection
+from sessions import session_store
+
+@pytest.fixture(autouse=True)
+def secret():
+    if session_store.secret is None:
+        session_store.load()
+
+@pytest.mark.parametrize('token', [None, '', 5, ['a.b.c'], {'token': 'x'}, 'not-a-token', 'a.1.bad'])
+def test_malformed_tokens_resolve_to_none(token):
+    assert session_store.resolve(token) is None
+
+def test_created_session_resolves(make_user):
+    user_id = make_user()
+    conn = get_connection()
+    token = session_store.create(conn.cursor(), user_id, 'someone', 'user')
+    conn.commit()
+    conn.close()
+    session = session_store.resolve(token)
+    assert (session.user_id, session.username) == (user_id, 'someone')
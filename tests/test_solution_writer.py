@@ -0,0 +1,77 @@
+import solution_writer
+from db_pool import get_connection
+from solution_writer import AnswerCache, SolutionWriter
+
+class InvalidatingConnection:
+    # Simulates edit_problem committing and invalidating while get() is
+    # between its database read and storing the result
+    def __init__(self, cache, problem_id):
+        self.conn = get_connection()
+        self.cache = cache
+        self.problem_id = problem_id
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params):
+        self.rows = self.conn.execute(query, params)
+
+    def fetchone(self):
+        row = self.rows.fetchone()
+        self.cache.invalidate(self.problem_id)
+        return row
+
+    def close(self):
+        self.conn.close()
+
+def test_answer_read_racing_an_edit_is_not_cached(monkeypatch):
+    cache = AnswerCache()
+    monkeypatch.setattr(solution_writer, 'get_connection', lambda: InvalidatingConnection(cache, 1))
+    assert cache.get(1) is not None
+    assert 1 not in cache.answers
+
+def test_answer_is_cached_without_an_edit():
+    cache = AnswerCache()
+    answer = cache.get(1)
+    assert cache.answers[1] == answer
+
+def test_writer_survives_unexpected_errors(monkeypatch, make_user):
+    good_user = make_user()
+    bad_user = make_user()
+    record_solution = solution_writer.record_solution
+
+    def flaky_record_solution(cursor, user_id, *args):
+        if user_id == bad_user:
+            raise ValueError('unexpected')
+        return record_solution(cursor, user_id, *args)
+
+    monkeypatch.setattr(solution_writer, 'record_solution', flaky_record_solution)
+    monkeypatch.setattr(solution_writer, 'SOLUTION_ACK', 'committed')
+    writer = SolutionWriter()
+    writer.enabled = True
+    writer.start()
+    try:
+        assert writer.submit(bad_user, 1, 'x', False, 5, 1) is False
+        assert writer.submit(good_user, 1, 'x', False, 5, 1) is True
+        assert writer.thread.is_alive()
+    finally:
+        writer.stop()
+    assert writer.failed == 1
+
+def test_writer_fails_waiters_when_a_batch_cannot_be_written(monkeypatch, make_user):
+    user_id = make_user()
+
+    def broken_write_batch(conn, batch):
+        raise RuntimeError('broken')
+
+    monkeypatch.setattr(solution_writer, 'SOLUTION_ACK', 'committed')
+    writer = SolutionWriter()
+    writer.enabled = True
+    monkeypatch.setattr(writer, 'write_batch', broken_write_batch)
+    writer.start()
+    try:
+        assert writer.submit(user_id, 1, 'x', False, 5, 1) is False
+        assert writer.submit(user_id, 1, 'x', False, 5, 1) is False
+        assert writer.thread.is_alive()
+    finally:
+        writer.stop()
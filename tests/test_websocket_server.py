@@ -0,0 +1,151 @@
+import base64
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from db_pool import get_connection
+from sessions import session_store
+from websocket_server import WebSocketServer
+
+class FakeClient:
+    pass
+
+def test_snapshots_are_built_off_the_loop_thread():
+    server = WebSocketServer()
+    server.loop_thread_id = threading.get_ident()
+    server.rooms.subscribe(FakeClient(), 'stats')
+    built = threading.Event()
+    threads = []
+    published = []
+
+    def provider():
+        threads.append(threading.get_ident())
+        built.set()
+        return {'stats': {'users_count': 1}}
+
+    server.topic_providers['stats'] = provider
+    server._publish = lambda topic, message: published.append((topic, message))
+    server.mark_dirty('stats')
+    server.publish_dirty_topics()
+    assert built.wait(5)
+    server.snapshot_executor.shutdown(wait=True)
+    assert threads and threads[0] != server.loop_thread_id
+    assert published == []
+
+    server.run_pending(server.wakeup_r)
+    assert published == [('stats', {'stats': {'users_count': 1}})]
+    assert not server.building_topics
+
+def test_topic_marked_dirty_while_building_is_rebuilt():
+    server = WebSocketServer()
+    server.loop_thread_id = threading.get_ident()
+    server.rooms.subscribe(FakeClient(), 'stats')
+    server.topic_providers['stats'] = lambda: {'stats': {}}
+    server.building_topics.add('stats')
+    server.mark_dirty('stats')
+    server.publish_dirty_topics()
+    assert server.dirty_topics == {'stats'}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+class Client:
+    def __init__(self, port):
+        self.sock = socket.create_connection(('localhost', port), timeout=5)
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((f'GET / HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n'
+                           f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n'
+                           f'Sec-WebSocket-Version: 13\r\n\r\n').encode())
+        self.buffer = b''
+        while b'\r\n\r\n' not in self.buffer:
+            self.buffer += self.sock.recv(1024)
+        self.buffer = self.buffer.split(b'\r\n\r\n', 1)[1]
+
+    def send(self, message):
+        data = json.dumps(message).encode()
+        mask = os.urandom(4)
+        self.sock.sendall(bytes([0x81, 0x80 | len(data)]) + mask
+                          + bytes(b ^ mask[i % 4] for i, b in enumerate(data)))
+
+    def recv(self):
+        while len(self.buffer) < 2 or len(self.buffer) < 2 + (self.buffer[1] & 0x7F):
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise EOFError
+            self.buffer += chunk
+        length = self.buffer[1] & 0x7F
+        opcode, payload = self.buffer[0] & 0x0F, self.buffer[2:2 + length]
+        self.buffer = self.buffer[2 + length:]
+        return opcode, payload
+
+@pytest.fixture
+def live_server():
+    server = WebSocketServer(port=free_port())
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    while not server.running:
+        time.sleep(0.01)
+    yield server, thread
+    server.stop()
+    thread.join(5)
+
+@pytest.mark.parametrize('message', [
+    'hello',
+    [1, 2],
+    {'type': 'subscribe', 'topics': 5},
+    {'type': 'auth', 'token': 5},
+    {'type': 'auth', 'token': [], 'match_id': [1]},
+])
+def test_bad_message_does_not_stop_the_loop(live_server, message):
+    server, thread = live_server
+    bad, good = Client(server.port), Client(server.port)
+    bad.send(message)
+    time.sleep(0.1)
+    assert thread.is_alive()
+
+    good.send({'type': 'subscribe', 'topics': ['stats']})
+    time.sleep(0.1)
+    assert server.rooms.topic_members('stats')
+
+def test_failing_message_closes_its_connection_with_1011(live_server):
+    server, thread = live_server
+    client = Client(server.port)
+    client.send({'type': 'subscribe', 'topics': 5})
+    assert client.recv() == (0x8, (1011).to_bytes(2, 'big'))
+    assert thread.is_alive()
+
+def test_session_cache_miss_is_resolved_off_the_loop(live_server, make_user, monkeypatch):
+    server, thread = live_server
+    if session_store.secret is None:
+        session_store.load()
+    user_id = make_user()
+    conn = get_connection()
+    token = session_store.create(conn.cursor(), user_id, 'reconnecting', 'user')
+    conn.commit()
+    conn.close()
+    # As after a restart: the session is only in the database
+    with session_store.lock:
+        session_store.cache.clear()
+        session_store.by_user.clear()
+
+    fetch = session_store.fetch
+    threads = []
+
+    def recording_fetch(session_id):
+        threads.append(threading.get_ident())
+        return fetch(session_id)
+
+    monkeypatch.setattr(session_store, 'fetch', recording_fetch)
+    client = Client(server.port)
+    client.send({'type': 'auth', 'token': token, 'match_id': 7})
+    time.sleep(0.2)
+
+    assert threads and threads[0] != server.loop_thread_id
+    assert server.rooms.user_clients((user_id,))
+    assert len(server.rooms.members(7)) == 1